@@ -4,7 +4,7 @@ from pathlib import Path
 from pydantic import AnyHttpUrl, SecretStr, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from app.utils.config_utils import EnvironmentType
+from app.utils.config_utils import EnvironmentType, PartitionInterval, XMLParserBackend
 
 
 class Settings(BaseSettings):
@@ -25,17 +25,44 @@ class Settings(BaseSettings):
     ES_USER: str = "elastic"
     ES_PASSWORD: SecretStr = SecretStr("elastic")
     ES_INDEX: str = "apple_health_data"
+    ES_PARTITION_INTERVAL: PartitionInterval = PartitionInterval.YEAR
+    ES_BULK_CHUNK_SIZE: int = 500
+    ES_BULK_MAX_CHUNK_MB: int = 10
+    ES_BULK_THREADS: int = 2
+    ES_BULK_MAX_RETRIES: int = 5
+    ES_BULK_INITIAL_BACKOFF: float = 2.0
+    ES_BULK_MAX_BACKOFF: float = 60.0
+    ES_POOL_CONNECTIONS: int = 10
+    ES_KEEPALIVE_SECONDS: float = 60.0
+    ES_REQUEST_TIMEOUT: float = 30.0
+    ES_PIT_KEEP_ALIVE: str = "5m"
 
     CH_DIRNAME: str = "applehealth.chdb"
     CH_DB_NAME: str = "applehealth"
     CH_TABLE_NAME: str = "data"
 
     DUCKDB_FILENAME: str = "applehealth.duckdb"
+    DUCKDB_ROW_GROUP_SIZE: int = 32_768
+    PARQUET_ROW_GROUP_SIZE: int = 65_536
+    PARQUET_COMPRESSION: str = "zstd"
+    PARQUET_COMPRESSION_LEVEL: int | None = None
+    PARQUET_WRITE_STATISTICS: bool = True
+    PARQUET_BLOOM_FILTER_COLUMNS: list[str] = ["textValue", "sourceName"]
+    PARQUET_BLOOM_FILTER_NDV: int = 1024
+    PARQUET_BLOOM_FILTER_FPP: float = 0.05
+    PARQUET_WRITE_PAGE_INDEX: bool = False
 
     CHUNK_SIZE: int = 50_000
+    IMPORT_MEMORY_BUDGET_MB: int = 256
+    IMPORT_QUEUE_DEPTH: int = 4
+    IMPORT_LOOKBACK_DAYS: int = 7
+    IMPORT_CHECKPOINT_MB: int = 64
+    IMPORT_SINKS: list[str] = ["duckdb"]
 
     RAW_XML_PATH: str = "raw.xml"
+    RAW_XML_ZIP_MEMBER: str | None = None
     XML_SAMPLE_SIZE: int = 1000
+    XML_PARSER_BACKEND: XMLParserBackend = XMLParserBackend.ETREE
 
     @field_validator("BACKEND_CORS_ORIGINS", mode="after")
     @classmethod
@@ -18,8 +18,9 @@ duckdb_reader_router = FastMCP(name="DuckDB Reader MCP")
 def get_health_summary_duckdb() -> list[dict[str, Any]]:
     """
     Get a summary of Apple Health data from DuckDB.
-    The function returns total record count, record type breakdown, and
-     (optionally) a date range aggregation.
+    The function returns, for every record and workout type, the row count,
+    first start and last end date, sources, units and value range
+    (duration for workouts).
 
     Notes for LLM:
     - IMPORTANT - Do not guess, autofill, or assume any missing data.
@@ -151,7 +152,7 @@ def get_trend_data_duckdb(
 
     Returns:
     - record_type: The analyzed record type
-    - device: The device on which the data was recorded
+    - sourceName, unit: The source that recorded the data and the unit of its values
     - interval: The time interval used
     - trend_data: List of time buckets with statistics for each period:
       * date: The time period (ISO string)
@@ -7,6 +7,8 @@ from app.services.health.elasticsearch import (
     get_health_summary_from_es,
     get_statistics_by_type_logic,
     get_trend_data_logic,
+    page_health_records_logic,
+    page_values_logic,
     search_health_records_logic,
     search_values_logic,
 )
@@ -15,7 +17,7 @@ es_reader_router = FastMCP(name="ES Reader MCP")
 
 
 @es_reader_router.tool
-def get_health_summary_es() -> dict[str, Any]:
+async def get_health_summary_es() -> dict[str, Any]:
     """
     Get a summary of Apple Health data from Elasticsearch.
     The function returns total record count, record type breakdown, and
@@ -34,13 +36,13 @@ def get_health_summary_es() -> dict[str, Any]:
       you can use the tools from this database without the user specifying it.
     """
     try:
-        return get_health_summary_from_es()
+        return await get_health_summary_from_es()
     except Exception as e:
         return {"error": f"Failed to get health summary: {str(e)}"}
 
 
 @es_reader_router.tool
-def search_health_records_es(params: HealthRecordSearchParams) -> list[dict[str, Any]]:
+async def search_health_records_es(params: HealthRecordSearchParams) -> list[dict[str, Any]]:
     """
     Search health records in Elasticsearch with flexible query building.
 
@@ -48,10 +50,12 @@ def search_health_records_es(params: HealthRecordSearchParams) -> list[dict[str,
     - params: HealthRecordSearchParams object containing all search/filter parameters.
 
     Notes for LLMs:
-    - This function should return a list of health record documents (dicts)
-      matching the search criteria.
-    - Each document in the list should represent a single health record as stored in Elasticsearch.
-    - If an error occurs, the function should return a list with a single dict
+    - This function returns a list of health record documents (dicts)
+      matching the search criteria, at most params.limit of them.
+    - Each document in the list represents a single health record as stored in Elasticsearch.
+    - To go through more records than fit in one response, use
+      search_health_records_page_es instead of raising the limit.
+    - If an error occurs, the function returns a list with a single dict
       containing an 'error' key and the error message.
     - Use this to retrieve structured health data for further analysis, filtering, or display.
     - Example source_name: "Rob’s iPhone", "Polar Flow", "Sync Solver".
@@ -69,13 +73,57 @@ def search_health_records_es(params: HealthRecordSearchParams) -> list[dict[str,
       you can use the tools from this database without the user specifying it.
     """
     try:
-        return search_health_records_logic(params)
+        return await search_health_records_logic(params)
     except Exception as e:
         return [{"error": f"Failed to search health records: {str(e)}"}]
 
 
 @es_reader_router.tool
-def get_statistics_by_type_es(record_type: RecordType | str) -> dict[str, Any]:
+async def search_health_records_page_es(
+    params: HealthRecordSearchParams,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    """
+    Search health records in Elasticsearch one page at a time.
+
+    Parameters:
+    - params: HealthRecordSearchParams object containing all search/filter parameters.
+      params.limit is the number of records per page.
+    - cursor: next_cursor of the previous page, leave it out for the first page.
+
+    Returns:
+    - records: health record documents (dicts) matching the search criteria, newest first
+    - next_cursor: pass it with the same params to get the next page,
+      None when there are no more records
+
+    Notes for LLMs:
+    - Takes the same params as search_health_records_es, use it to go through
+      many records (e.g. months of heart rate samples): request pages
+      of a few hundred records and follow next_cursor instead of raising the limit.
+    - Later pages see the records as they were when the first page was requested.
+    - A cursor stays valid for a few minutes after each page, if it expired
+      search again without it.
+    - If an error occurs, the function returns a dict containing an 'error' key
+      and the error message.
+    - IMPORTANT - Do not guess, autofill, or assume any missing data.
+    - If there are multiple databases available (DuckDB, ClickHouse, Elasticsearch):
+      first, ask the user which one he wants to use. DO NOT call any tools before
+      the user specifies his intent.
+    - If the user decides on an option, only use tools from this database,
+      do not switch over to another until the user specifies that he wants
+      to use a different one. You do not have to keep asking whether
+      the user wants to use the same database that he used before.
+    - If there is only one database available (DuckDB, ClickHouse, Elasticsearch):
+      you can use the tools from this database without the user specifying it.
+    """
+    try:
+        return await page_health_records_logic(params, cursor)
+    except Exception as e:
+        return {"error": f"Failed to search health records: {str(e)}"}
+
+
+@es_reader_router.tool
+async def get_statistics_by_type_es(record_type: RecordType | str) -> dict[str, Any]:
     """
     Get comprehensive statistics for a specific health record type from Elasticsearch.
 
@@ -119,13 +167,13 @@ def get_statistics_by_type_es(record_type: RecordType | str) -> dict[str, Any]:
       you can use the tools from this database without the user specifying it.
     """
     try:
-        return get_statistics_by_type_logic(record_type)
+        return await get_statistics_by_type_logic(record_type)
     except Exception as e:
         return {"error": f"Failed to get statistics: {str(e)}"}
 
 
 @es_reader_router.tool
-def get_trend_data_es(
+async def get_trend_data_es(
     record_type: RecordType | str,
     interval: IntervalType = "month",
     date_from: str | None = None,
@@ -177,17 +225,18 @@ def get_trend_data_es(
       you can use the tools from this database without the user specifying it.
     """
     try:
-        return get_trend_data_logic(record_type, interval, date_from, date_to)
+        return await get_trend_data_logic(record_type, interval, date_from, date_to)
     except Exception as e:
         return {"error": f"Failed to get trend data: {str(e)}"}
 
 
 @es_reader_router.tool
-def search_values_es(
+async def search_values_es(
     record_type: RecordType | str | None,
     value: str,
     date_from: str | None = None,
     date_to: str | None = None,
+    limit: int = 10,
 ) -> list[dict[str, Any]]:
     """
     Search for records with exactly matching values (including text) using Elasticsearch.
@@ -196,6 +245,7 @@ def search_values_es(
     - record_type: The type of health record to analyze (e.g., "HKQuantityTypeIdentifierStepCount")
     - value: Value to search for in the data
     - date_from, date_to: Optional ISO8601 date strings for filtering date range
+    - limit: Maximum number of records to return
 
     Notes for LLMs:
     - Use this to search for specific values (for example statistical outliers) in health data
@@ -203,6 +253,7 @@ def search_values_es(
       you can search for "HKCategoryTypeIdentifierSleepAnalysis"
       records with the value of "HKCategoryValueSleepAnalysisAsleepDeep"
     - The function automatically handles date filtering if date_from/date_to are provided
+    - To go through more matches than fit in one response, use search_values_page_es
     - Do not guess, autofill, or assume any missing data.
     - If there are multiple databases available (DuckDB, ClickHouse, Elasticsearch):
       first, ask the user which one he wants to use. DO NOT call any tools before
@@ -215,6 +266,50 @@ def search_values_es(
       you can use the tools from this database without the user specifying it.
     """
     try:
-        return search_values_logic(record_type, value, date_from, date_to)
+        return await search_values_logic(record_type, value, date_from, date_to, limit)
     except Exception as e:
         return [{"error": f"Failed to search for values: {str(e)}"}]
+
+
+@es_reader_router.tool
+async def search_values_page_es(
+    record_type: RecordType | str | None,
+    value: str,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    limit: int = 10,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    """
+    Search for records with exactly matching values in Elasticsearch one page at a time.
+
+    Parameters:
+    - record_type, value, date_from, date_to: the same as in search_values_es
+    - limit: Number of records per page
+    - cursor: next_cursor of the previous page, leave it out for the first page
+
+    Returns:
+    - records: matching records, newest first
+    - next_cursor: pass it with the same arguments to get the next page,
+      None when there are no more records
+
+    Notes for LLMs:
+    - A cursor stays valid for a few minutes after each page, if it expired
+      search again without it.
+    - If an error occurs, the function returns a dict containing an 'error' key
+      and the error message.
+    - Do not guess, autofill, or assume any missing data.
+    - If there are multiple databases available (DuckDB, ClickHouse, Elasticsearch):
+      first, ask the user which one he wants to use. DO NOT call any tools before
+      the user specifies his intent.
+    - If the user decides on an option, only use tools from this database,
+      do not switch over to another until the user specifies that he wants
+      to use a different one. You do not have to keep asking whether
+      the user wants to use the same database that he used before.
+    - If there is only one database available (DuckDB, ClickHouse, Elasticsearch):
+      you can use the tools from this database without the user specifying it.
+    """
+    try:
+        return await page_values_logic(record_type, value, date_from, date_to, limit, cursor)
+    except Exception as e:
+        return {"error": f"Failed to search for values: {str(e)}"}
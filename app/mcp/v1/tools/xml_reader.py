@@ -16,7 +16,8 @@ def get_xml_structure() -> dict[str, Any]:
 
     Returns:
     - file_size_mb: Size of the file in megabytes
-    - root_elements: List of unique root-level XML tags
+    - root_elements: List of unique root-level XML tags, only Record and Workout
+      when the file was summarised by an importer
     - record_types: List of unique health record types (see RecordType for
       most frequent types, but may include others)
     - workout_types: List of unique workout types
@@ -3,6 +3,7 @@ from pathlib import Path
 from typing import Any
 
 import duckdb
+import numpy as np
 from duckdb import DuckDBPyRelation
 
 from app.config import settings
@@ -29,6 +30,13 @@ class DuckDBClient:
         response: DuckDBPyRelation | list[DuckDBPyRelation],
     ) -> list[dict[str, Any]]:
         if isinstance(response, DuckDBPyRelation):
-            return response.df().to_dict(orient="records")
-        records = [record.df().to_dict(orient="records") for record in response]
-        return sum(records, [])
+            response = [response]
+        return [
+            {
+                # LIST columns come back as numpy arrays, which tools cannot serialize
+                column: value.tolist() if isinstance(value, np.ndarray) else value
+                for column, value in record.items()
+            }
+            for relation in response
+            for record in relation.df().to_dict(orient="records")
+        ]
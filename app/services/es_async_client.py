@@ -0,0 +1,58 @@
+import httpx
+from elastic_transport import HttpxAsyncHttpNode, NodeConfig
+from elasticsearch import AsyncElasticsearch
+
+from app.config import settings
+
+
+class KeepAliveHttpxNode(HttpxAsyncHttpNode):
+    """
+    httpx node whose pool keeps its idle connections open for ES_KEEPALIVE_SECONDS,
+    instead of httpx's default of five seconds.
+    httpx only takes the expiry when a client is built, so the client of the base node
+    is replaced by one with the same base URL, pool size and timeout.
+    AsyncESClient connects over plain HTTP, TLS settings would not carry over.
+    """
+
+    def __init__(self, config: NodeConfig):
+        if config.scheme != "http":
+            raise ValueError(f"{type(self).__name__} only connects over plain HTTP")
+        super().__init__(config)
+        # it has not opened a connection yet, it is closed with the node
+        self.base_client = self.client
+        self.client = httpx.AsyncClient(
+            base_url=self.base_client.base_url,
+            limits=httpx.Limits(
+                max_connections=config.connections_per_node,
+                keepalive_expiry=settings.ES_KEEPALIVE_SECONDS,
+            ),
+            verify=False,
+            timeout=self.base_client.timeout,
+        )
+
+    async def close(self) -> None:
+        await self.base_client.aclose()
+        await super().close()
+
+
+class AsyncESClient:
+    """
+    Non-blocking client of the MCP tools, concurrent tool calls share a pool
+    of ES_POOL_CONNECTIONS connections and each request gives up after ES_REQUEST_TIMEOUT
+    """
+
+    def __init__(self):
+        self.host = settings.ES_HOST
+        self.port = settings.ES_PORT
+        self.index = settings.ES_INDEX
+        self.user = settings.ES_USER
+        self.password = settings.ES_PASSWORD
+        self.engine = AsyncElasticsearch(
+            [{"host": self.host, "port": self.port, "scheme": "http"}],
+            basic_auth=(self.user, self.password.get_secret_value())
+            if self.user and self.password
+            else None,
+            node_class=KeepAliveHttpxNode,
+            connections_per_node=settings.ES_POOL_CONNECTIONS,
+            request_timeout=settings.ES_REQUEST_TIMEOUT,
+        )
@@ -2,13 +2,58 @@ from typing import Any
 
 from app.schemas.record import HealthRecordSearchParams, IntervalType, RecordType
 from app.services.ch_client import CHClient
-from app.services.health.sql_helpers import fill_query
+from app.services.health.sql_helpers import (
+    ROLLUP_TABLE,
+    SUMMARY_TABLE,
+    day_end,
+    fill_query,
+    rollup_bounds,
+    rollup_grain,
+)
 
 ch = CHClient()
 
 
+def summary_is_fresh() -> bool:
+    """
+    The importers rewrite the summary after every import,
+    it is stale when the records table changed since
+    """
+    summary = f"{ch.db_name}.{SUMMARY_TABLE}"
+    if ch.inquire(f"EXISTS TABLE {summary}")["data"][0]["result"] != 1:
+        return False
+    response = ch.inquire(f"""
+        SELECT (SELECT sum(count) FROM {summary} WHERE table = 'records')
+        = (SELECT count() FROM {ch.db_name}.{ch.table_name}) AS fresh
+    """)
+    return response["data"][0]["fresh"] == 1
+
+
+def has_rollup() -> bool:
+    """
+    Databases imported before rollups existed are queried from raw records only
+    """
+    return ch.inquire(f"EXISTS TABLE {ch.db_name}.{ROLLUP_TABLE}")["data"][0]["result"] == 1
+
+
 def get_health_summary_from_ch() -> dict[str, Any]:
-    return ch.inquire(f"SELECT type, COUNT(*) FROM {ch.db_name}.{ch.table_name} GROUP BY type")
+    """
+    Rows, dates, sources, units and value range of every record type,
+    read from the import summary unless it is missing or stale
+    """
+    if summary_is_fresh():
+        return ch.inquire(f"""
+            SELECT type, count, start_date, end_date, sources, units,
+            value_min, value_max FROM {ch.db_name}.{SUMMARY_TABLE}
+            WHERE table = 'records' ORDER BY count DESC
+        """)
+    return ch.inquire(f"""
+        SELECT type, COUNT() AS count, min(startDate) AS start_date, max(endDate) AS end_date,
+        arraySort(arrayFilter(name -> name != '', groupUniqArray(sourceName))) AS sources,
+        arraySort(arrayFilter(name -> name != '', groupUniqArray(unit))) AS units,
+        min(value) AS value_min, max(value) AS value_max
+        FROM {ch.db_name}.{ch.table_name} GROUP BY type ORDER BY count DESC
+    """)
 
 
 def search_health_records_from_ch(params: HealthRecordSearchParams) -> dict[str, Any]:
@@ -31,14 +76,38 @@ def get_trend_data_from_ch(
     date_from: str | None = None,
     date_to: str | None = None,
 ) -> dict[str, Any]:
+    bounds = rollup_bounds(date_from, date_to)
+    if bounds is not None and has_rollup():
+        return get_rollup_trend_from_ch(record_type, interval, bounds)
     return ch.inquire(f"""
-        SELECT device, toStartOfInterval(startDate, INTERVAL 1 {interval}) AS interval,
+        SELECT type, sourceName, toStartOfInterval(startDate, INTERVAL 1 {interval}) AS interval,
         AVG(value) AS average, SUM(value) AS sum, MIN(value) AS min,
-        MAX(value) AS max, COUNT(*) AS count FROM {ch.db_name}.{ch.table_name}
+        MAX(value) AS max, COUNT(*) AS count, unit FROM {ch.db_name}.{ch.table_name}
         WHERE type = '{record_type}'
         {f"AND startDate >= '{date_from}'" if date_from else ""}
-        {f"AND startDate <= '{date_to}'" if date_to else ""}
-        GROUP BY interval, device ORDER BY interval ASC
+        {f"AND startDate <= '{day_end(date_to)}'" if date_to else ""}
+        GROUP BY interval, type, sourceName, unit ORDER BY interval ASC
+    """)
+
+
+def get_rollup_trend_from_ch(
+    record_type: RecordType | str,
+    interval: IntervalType,
+    bounds: tuple[str | None, str | None],
+) -> dict[str, Any]:
+    """
+    Same result as the raw records trend, aggregated from the import-time rollups
+    """
+    day_from, day_to = bounds
+    return ch.inquire(f"""
+        SELECT type, sourceName, toStartOfInterval(period, INTERVAL 1 {interval}) AS interval,
+        sum(value_sum) / sum(sample_count) AS average, sum(value_sum) AS sum,
+        min(value_min) AS min, max(value_max) AS max, sum(sample_count) AS count,
+        unit FROM {ch.db_name}.{ROLLUP_TABLE}
+        WHERE grain = '{rollup_grain(interval, bounds)}' AND type = '{record_type}'
+        {f"AND period >= '{day_from}'" if day_from else ""}
+        {f"AND period <= '{day_to}'" if day_to else ""}
+        GROUP BY interval, type, sourceName, unit ORDER BY interval ASC
     """)
 
 
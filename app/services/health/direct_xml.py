@@ -1,56 +1,75 @@
 import xml.etree.ElementTree as ET
+from collections.abc import Mapping
 from pathlib import Path
 from typing import Any, Iterator
 from xml.etree.ElementTree import Element
 
 from app.config import settings
+from app.services.health.import_summary import file_fingerprint, load_fresh_sidecar
+from app.services.xml_backends import XMLElement, get_backend, source_size
 
 
 def get_xml_path() -> Path:
     return Path(settings.RAW_XML_PATH)
 
 
-def stream_xml_elements(tag: str | list[str] | None = None) -> Iterator[Element]:
-    xml_path = get_xml_path()
-    context = ET.iterparse(xml_path, events=("start",))
-    for _, elem in context:
-        if (
-            tag is None
-            or (isinstance(tag, str) and elem.tag == tag)
-            or (isinstance(tag, (list, tuple)) and elem.tag in tag)
-        ):
-            yield elem
-        elem.clear()
+def stream_xml_attributes(tag: str | list[str] | None = None) -> Iterator[XMLElement]:
+    """
+    Streams (tag, attributes) pairs through the configured XML parser backend
+    """
+    tags = [tag] if isinstance(tag, str) else tag
+    return get_backend().iter_elements(get_xml_path(), tags)
+
 
+def extract_record_type(tag: str, attrib: Mapping[str, str]) -> str | None:
+    return attrib.get("type") if tag == "Record" else None
 
-def extract_record_type(elem: Element) -> str | None:
-    return elem.get("type") if elem.tag == "Record" else None
 
+def extract_workout_type(tag: str, attrib: Mapping[str, str]) -> str | None:
+    return attrib.get("workoutActivityType") if tag == "Workout" else None
 
-def extract_workout_type(elem: Element) -> str | None:
-    return elem.get("workoutActivityType") if elem.tag == "Workout" else None
 
+def extract_source(tag: str, attrib: Mapping[str, str]) -> str | None:
+    return attrib.get("sourceName") if tag == "Record" else None
 
-def extract_source(elem: Element) -> str | None:
-    return elem.get("sourceName") if elem.tag == "Record" else None
+
+def to_xml_string(tag: str, attrib: Mapping[str, str]) -> str:
+    return ET.tostring(Element(tag, dict(attrib)), encoding="unicode", method="xml")
 
 
 def analyze_xml_structure() -> dict[str, Any]:
+    """
+    Element, record and workout types and record sources of the XML file.
+    An import summary saved next to the unchanged file answers without reading it,
+    its root_elements only name the imported elements.
+    """
     xml_path = get_xml_path()
+    file_size_mb = round(source_size(xml_path) / (1024 * 1024), 2)
+    summary = load_fresh_sidecar(xml_path, file_fingerprint(xml_path))
+    if summary is not None:
+        tables = {"Record": "records", "Workout": "workouts"}
+        return {
+            "file_size_mb": file_size_mb,
+            "root_elements": [tag for tag, table in tables.items() if summary.types[table]],
+            "record_types": list(summary.types["records"]),
+            "workout_types": list(summary.types["workouts"]),
+            "sources": summary.sources(),
+        }
+
     structure = {
-        "file_size_mb": round(xml_path.stat().st_size / (1024 * 1024), 2),
+        "file_size_mb": file_size_mb,
         "root_elements": set(),
         "record_types": set(),
         "workout_types": set(),
         "sources": set(),
     }
-    for elem in stream_xml_elements():
-        structure["root_elements"].add(elem.tag)
-        if rt := extract_record_type(elem):
+    for tag, attrib in stream_xml_attributes():
+        structure["root_elements"].add(tag)
+        if rt := extract_record_type(tag, attrib):
             structure["record_types"].add(rt)
-        if wt := extract_workout_type(elem):
+        if wt := extract_workout_type(tag, attrib):
             structure["workout_types"].add(wt)
-        if src := extract_source(elem):
+        if src := extract_source(tag, attrib):
             structure["sources"].add(src)
     # Convert sets to lists
     for k in ["root_elements", "record_types", "workout_types", "sources"]:
@@ -61,11 +80,10 @@ def analyze_xml_structure() -> dict[str, Any]:
 def search_xml(query: str = "", max_results: int = 50) -> str:
     results = []
     query_lower = query.lower()
-    for elem in stream_xml_elements(["Record", "Workout"]):
-        matches = any(value and query_lower in value.lower() for value in elem.attrib.values())
+    for tag, attrib in stream_xml_attributes(["Record", "Workout"]):
+        matches = any(value and query_lower in value.lower() for value in attrib.values())
         if matches:
-            elem_str = ET.tostring(elem, encoding="unicode", method="xml")
-            results.append(elem_str)
+            results.append(to_xml_string(tag, attrib))
             if len(results) >= max_results:
                 break
     if not results:
@@ -78,10 +96,9 @@ def search_xml(query: str = "", max_results: int = 50) -> str:
 
 def get_records_by_type(record_type: str = "", limit: int = 20) -> str:
     results = []
-    for elem in stream_xml_elements("Record"):
-        if extract_record_type(elem) == record_type:
-            elem_str = ET.tostring(elem, encoding="unicode", method="xml")
-            results.append(elem_str)
+    for tag, attrib in stream_xml_attributes("Record"):
+        if extract_record_type(tag, attrib) == record_type:
+            results.append(to_xml_string(tag, attrib))
             if len(results) >= limit:
                 break
     if not results:
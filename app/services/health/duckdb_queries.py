@@ -10,36 +10,94 @@ from app.schemas.record import (
     WorkoutType,
 )
 from app.services.duckdb_client import DuckDBClient
+from app.services.health.import_summary import SUMMARY_TABLES
 from app.services.health.sql_helpers import (
+    ROLLUP_TABLE,
+    SUMMARY_TABLE,
+    day_end,
+    enum_literal,
+    enum_name,
     fill_query,
     get_table,
-    join_query,
     join_string,
+    rollup_bounds,
+    rollup_grain,
+    summary_columns,
     value_aggregates,
 )
 
 client = DuckDBClient()
 con = duckdb.connect(client.path, read_only=True)
+# databases imported before rollups existed are queried from raw records only
+has_rollup: bool = bool(
+    con.execute("SELECT 1 FROM duckdb_tables() WHERE table_name = ?", [ROLLUP_TABLE]).fetchall(),
+)
+# databases imported before summaries existed are aggregated by get_health_summary
+has_summary: bool = bool(
+    con.execute("SELECT 1 FROM duckdb_tables() WHERE table_name = ?", [SUMMARY_TABLE]).fetchall(),
+)
 
+# databases imported before the dictionary columns were ENUMs compare them as strings
+has_enums: bool = bool(
+    con.execute(
+        "SELECT 1 FROM duckdb_types() WHERE type_name = ? AND logical_type = 'ENUM'",
+        [enum_name("records", "type")],
+    ).fetchall(),
+)
 
-def get_health_summary_from_duckdb() -> list[dict[str, Any]]:
-    records = con.sql(
-        """SELECT type, COUNT(*) AS count FROM records
-        GROUP BY type ORDER BY count DESC""",
-    )
-    workouts = con.sql(
-        f"""SELECT workouts.type, COUNT(*) AS count FROM workouts {join_query}
-        GROUP BY workouts.type ORDER BY count DESC""",
-    )
 
-    return client.format_response([records, workouts])
+def type_literal(table: str, record_type: str) -> str:
+    if has_enums:
+        return enum_literal(table, "type", record_type)
+    return f"'{record_type}'"
+
+
+def summary_is_fresh() -> bool:
+    """
+    The summary is written with the tables it describes,
+    it is stale once rows were added to or removed from them
+    """
+    if not has_summary:
+        return False
+    for table in SUMMARY_TABLES:
+        counts = con.execute(
+            f"""SELECT (SELECT coalesce(sum(count), 0) FROM {SUMMARY_TABLE} WHERE "table" = ?),
+            (SELECT count(*) FROM {table})""",
+            [table],
+        ).fetchall()
+        summarised, rows = counts[0]
+        if summarised != rows:
+            return False
+    return True
+
+
+def get_health_summary_from_duckdb() -> list[dict[str, Any]]:
+    """
+    Rows, dates, sources, units and value range of every record and workout type,
+    read from the import summary unless it is missing or stale
+    """
+    if summary_is_fresh():
+        results = [
+            con.sql(f"""SELECT type, count, start_date, end_date, sources, units,
+            value_min, value_max FROM {SUMMARY_TABLE} WHERE "table" = '{table}'
+            ORDER BY count DESC""")
+            for table in SUMMARY_TABLES
+        ]
+        return client.format_response(results)
+
+    results = [
+        con.sql(f"""SELECT type, {summary_columns(table)} FROM {table}
+        GROUP BY type ORDER BY count DESC""")
+        for table in SUMMARY_TABLES
+    ]
+    return client.format_response(results)
 
 
 def search_health_records_from_duckdb(
     params: HealthRecordSearchParams,
 ) -> list[dict[str, Any]]:
     query: str = "SELECT * FROM"
-    query += fill_query(params)
+    query += fill_query(params, enum_types=has_enums)
     response = con.sql(query)
     return client.format_response(response)
 
@@ -59,7 +117,8 @@ def get_statistics_by_type_from_duckdb(
                     SELECT {table}.type, {complimentary_table}.type AS stat_type, COUNT(*) AS count,
                     AVG({value}) AS average, SUM({value}) AS sum, MIN({value}) AS min,
                     MAX({value}) AS max, unit FROM {table} {join_clause}
-                    WHERE {table}.type = '{record_type}' GROUP BY {table}.type,
+                    WHERE {table}.type = {type_literal(table, record_type)}
+                    GROUP BY {table}.type,
                     {complimentary_table}.type, unit
                     """),
         )
@@ -73,6 +132,12 @@ def get_trend_data_from_duckdb(
     date_to: str | None = None,
 ) -> list[dict[str, Any]]:
     table = get_table(record_type)
+    bounds = rollup_bounds(date_from, date_to)
+    if table == "records" and has_rollup and bounds is not None:
+        return client.format_response(
+            get_rollup_trend_from_duckdb(record_type, interval, bounds),
+        )
+
     join_clause = join_string(table)
     values = value_aggregates(table)
     results = []
@@ -85,15 +150,37 @@ def get_trend_data_from_duckdb(
             AVG({value}) AS average, SUM({value}) AS sum,
             MIN({value}) AS min, MAX({value}) AS max, COUNT(*) AS count,
             unit FROM {table} {join_clause}
-            WHERE {table}.type = '{record_type}'
+            WHERE {table}.type = {type_literal(table, record_type)}
             {f"AND {table}.startDate >= '{date_from}'" if date_from else ""}
-            {f"AND {table}.startDate <= '{date_to}'" if date_to else ""}
+            {f"AND {table}.startDate <= '{day_end(date_to)}'" if date_to else ""}
             GROUP BY interval, {table}.type, sourceName, unit ORDER BY interval ASC
         """),
         )
     return client.format_response(results)
 
 
+def get_rollup_trend_from_duckdb(
+    record_type: RecordType | str,
+    interval: IntervalType,
+    bounds: tuple[str | None, str | None],
+) -> duckdb.DuckDBPyRelation:
+    """
+    Same result as the raw records trend, aggregated from the import-time rollups
+    """
+    day_from, day_to = bounds
+    return con.sql(f"""
+        SELECT type, sourceName, time_bucket(INTERVAL '1 {interval}', period) AS interval,
+        sum(value_sum) / sum(sample_count) AS average, sum(value_sum) AS sum,
+        min(value_min) AS min, max(value_max) AS max, sum(sample_count)::BIGINT AS count,
+        unit FROM {ROLLUP_TABLE}
+        WHERE grain = '{rollup_grain(interval, bounds)}'
+        AND type = {type_literal("records", record_type)}
+        {f"AND period >= '{day_from}'" if day_from else ""}
+        {f"AND period <= '{day_to}'" if day_to else ""}
+        GROUP BY interval, type, sourceName, unit ORDER BY interval ASC
+    """)
+
+
 def search_values_from_duckdb(
     record_type: RecordType | WorkoutType | str | None,
     value: str,
@@ -105,7 +192,7 @@ def search_values_from_duckdb(
 
     result = con.sql(f"""
         SELECT * FROM {table} {join_clause} WHERE textValue = '{value}'
-        {f"AND {table}.type = '{record_type}'" if record_type else ""}
+        {f"AND {table}.type = {type_literal(table, record_type)}" if record_type else ""}
         {f"AND startDate >= '{date_from}'" if date_from else ""}
         {f"AND startDate <= '{date_to}'" if date_to else ""}
         ORDER BY startDate DESC
@@ -1,38 +1,131 @@
+from collections.abc import Sequence
 from typing import Any
 
+from elasticsearch import NotFoundError
+
 from app.config import settings
 from app.schemas.record import HealthRecordSearchParams, IntervalType, RecordType
-from app.services.es_client import ESClient
+from app.services.es_async_client import AsyncESClient
+from app.services.health.es_helpers import (
+    SUMMARY_DOCUMENT_ID,
+    date_filter,
+    decode_cursor,
+    encode_cursor,
+    filter_query,
+    fresh_summary,
+    overlapping_partitions,
+    page_query,
+    range_filter,
+    record_filters,
+    rollup_alias,
+    rollup_days,
+    summary_alias,
+    term_filter,
+    type_filter,
+)
+
+es_client = AsyncESClient()
 
-es_client = ESClient()
 
+async def _search_target(date_from: str | None = None, date_to: str | None = None) -> str:
+    """
+    The indices behind the alias whose period overlaps the dates,
+    the alias itself when the dates do not rule out any of them
+    """
+    if not date_from and not date_to:
+        return settings.ES_INDEX
+    try:
+        indices = await es_client.engine.indices.get_alias(name=settings.ES_INDEX)
+    except NotFoundError:
+        # an index imported before the partitioning, not an alias
+        return settings.ES_INDEX
+    overlapping = overlapping_partitions(settings.ES_INDEX, indices, date_from, date_to)
+    return ",".join(overlapping) if overlapping else settings.ES_INDEX
 
-def _build_match_condition(field: str, value: Any) -> dict:
-    return {"match": {field: value}}
 
+async def _run_es_query(query: dict, index: str | None = None) -> Any:
+    # aggregation-only queries are answered from the shard request cache when repeated
+    request_cache = True if query.get("size") == 0 else None
+    return await es_client.engine.search(
+        index=index or settings.ES_INDEX,
+        body=query,
+        request_cache=request_cache,
+    )
 
-def _build_range_condition(field: str, gte: Any = None, lte: Any = None) -> dict:
-    cond = {}
-    if gte is not None:
-        cond["gte"] = gte
-    if lte is not None:
-        cond["lte"] = lte
-    return {"range": {field: cond}} if cond else {}
 
+async def _search_page(
+    filters: Sequence[dict[str, Any] | None],
+    size: int,
+    cursor: str | None,
+    index: str,
+) -> dict[str, Any]:
+    """
+    Returns one page of hits and the cursor of the next one, which is None after the last page.
+    The first page opens a point in time, so later pages see the index as it was
+    even while an import writes to it, and the last page closes it.
+    """
+    if cursor:
+        pit_id, search_after = decode_cursor(cursor)
+    else:
+        opened = await es_client.engine.open_point_in_time(
+            index=index,
+            keep_alive=settings.ES_PIT_KEEP_ALIVE,
+        )
+        pit_id, search_after = opened["id"], None
+    pit = {"id": pit_id, "keep_alive": settings.ES_PIT_KEEP_ALIVE}
+    try:
+        response = await es_client.engine.search(
+            body=page_query(filters, size, pit, search_after),
+        )
+    except NotFoundError as e:
+        if cursor:
+            raise ValueError(
+                f"The cursor expired after {settings.ES_PIT_KEEP_ALIVE} without a request, "
+                "search again without it",
+            ) from e
+        raise
+    hits = response["hits"]["hits"]
+    # the id of a point in time can change between requests
+    pit_id = response.get("pit_id", pit_id)
+    next_cursor = None
+    if hits and len(hits) == size:
+        next_cursor = encode_cursor(pit_id, hits[-1]["sort"])
+    else:
+        await es_client.engine.close_point_in_time(id=pit_id)
+    return {"records": [hit["_source"] for hit in hits], "next_cursor": next_cursor}
 
-def _run_es_query(query: dict) -> Any:
-    return es_client.engine.search(index=settings.ES_INDEX, body=query)
 
+async def get_health_summary_from_es() -> dict[str, Any]:
+    """
+    Answered from the summary the importer stores next to the indices of an import
+    while the alias holds as many documents as it was written for,
+    otherwise aggregated by Elasticsearch
+    """
+    documents = (await es_client.engine.count(index=settings.ES_INDEX))["count"]
+    try:
+        response = await es_client.engine.get(
+            index=summary_alias(settings.ES_INDEX),
+            id=SUMMARY_DOCUMENT_ID,
+        )
+    except NotFoundError:
+        summary = None
+    else:
+        summary = fresh_summary(response["_source"], documents)
+    if summary is not None:
+        return {
+            "total_records": summary.total("records"),
+            "record_types": dict(list(summary.counts("records").items())[:50]),
+            "index_name": settings.ES_INDEX,
+        }
 
-def get_health_summary_from_es() -> dict[str, Any]:
     query = {
         "size": 0,
         "aggs": {
-            "total_records": {"value_count": {"field": "type.keyword"}},
-            "record_types": {"terms": {"field": "type.keyword", "size": 50}},
+            "total_records": {"value_count": {"field": "type"}},
+            "record_types": {"terms": {"field": "type", "size": 50}},
         },
     }
-    response = _run_es_query(query)
+    response = await _run_es_query(query)
     total_records_value = response["aggregations"]["total_records"]["value"]
     record_types = {
         bucket["key"]: bucket["doc_count"]
@@ -45,39 +138,64 @@ def get_health_summary_from_es() -> dict[str, Any]:
     }
 
 
-def search_health_records_logic(params: HealthRecordSearchParams) -> list[dict[str, Any]]:
-    must_conditions = []
-    if params.record_type:
-        must_conditions.append(_build_match_condition("type", params.record_type))
-    if params.source_name:
-        must_conditions.append(_build_match_condition("sourceName", params.source_name))
-    if params.date_from or params.date_to:
-        range_cond = _build_range_condition("dateComponents", params.date_from, params.date_to)
-        if range_cond:
-            must_conditions.append(range_cond)
-    if params.value_min is not None or params.value_max is not None:
-        range_cond = _build_range_condition("value", params.value_min, params.value_max)
-        if range_cond:
-            must_conditions.append(range_cond)
-    query: dict[str, Any]
-    if must_conditions:
-        query = {"query": {"bool": {"must": must_conditions}}}
-    else:
-        query = {"query": {"match_all": {}}}
-    query["size"] = params.limit
-    response = _run_es_query(query)
+async def search_health_records_logic(params: HealthRecordSearchParams) -> list[dict[str, Any]]:
+    index = await _search_target(params.date_from, params.date_to)
+    response = await _run_es_query(filter_query(record_filters(params), params.limit), index)
     return [hit["_source"] for hit in response["hits"]["hits"]]
 
 
-def get_statistics_by_type_logic(record_type: RecordType | str) -> dict[str, Any]:
-    query = {
-        "size": 0,
-        "query": _build_match_condition("type", record_type),
-        "aggs": {
-            "value_stats": {"stats": {"field": "value"}},
-        },
+async def page_health_records_logic(
+    params: HealthRecordSearchParams,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    index = await _search_target(params.date_from, params.date_to)
+    return await _search_page(record_filters(params), params.limit, cursor, index)
+
+
+async def _run_rollup_query(query: dict) -> Any | None:
+    """
+    Runs an aggregation on the daily aggregates of the records, None when the import
+    wrote none for the type, such as workouts or imports older than the rollups
+    """
+    query["aggs"]["documents"] = {"sum": {"field": "documents"}}
+    try:
+        response = await _run_es_query(query, rollup_alias(settings.ES_INDEX))
+    except NotFoundError:
+        return None
+    if not response["aggregations"]["documents"]["value"]:
+        return None
+    return response
+
+
+async def get_statistics_by_type_logic(record_type: RecordType | str) -> dict[str, Any]:
+    query = filter_query([term_filter("type", record_type)], size=0)
+    query["aggs"] = {
+        "count": {"sum": {"field": "count"}},
+        "value_sum": {"sum": {"field": "sum"}},
+        "min_value": {"min": {"field": "min"}},
+        "max_value": {"max": {"field": "max"}},
     }
-    response = _run_es_query(query)
+    response = await _run_rollup_query(query)
+    if response is not None:
+        aggregations = response["aggregations"]
+        count = int(aggregations["count"]["value"])
+        value_sum = aggregations["value_sum"]["value"]
+        return {
+            "record_type": record_type,
+            "total_count": int(aggregations["documents"]["value"]),
+            "value_statistics": {
+                "count": count,
+                "min": aggregations["min_value"]["value"],
+                "max": aggregations["max_value"]["value"],
+                "avg": value_sum / count if count else None,
+                "sum": value_sum,
+            },
+        }
+
+    query = filter_query([type_filter(record_type)], size=0)
+    query["track_total_hits"] = True
+    query["aggs"] = {"value_stats": {"stats": {"field": "value"}}}
+    response = await _run_es_query(query)
     return {
         "record_type": record_type,
         "total_count": response["hits"]["total"]["value"],
@@ -85,34 +203,33 @@ def get_statistics_by_type_logic(record_type: RecordType | str) -> dict[str, Any
     }
 
 
-def get_trend_data_logic(
+async def get_trend_data_logic(
     record_type: RecordType | str,
     interval: IntervalType = "month",
     date_from: str | None = None,
     date_to: str | None = None,
 ) -> dict[str, Any]:
-    must_conditions = [{"match": {"type": record_type}}]
-    if date_from or date_to:
-        range_cond = _build_range_condition("dateComponents", date_from, date_to)
-        if range_cond:
-            must_conditions.append(range_cond)
-    query = {
-        "size": 0,
-        "query": {"bool": {"must": must_conditions}},
-        "aggs": {
-            "trend_over_time": {
-                "date_histogram": {"field": "dateComponents", "calendar_interval": interval},
-                "aggs": {
-                    "avg_value": {"avg": {"field": "value"}},
-                    "min_value": {"min": {"field": "value"}},
-                    "max_value": {"max": {"field": "value"}},
-                    "value_sum": {"sum": {"field": "value"}},
-                    "count": {"value_count": {"field": "value"}},
-                },
+    # dates cutting through a day need the records, the daily aggregates cannot honour them
+    days = rollup_days(date_from, date_to)
+    if days is not None:
+        trend = await get_rollup_trend(record_type, interval, days)
+        if trend is not None:
+            return trend
+
+    query = filter_query([type_filter(record_type), date_filter(date_from, date_to)], size=0)
+    query["aggs"] = {
+        "trend_over_time": {
+            "date_histogram": {"field": "dateComponents", "calendar_interval": interval},
+            "aggs": {
+                "avg_value": {"avg": {"field": "value"}},
+                "min_value": {"min": {"field": "value"}},
+                "max_value": {"max": {"field": "value"}},
+                "value_sum": {"sum": {"field": "value"}},
+                "count": {"value_count": {"field": "value"}},
             },
         },
     }
-    response = _run_es_query(query)
+    response = await _run_es_query(query, await _search_target(date_from, date_to))
     buckets = response["aggregations"]["trend_over_time"]["buckets"]
     trend_data = []
     for bucket in buckets:
@@ -129,18 +246,80 @@ def get_trend_data_logic(
     return {"record_type": record_type, "interval": interval, "trend_data": trend_data}
 
 
-def search_values_logic(
+def _value_filters(
+    record_type: RecordType | str | None,
+    value: str,
+    date_from: str | None,
+    date_to: str | None,
+) -> list[dict[str, Any] | None]:
+    # matching the analysed text needs no scores either, so it runs in filter context as well
+    filters = [{"match": {"textvalue": value}}, date_filter(date_from, date_to)]
+    if record_type:
+        filters.append(type_filter(record_type))
+    return filters
+
+
+async def search_values_logic(
     record_type: RecordType | str | None,
     value: str,
     date_from: str | None = None,
     date_to: str | None = None,
+    limit: int = 10,
 ) -> list[dict[str, Any]]:
-    must_conditions = [{"match": {"textvalue": value}}]
-    if record_type:
-        must_conditions.append({"match": {"type": record_type}})
-    if date_from or date_to:
-        range_cond = _build_range_condition("dateComponents", date_from, date_to)
-        must_conditions.append(range_cond)
-    query = {"query": {"bool": {"must": must_conditions}}}
-    response = _run_es_query(query)
+    filters = _value_filters(record_type, value, date_from, date_to)
+    index = await _search_target(date_from, date_to)
+    response = await _run_es_query(filter_query(filters, limit), index)
     return [hit["_source"] for hit in response["hits"]["hits"]]
+
+
+async def page_values_logic(
+    record_type: RecordType | str | None,
+    value: str,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    limit: int = 10,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    filters = _value_filters(record_type, value, date_from, date_to)
+    index = await _search_target(date_from, date_to)
+    return await _search_page(filters, limit, cursor, index)
+
+
+async def get_rollup_trend(
+    record_type: RecordType | str,
+    interval: IntervalType,
+    days: tuple[str | None, str | None],
+) -> dict[str, Any] | None:
+    """
+    Same result as the records trend, re-bucketed from the daily aggregates of the import.
+    None when there are none for the type.
+    """
+    query = filter_query([term_filter("type", record_type), range_filter("day", *days)], size=0)
+    query["aggs"] = {
+        "trend_over_time": {
+            "date_histogram": {"field": "day", "calendar_interval": interval},
+            "aggs": {
+                "min_value": {"min": {"field": "min"}},
+                "max_value": {"max": {"field": "max"}},
+                "value_sum": {"sum": {"field": "sum"}},
+                "count": {"sum": {"field": "count"}},
+            },
+        },
+    }
+    response = await _run_rollup_query(query)
+    if response is None:
+        return None
+    trend_data = []
+    for bucket in response["aggregations"]["trend_over_time"]["buckets"]:
+        count = int(bucket["count"]["value"])
+        trend_data.append(
+            {
+                "date": bucket["key_as_string"],
+                "avg_value": bucket["value_sum"]["value"] / count if count else None,
+                "min_value": bucket["min_value"]["value"],
+                "max_value": bucket["max_value"]["value"],
+                "value_sum": bucket["value_sum"]["value"],
+                "count": count,
+            },
+        )
+    return {"record_type": record_type, "interval": interval, "trend_data": trend_data}
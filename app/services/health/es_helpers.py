@@ -0,0 +1,211 @@
+import base64
+import calendar
+import json
+from collections.abc import Iterable, Sequence
+from datetime import date, datetime, timedelta
+from typing import Any
+
+from app.schemas.record import HealthRecordSearchParams
+from app.services.health.import_summary import ImportSummary
+from app.services.health.sql_helpers import get_table, rollup_bounds
+from app.utils.config_utils import PartitionInterval
+
+# keyword field holding the type of the documents of a table, see ESIndexer.INDEX_MAPPINGS
+TYPE_FIELDS: dict[str, str] = {"records": "type", "workouts": "workoutActivityType"}
+VALUE_FIELDS: dict[str, str] = {"records": "value", "workouts": "duration"}
+DATE_FIELD: str = "dateComponents"
+# partition of the documents without a date, such as the Me element
+UNDATED_PARTITION: str = "undated"
+# period of the index holding the daily aggregates of an import's records
+ROLLUP_PERIOD: str = "daily"
+# period of the index holding the import summary of the documents behind the alias
+SUMMARY_PERIOD: str = "summary"
+SUMMARY_DOCUMENT_ID: str = "import_summary"
+# characters of an ISO date naming the partition of a document
+PARTITION_PERIODS: dict[PartitionInterval, int] = {
+    PartitionInterval.YEAR: len("2024"),
+    PartitionInterval.MONTH: len("2024-01"),
+}
+# documents are partitioned by their local date, which is up to 14 hours off their UTC date
+PARTITION_SLACK: timedelta = timedelta(days=1)
+
+
+def term_filter(field: str, value: Any) -> dict[str, Any]:
+    return {"term": {field: value}}
+
+
+def range_filter(field: str, gte: Any = None, lte: Any = None) -> dict[str, Any] | None:
+    bounds = {name: bound for name, bound in (("gte", gte), ("lte", lte)) if bound is not None}
+    return {"range": {field: bounds}} if bounds else None
+
+
+def type_filter(record_type: str) -> dict[str, Any]:
+    return term_filter(TYPE_FIELDS[get_table(record_type)], record_type)
+
+
+def date_filter(date_from: str | None, date_to: str | None) -> dict[str, Any] | None:
+    return range_filter(DATE_FIELD, date_from, date_to)
+
+
+def record_filters(params: HealthRecordSearchParams) -> list[dict[str, Any]]:
+    """
+    Filter clauses of a record search, exact terms on the keyword fields
+    and ranges on the dates and values
+    """
+    table = get_table(params.record_type or "")
+    filters = [
+        type_filter(params.record_type) if params.record_type else None,
+        term_filter("sourceName", params.source_name) if params.source_name else None,
+        date_filter(params.date_from, params.date_to),
+        range_filter(VALUE_FIELDS[table], params.value_min, params.value_max),
+        range_filter("duration", params.min_workout_duration, params.max_workout_duration),
+    ]
+    return [clause for clause in filters if clause is not None]
+
+
+def filter_query(filters: Sequence[dict[str, Any] | None], size: int) -> dict[str, Any]:
+    """
+    Runs every clause in filter context, hits are not scored and the clauses
+    are cached by the shards for later queries
+    """
+    clauses = [clause for clause in filters if clause is not None]
+    if not clauses:
+        return {"size": size, "query": {"match_all": {}}}
+    return {"size": size, "query": {"bool": {"filter": clauses}}}
+
+
+def page_query(
+    filters: Sequence[dict[str, Any] | None],
+    size: int,
+    pit: dict[str, str],
+    search_after: list[Any] | None,
+) -> dict[str, Any]:
+    """
+    One page of a point in time, newest first like the index is sorted.
+    The point in time adds its _shard_doc tiebreaker to the sort values of every hit,
+    so the last hit's values continue exactly after it.
+    """
+    query = filter_query(filters, size)
+    query["pit"] = pit
+    query["sort"] = [{DATE_FIELD: "desc"}]
+    query["track_total_hits"] = False
+    if search_after is not None:
+        query["search_after"] = search_after
+    return query
+
+
+def encode_cursor(pit_id: str, search_after: list[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps([pit_id, search_after]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, list[Any]]:
+    try:
+        pit_id, search_after = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError) as e:
+        raise ValueError("The cursor was not returned by a previous search") from e
+    return pit_id, search_after
+
+
+def partition_index(alias: str, generation: str, period: str) -> str:
+    """
+    Index of the documents of one period written by one import, searched through the alias
+    """
+    return f"{alias}-{generation}-{period}"
+
+
+def partition_period(document_date: str | None, interval: PartitionInterval) -> str:
+    if not document_date:
+        return UNDATED_PARTITION
+    return document_date[: PARTITION_PERIODS[interval]]
+
+
+def parse_partition(alias: str, index: str) -> tuple[str, str] | None:
+    """
+    Generation and period of a partition index of the alias, None for other indices
+    """
+    if not index.startswith(f"{alias}-"):
+        return None
+    generation, _, period = index.removeprefix(f"{alias}-").partition("-")
+    return (generation, period) if period else None
+
+
+def period_bounds(period: str) -> tuple[date, date] | None:
+    try:
+        if len(period) == PARTITION_PERIODS[PartitionInterval.YEAR]:
+            year = int(period)
+            return date(year, 1, 1), date(year, 12, 31)
+        year, month = (int(part) for part in period.split("-"))
+        return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+    except ValueError:
+        return None
+
+
+def overlapping_partitions(
+    alias: str,
+    indices: Iterable[str],
+    date_from: str | None,
+    date_to: str | None,
+) -> list[str] | None:
+    """
+    Partition indices of the alias that can hold documents between the dates,
+    None when the dates do not narrow the search down and the whole alias is searched
+    """
+    try:
+        start = datetime.fromisoformat(date_from).date() - PARTITION_SLACK if date_from else None
+        end = datetime.fromisoformat(date_to).date() + PARTITION_SLACK if date_to else None
+    except ValueError:
+        return None
+    if start is None and end is None:
+        return None
+    overlapping = []
+    for index in indices:
+        partition = parse_partition(alias, index)
+        if partition is None:
+            return None
+        bounds = period_bounds(partition[1])
+        if bounds is None:
+            continue
+        if (end is None or bounds[0] <= end) and (start is None or bounds[1] >= start):
+            overlapping.append(index)
+    return overlapping
+
+
+def rollup_alias(alias: str) -> str:
+    """
+    Alias of the daily aggregates index of the imports behind alias
+    """
+    return f"{alias}_daily"
+
+
+def summary_alias(alias: str) -> str:
+    """
+    Alias of the import summary index of the imports behind alias
+    """
+    return f"{alias}_summary"
+
+
+def fresh_summary(source: dict[str, Any], documents: int) -> ImportSummary | None:
+    """
+    Summary of an import summary document, None once the alias holds
+    another number of documents than it was written for
+    """
+    summary = ImportSummary.from_document(source)
+    if summary.fingerprint != {"documents": documents}:
+        return None
+    return summary
+
+
+def rollup_days(date_from: str | None, date_to: str | None) -> tuple[str | None, str | None] | None:
+    """
+    UTC days covered by the date filters of a trend query, None if they cut through a day
+    or are in another offset than UTC, whose days the aggregates do not line up with
+    """
+    for value in (date_from, date_to):
+        if not value:
+            continue
+        try:
+            if datetime.fromisoformat(value).utcoffset():
+                return None
+        except ValueError:
+            return None
+    return rollup_bounds(date_from, date_to)
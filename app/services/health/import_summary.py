@@ -0,0 +1,206 @@
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Self
+
+import pyarrow as pa
+
+# records and workouts are summarised per type, workout statistics belong to their workout
+SUMMARY_TABLES: tuple[str, ...] = ("records", "workouts")
+SIDECAR_SUFFIX: str = ".summary.json"
+# layout of the import_summary tables, one row per table and type
+SUMMARY_SCHEMA: pa.Schema = pa.schema(
+    [
+        ("table", pa.string()),
+        ("type", pa.string()),
+        ("count", pa.int64()),
+        ("start_date", pa.timestamp("us", tz="UTC")),
+        ("end_date", pa.timestamp("us", tz="UTC")),
+        ("sources", pa.list_(pa.string())),
+        ("units", pa.list_(pa.string())),
+        ("value_min", pa.float64()),
+        ("value_max", pa.float64()),
+    ],
+)
+
+
+@dataclass
+class TypeSummary:
+    """
+    Statistics of the rows of one type, dates are ISO 8601 in UTC so they compare as strings.
+    Values are the value of records and the duration of workouts.
+    """
+
+    count: int = 0
+    start_date: str | None = None
+    end_date: str | None = None
+    sources: list[str] = field(default_factory=list)
+    units: list[str] = field(default_factory=list)
+    value_min: float | None = None
+    value_max: float | None = None
+
+    def merge(self, other: "TypeSummary") -> None:
+        self.count += other.count
+        self.start_date = _bound(min, self.start_date, other.start_date)
+        self.end_date = _bound(max, self.end_date, other.end_date)
+        self.sources = sorted({*self.sources, *other.sources})
+        self.units = sorted({*self.units, *other.units})
+        self.value_min = _bound(min, self.value_min, other.value_min)
+        self.value_max = _bound(max, self.value_max, other.value_max)
+
+    def observe(self, source: str | None, unit: str | None, value: float | None) -> None:
+        """
+        Adds a single row but its dates, for importers that do not work on batches
+        """
+        self.count += 1
+        if source and source not in self.sources:
+            self.sources.append(source)
+        if unit and unit not in self.units:
+            self.units.append(unit)
+        self.value_min = _bound(min, self.value_min, value)
+        self.value_max = _bound(max, self.value_max, value)
+
+
+def _bound[T: (str, float)](pick: Any, current: T | None, other: T | None) -> T | None:
+    if current is None:
+        return other
+    if other is None:
+        return current
+    return pick(current, other)
+
+
+def _isoformat(value: datetime | str | None) -> str | None:
+    """
+    Dates read back from a database, naive timestamps are UTC
+    """
+    if not isinstance(value, datetime):
+        return value
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC).isoformat()
+    return value.astimezone(UTC).isoformat()
+
+
+@dataclass
+class ImportSummary:
+    """
+    Per type statistics the importers compute while the rows stream by,
+    so the summary and structure tools do not have to aggregate every row.
+    fingerprint describes the target the summary was written for,
+    a summary whose fingerprint no longer matches is stale.
+    """
+
+    types: dict[str, dict[str, TypeSummary]] = field(
+        default_factory=lambda: {table: {} for table in SUMMARY_TABLES},
+    )
+    fingerprint: dict[str, Any] = field(default_factory=dict)
+
+    def add(self, table: str, record_type: str, summary: TypeSummary) -> None:
+        self.types[table].setdefault(record_type, TypeSummary()).merge(summary)
+
+    def merge(self, other: "ImportSummary") -> None:
+        for table, types in other.types.items():
+            for record_type, summary in types.items():
+                self.add(table, record_type, summary)
+
+    @classmethod
+    def merged(cls, *summaries: "ImportSummary") -> Self:
+        """
+        New summary of all rows of summaries, which are left as they are
+        """
+        result = cls()
+        for summary in summaries:
+            result.merge(summary)
+        return result
+
+    def counts(self, table: str) -> dict[str, int]:
+        """
+        Rows per type, largest first
+        """
+        types = self.types[table]
+        return dict(sorted(((name, s.count) for name, s in types.items()), key=lambda c: -c[1]))
+
+    def total(self, table: str) -> int:
+        return sum(summary.count for summary in self.types[table].values())
+
+    def sources(self) -> list[str]:
+        return sorted({source for s in self.types["records"].values() for source in s.sources})
+
+    def rows(self) -> list[dict[str, Any]]:
+        """
+        One row per table and type, the layout of the import_summary tables
+        """
+        return [
+            {"table": table, "type": record_type, **asdict(summary)}
+            for table, types in self.types.items()
+            for record_type, summary in sorted(types.items())
+        ]
+
+    def to_arrow(self) -> pa.Table:
+        rows = [
+            {
+                **row,
+                "start_date": row["start_date"] and datetime.fromisoformat(row["start_date"]),
+                "end_date": row["end_date"] and datetime.fromisoformat(row["end_date"]),
+            }
+            for row in self.rows()
+        ]
+        return pa.Table.from_pylist(rows, schema=SUMMARY_SCHEMA)
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: list[dict[str, Any]],
+        fingerprint: dict[str, Any] | None = None,
+    ) -> Self:
+        summary = cls(fingerprint=fingerprint or {})
+        for row in rows:
+            values = {key: value for key, value in row.items() if key not in ("table", "type")}
+            values["start_date"] = _isoformat(values.get("start_date"))
+            values["end_date"] = _isoformat(values.get("end_date"))
+            values["sources"] = list(values.get("sources") or [])
+            values["units"] = list(values.get("units") or [])
+            summary.add(row["table"], row["type"], TypeSummary(**values))
+        return summary
+
+    def document(self) -> dict[str, Any]:
+        """
+        JSON form of the summary, saved in a sidecar file or an Elasticsearch document
+        """
+        return {"fingerprint": self.fingerprint, "types": self.rows()}
+
+    @classmethod
+    def from_document(cls, content: dict[str, Any]) -> Self:
+        return cls.from_rows(content["types"], content["fingerprint"])
+
+    def save(self, path: Path) -> None:
+        temporary = path.with_name(f"{path.name}.tmp")
+        temporary.write_text(json.dumps(self.document()))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Self | None:
+        if not path.exists():
+            return None
+        return cls.from_document(json.loads(path.read_text()))
+
+
+def sidecar_path(target: str | Path) -> Path:
+    return Path(f"{target}{SIDECAR_SUFFIX}")
+
+
+def file_fingerprint(path: str | Path) -> dict[str, Any]:
+    stat = Path(path).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_fresh_sidecar(target: str | Path, fingerprint: dict[str, Any]) -> ImportSummary | None:
+    """
+    Summary saved next to target, None when there is none or it was written
+    for a target that has changed since
+    """
+    summary = ImportSummary.load(sidecar_path(target))
+    if summary is None or summary.fingerprint != fingerprint:
+        return None
+    return summary
@@ -0,0 +1,99 @@
+import json
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+from urllib.parse import unquote
+from urllib.request import urlopen
+
+from app.schemas.record import RecordType
+
+MANIFEST_FILENAME: str = "manifest.json"
+PARTITION_COLUMNS: tuple[str, ...] = ("type", "year")
+WORKOUTS_FILENAME: str = "workouts.parquet"
+STATS_FILENAME: str = "stats.parquet"
+# partition value of rows without a start date, the same as pyarrow and Spark use
+HIVE_NULL_PARTITION: str = "__HIVE_DEFAULT_PARTITION__"
+
+
+def is_remote(root: str) -> bool:
+    return root.startswith(("http://", "https://"))
+
+
+def dataset_file(root: str, path: str) -> str:
+    if is_remote(root):
+        return f"{root.rstrip('/')}/{path}"
+    return str(Path(root) / path)
+
+
+def load_manifest(root: str) -> dict[str, Any]:
+    """
+    Reads the manifest of a dataset written by the DuckDB importer with --parquet.
+    Directories cannot be listed over http(s), so the manifest is how readers
+    find the partition files. A local manifest is parsed again once a new import
+    replaced it, a remote one on every call.
+    """
+    location = dataset_file(root, MANIFEST_FILENAME)
+    if is_remote(root):
+        with urlopen(location) as response:
+            return json.load(response)
+    return read_manifest(location, Path(location).stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=4)
+def read_manifest(location: str, modified: int) -> dict[str, Any]:
+    return json.loads(Path(location).read_text())
+
+
+def partition_values(path: str) -> dict[str, str]:
+    """
+    type=HKQuantityTypeIdentifierStepCount/year=2016/part-0.parquet
+    -> {"type": "HKQuantityTypeIdentifierStepCount", "year": "2016"}
+    """
+    values: dict[str, str] = {}
+    for part in Path(path).parts:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            values[key] = unquote(value)
+    return values
+
+
+def partition_year(date: str | None, slack: timedelta) -> int | None:
+    """
+    Partitions are cut on UTC years while the bounds may carry any offset
+    (or none, then DuckDB applies the session time zone), a day of slack covers both
+    """
+    if not date:
+        return None
+    try:
+        return (datetime.fromisoformat(date) + slack).year
+    except ValueError:
+        return None
+
+
+def select_record_files(
+    manifest: dict[str, Any],
+    record_type: RecordType | str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+) -> list[str]:
+    """
+    Paths of the record partitions that can hold rows of the type between the dates
+    """
+    year_from = partition_year(date_from, -timedelta(days=1))
+    year_to = partition_year(date_to, timedelta(days=1))
+    files = []
+    for entry in manifest["records"]:
+        if record_type and entry["type"] != record_type:
+            continue
+        if date_from or date_to:
+            year = entry["year"]
+            # rows without a start date never match a date filter
+            if year is None:
+                continue
+            if year_from is not None and year < year_from:
+                continue
+            if year_to is not None and year > year_to:
+                continue
+        files.append(entry["path"])
+    return files
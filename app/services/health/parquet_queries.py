@@ -4,14 +4,72 @@ import duckdb
 
 from app.schemas.record import HealthRecordSearchParams, IntervalType, RecordType
 from app.services.duckdb_client import DuckDBClient
-from app.services.health.sql_helpers import fill_query
+from app.services.health.import_summary import ImportSummary
+from app.services.health.parquet_dataset import dataset_file, load_manifest, select_record_files
+from app.services.health.sql_helpers import day_end, fill_query, summary_columns
 
 client = DuckDBClient()
 
 
+def records_source(
+    record_type: RecordType | str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+) -> str | None:
+    """
+    Table expression over the record files that can match the filters, None when none can.
+    A DUCKDB_FILENAME ending in .parquet is read as a single file, otherwise
+    as the Hive partitioned dataset written by the DuckDB importer with --parquet,
+    whose manifest is used to skip the files of other types and years.
+    """
+    root = str(client.path)
+    if root.endswith(".parquet"):
+        return f"read_parquet('{root}')"
+    files = select_record_files(load_manifest(root), record_type, date_from, date_to)
+    if not files:
+        return None
+    paths = ", ".join(f"'{dataset_file(root, path)}'" for path in files)
+    # year is only a partition key, it is left out so rows look like in the single file
+    return f"(SELECT * EXCLUDE (year) FROM read_parquet([{paths}], hive_partitioning = true))"
+
+
+def load_summary() -> ImportSummary | None:
+    """
+    Summary the importer adds to the manifest of a dataset,
+    None for a single file, older datasets and a summary that does not add up
+    to the rows of the record files
+    """
+    root = str(client.path)
+    if root.endswith(".parquet"):
+        return None
+    manifest = load_manifest(root)
+    if "summary" not in manifest:
+        return None
+    summary = ImportSummary.from_rows(manifest["summary"])
+    if summary.total("records") != sum(entry["rows"] for entry in manifest["records"]):
+        return None
+    return summary
+
+
 def get_health_summary_from_duckdb() -> list[dict[str, Any]]:
+    """
+    Rows, dates, sources, units and value range of every record type,
+    read from the manifest summary when the dataset has one
+    """
+    if (summary := load_summary()) is not None:
+        response = (
+            duckdb.from_arrow(summary.to_arrow())
+            .filter("\"table\" = 'records'")
+            .order("count DESC")
+            .project("type, count, start_date, end_date, sources, units, value_min, value_max")
+        )
+        return client.format_response(response)
+
+    source = records_source()
+    if source is None:
+        return []
     response = duckdb.sql(
-        f"""SELECT type, COUNT(*) AS count FROM read_parquet('{client.path}')
+        f"""SELECT type, {summary_columns("records")} FROM {source}
          GROUP BY type ORDER BY count DESC""",
     )
     return client.format_response(response)
@@ -20,7 +78,10 @@ def get_health_summary_from_duckdb() -> list[dict[str, Any]]:
 def search_health_records_from_duckdb(
     params: HealthRecordSearchParams,
 ) -> list[dict[str, Any]]:
-    query: str = f"SELECT * FROM read_parquet('{client.path}')"
+    source = records_source(params.record_type, params.date_from, params.date_to)
+    if source is None:
+        return []
+    query: str = f"SELECT * FROM {source}"
     query += fill_query(params)
     response = duckdb.sql(query)
     return client.format_response(response)
@@ -29,10 +90,13 @@ def search_health_records_from_duckdb(
 def get_statistics_by_type_from_duckdb(
     record_type: RecordType | str,
 ) -> list[dict[str, Any]]:
+    source = records_source(record_type)
+    if source is None:
+        return []
     result = duckdb.sql(f"""
                     SELECT type, COUNT(*) AS count, AVG(value) AS average,
                     SUM(value) AS sum, MIN(value) AS min, MAX(value) AS max
-                    FROM read_parquet('{client.path}')
+                    FROM {source}
                     WHERE type = '{record_type}' GROUP BY type
                     """)
     return client.format_response(result)
@@ -44,15 +108,18 @@ def get_trend_data_from_duckdb(
     date_from: str | None = None,
     date_to: str | None = None,
 ) -> list[dict[str, Any]]:
+    source = records_source(record_type, date_from, date_to)
+    if source is None:
+        return []
     result = duckdb.sql(f"""
-        SELECT device, time_bucket(INTERVAL '1 {interval}', startDate) AS interval,
+        SELECT type, sourceName, time_bucket(INTERVAL '1 {interval}', startDate) AS interval,
         AVG(value) AS average, SUM(value) AS sum,
-        MIN(value) AS min, MAX(value) AS max, COUNT(*) AS count
-        FROM read_parquet('{client.path}')
+        MIN(value) AS min, MAX(value) AS max, COUNT(*) AS count, unit
+        FROM {source}
         WHERE type = '{record_type}'
         {f"AND startDate >= '{date_from}'" if date_from else ""}
-        {f"AND startDate <= '{date_to}'" if date_to else ""}
-        GROUP BY interval, device ORDER BY interval ASC
+        {f"AND startDate <= '{day_end(date_to)}'" if date_to else ""}
+        GROUP BY interval, type, sourceName, unit ORDER BY interval ASC
     """)
     return client.format_response(result)
 
@@ -63,8 +130,11 @@ def search_values_from_duckdb(
     date_from: str | None = None,
     date_to: str | None = None,
 ) -> list[dict[str, Any]]:
+    source = records_source(record_type, date_from, date_to)
+    if source is None:
+        return []
     result = duckdb.sql(f"""
-        SELECT * FROM read_parquet('{client.path}') WHERE textvalue = '{value}'
+        SELECT * FROM {source} WHERE textvalue = '{value}'
         {f"AND type = '{record_type}'" if record_type else ""}
         {f"AND startDate >= '{date_from}'" if date_from else ""}
         {f"AND startDate <= '{date_to}'" if date_to else ""}
@@ -1,8 +1,15 @@
+from datetime import date, datetime, time
 from typing import Any
 
 from app.schemas.record import HealthRecordSearchParams
 
-join_query: str = "INNER JOIN stats ON workouts.startDate = stats.startDate"
+join_query: str = "INNER JOIN stats USING (workout_id)"
+
+# pre-aggregated records per (grain, type, sourceName, unit, period) built by the importers
+ROLLUP_TABLE: str = "records_rollup"
+ROLLUP_GRAINS: tuple[str, ...] = ("day", "week", "month", "year")
+# per type statistics of records and workouts written by the importers, see import_summary.py
+SUMMARY_TABLE: str = "import_summary"
 
 
 def join_string(table: str) -> str:
@@ -11,12 +18,96 @@ def join_string(table: str) -> str:
     return ""
 
 
+def enum_name(table: str, column: str) -> str:
+    """
+    Name of the DuckDB ENUM type the importer creates for a dictionary encoded column
+    """
+    return f"{table}_{column}".lower()
+
+
+def enum_literal(table: str, column: str, value: str) -> str:
+    """
+    Compares against the column's ENUM type instead of a string, which would cast every row
+    to VARCHAR and keep zone maps from skipping row groups. Unknown values match nothing.
+    """
+    return f"TRY_CAST('{value}' AS {enum_name(table, column)})"
+
+
+def is_day(value: str) -> bool:
+    """
+    Whether a date filter is a bare date without a time
+    """
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def day_end(date_to: str) -> str:
+    """
+    Upper date filter of a raw trend query, a bare date includes its whole day
+    like the rollups do, so both answer the same
+    """
+    return f"{date_to} 23:59:59" if is_day(date_to) else date_to
+
+
+def rollup_bounds(
+    date_from: str | None,
+    date_to: str | None,
+) -> tuple[str | None, str | None] | None:
+    """
+    Returns the first and last day covered by the date filters of a trend query,
+    or None if they cut through a day and raw samples are needed to honour them.
+    Bare dates cover their whole day, see day_end.
+    Offsets are ignored, like in the comparisons with the stored UTC timestamps.
+    """
+    bounds: list[str | None] = []
+    for value, boundary in ((date_from, time.min), (date_to, time(23, 59, 59))):
+        if not value:
+            bounds.append(None)
+            continue
+        if is_day(value):
+            bounds.append(date.fromisoformat(value).isoformat())
+            continue
+        try:
+            moment = datetime.fromisoformat(value).replace(tzinfo=None)
+        except ValueError:
+            return None
+        if moment.time().replace(microsecond=0) != boundary:
+            return None
+        bounds.append(moment.date().isoformat())
+    return bounds[0], bounds[1]
+
+
+def rollup_grain(interval: str, bounds: tuple[str | None, str | None]) -> str:
+    """
+    Unbounded trends read the rollup of their own interval, bounded ones re-bucket
+    the daily rollup so partially covered weeks, months and years stay exact
+    """
+    if bounds == (None, None) and interval in ROLLUP_GRAINS:
+        return interval
+    return "day"
+
+
 def value_aggregates(table: str) -> list[str]:
     if table in ["workouts", "stats"]:
         return ["duration", "sum"]
     return ["value"]
 
 
+def summary_columns(table: str) -> str:
+    """
+    DuckDB aggregates of the import summary columns, for the rows of one type
+    of a table without a fresh summary
+    """
+    value, unit = ("duration", "durationUnit") if table == "workouts" else ("value", "unit")
+    return f"""count(*) AS count, min(startDate) AS start_date, max(endDate) AS end_date,
+    list_sort(list_filter(list(DISTINCT sourceName::VARCHAR), name -> name <> '')) AS sources,
+    list_sort(list_filter(list(DISTINCT {unit}::VARCHAR), name -> name <> '')) AS units,
+    min({value}) AS value_min, max({value}) AS value_max"""
+
+
 def get_table(record_type: str | Any) -> str:
     if record_type.startswith("HKWorkout"):
         return "workouts"
@@ -59,7 +150,7 @@ def build_value_range(
     return None
 
 
-def fill_query(params: HealthRecordSearchParams) -> str:
+def fill_query(params: HealthRecordSearchParams, enum_types: bool = False) -> str:
     conditions: list[str] = []
     table = get_table(params.record_type)
 
@@ -70,7 +161,11 @@ def fill_query(params: HealthRecordSearchParams) -> str:
     value_type = get_value_type(table)
 
     if params.record_type:
-        conditions.append(f" {table}.type = '{params.record_type}'")
+        if enum_types:
+            record_type = enum_literal(table, "type", params.record_type)
+        else:
+            record_type = f"'{params.record_type}'"
+        conditions.append(f" {table}.type = {record_type}")
     if params.source_name:
         conditions.append(f" source_name = '{params.source_name}'")
     if params.date_from or params.date_to:
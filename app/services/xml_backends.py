@@ -0,0 +1,185 @@
+import importlib
+import io
+import zipfile
+from abc import ABC, abstractmethod
+from collections.abc import Collection, Generator, Iterator, Mapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, cast
+from xml.etree import ElementTree as ET
+from xml.parsers import expat
+
+from app.config import settings
+from app.utils.config_utils import XMLParserBackend
+
+XMLSource = str | Path | BinaryIO
+XMLElement = tuple[str, Mapping[str, str]]
+
+BLOCK_SIZE: int = 1024 * 1024
+EXPORT_FILENAME: str = "export.xml"
+
+
+def is_zip_source(source: XMLSource) -> bool:
+    return isinstance(source, (str, Path)) and zipfile.is_zipfile(source)
+
+
+def find_export_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """
+    Returns RAW_XML_ZIP_MEMBER, or the first export.xml in the archive
+    (apple_health_export/export.xml in the zip produced by the Health app)
+    """
+    if settings.RAW_XML_ZIP_MEMBER:
+        return archive.getinfo(settings.RAW_XML_ZIP_MEMBER)
+    for info in archive.infolist():
+        if Path(info.filename).name == EXPORT_FILENAME:
+            return info
+    raise FileNotFoundError(f"No {EXPORT_FILENAME} found in {archive.filename}")
+
+
+def source_size(source: str | Path) -> int:
+    """
+    Size of the XML document in bytes, uncompressed if it is read from a zip
+    """
+    if is_zip_source(source):
+        with zipfile.ZipFile(source) as archive:
+            return find_export_member(archive).file_size
+    return Path(source).stat().st_size
+
+
+@contextmanager
+def open_source(source: XMLSource) -> Generator[BinaryIO, None, None]:
+    """
+    Opens an XML file, or streams the export member of a zip archive
+    through a large read buffer without extracting it to disk
+    """
+    if is_zip_source(source):
+        with (
+            zipfile.ZipFile(source) as archive,
+            archive.open(find_export_member(archive)) as member,
+        ):
+            yield io.BufferedReader(cast(io.RawIOBase, member), buffer_size=BLOCK_SIZE)
+    elif isinstance(source, (str, Path)):
+        with open(source, "rb", buffering=BLOCK_SIZE) as file:
+            yield file
+    else:
+        yield source
+
+
+class XMLBackend(ABC):
+    """
+    Streams (tag, attributes) pairs for every element start in an XML document.
+    Attribute mappings are only guaranteed to be valid until the next element is requested.
+    """
+
+    @abstractmethod
+    def iter_elements(
+        self,
+        source: XMLSource,
+        tags: Collection[str] | None = None,
+    ) -> Iterator[XMLElement]: ...
+
+
+class ElementTreeBackend(XMLBackend):
+    """
+    xml.etree iterparse, builds an Element for every node and clears it right away
+    """
+
+    def iter_elements(
+        self,
+        source: XMLSource,
+        tags: Collection[str] | None = None,
+    ) -> Iterator[XMLElement]:
+        wanted = frozenset(tags) if tags is not None else None
+        with open_source(source) as file:
+            for _, elem in ET.iterparse(file, events=("start",)):
+                if wanted is None or elem.tag in wanted:
+                    yield elem.tag, elem.attrib
+                elem.clear()
+
+
+class ExpatBackend(XMLBackend):
+    """
+    Callback driven pyexpat parser, elements are never materialised,
+    matching start tags are collected per block of input and yielded in order
+    """
+
+    def iter_elements(
+        self,
+        source: XMLSource,
+        tags: Collection[str] | None = None,
+    ) -> Iterator[XMLElement]:
+        parser = expat.ParserCreate()
+        pending: list[XMLElement] = []
+
+        if tags is None:
+
+            def start_element(name: str, attributes: dict[str, str]) -> None:
+                pending.append((name, attributes))
+
+        else:
+            wanted = frozenset(tags)
+
+            def start_element(name: str, attributes: dict[str, str]) -> None:
+                if name in wanted:
+                    pending.append((name, attributes))
+
+        parser.StartElementHandler = start_element
+
+        with open_source(source) as file:
+            while data := file.read(BLOCK_SIZE):
+                parser.Parse(data, False)
+                yield from pending
+                pending.clear()
+            parser.Parse(b"", True)
+            yield from pending
+
+
+class LxmlBackend(XMLBackend):
+    """
+    lxml iterparse with tag filtering done in C, requires the optional lxml package
+    """
+
+    def __init__(self):
+        try:
+            self.etree: Any = importlib.import_module("lxml.etree")
+        except ImportError as e:
+            raise ImportError(
+                "The lxml XML parser backend requires lxml, install it with `uv add lxml`",
+            ) from e
+
+    def iter_elements(
+        self,
+        source: XMLSource,
+        tags: Collection[str] | None = None,
+    ) -> Iterator[XMLElement]:
+        with open_source(source) as file:
+            context = self.etree.iterparse(
+                file,
+                events=("start", "end"),
+                tag=list(tags) if tags is not None else None,
+                resolve_entities=False,
+                huge_tree=True,
+            )
+            for event, elem in context:
+                if event == "start":
+                    yield elem.tag, elem.attrib
+                    continue
+                # drop finished elements and everything before them
+                elem.clear(keep_tail=True)
+                parent = elem.getparent()
+                while parent is not None and elem.getprevious() is not None:
+                    del parent[0]
+
+
+BACKENDS: dict[XMLParserBackend, type[XMLBackend]] = {
+    XMLParserBackend.ETREE: ElementTreeBackend,
+    XMLParserBackend.EXPAT: ExpatBackend,
+    XMLParserBackend.LXML: LxmlBackend,
+}
+
+
+def get_backend(backend: XMLParserBackend | str | None = None) -> XMLBackend:
+    """
+    Returns the XML parser backend with the given name, XML_PARSER_BACKEND by default
+    """
+    return BACKENDS[XMLParserBackend(backend or settings.XML_PARSER_BACKEND)]()
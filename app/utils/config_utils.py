@@ -15,6 +15,17 @@ class EnvironmentType(str, Enum):
     PRODUCTION = "production"
 
 
+class XMLParserBackend(str, Enum):
+    ETREE = "etree"
+    EXPAT = "expat"
+    LXML = "lxml"
+
+
+class PartitionInterval(str, Enum):
+    YEAR = "year"
+    MONTH = "month"
+
+
 class Decryptor(Protocol):
     def decrypt(self, value: bytes) -> bytes: ...  # fmt: skip
 
@@ -0,0 +1,113 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from scripts.benchmarks.synthetic_export import write_export
+from scripts.duckdb_importer import ParquetImporter
+
+DATE_FROM: str = "2017-01-01T00:00:00+00:00"
+DATE_TO: str = "2017-03-31T23:59:59+00:00"
+
+
+class UnsortedImporter(ParquetImporter):
+    """
+    Keeps the rows in XML order, like the importer did before tables were clustered
+    """
+
+    SORT_KEYS: dict[str, tuple[str, ...]] = {}
+
+
+def import_export(importer: ParquetImporter, xml_path: Path, path: Path) -> Path:
+    importer.xml_path = xml_path
+    importer.path = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        importer.export_xml()
+    return path
+
+
+def profile_queries(repeat: int) -> list[tuple[str, int, int, float]]:
+    """
+    Runs in a fresh process with DUCKDB_FILENAME pointing at the database under test,
+    duckdb_queries connects to it when it is imported
+    """
+    from app.schemas.record import HealthRecordSearchParams
+    from app.services.health import duckdb_queries
+
+    con = duckdb_queries.con
+    con.sql("SET enable_profiling = 'no_output'")
+    cases: dict[str, Callable[[], Any]] = {
+        "trend HeartRate, 1 quarter": lambda: duckdb_queries.get_trend_data_from_duckdb(
+            "HKQuantityTypeIdentifierHeartRate",
+            "week",
+            DATE_FROM,
+            DATE_TO,
+        ),
+        "trend BodyMass, all time": lambda: duckdb_queries.get_trend_data_from_duckdb(
+            "HKQuantityTypeIdentifierBodyMass",
+            "month",
+        ),
+        "search StepCount, 1 quarter": lambda: duckdb_queries.search_health_records_from_duckdb(
+            HealthRecordSearchParams(
+                record_type="HKQuantityTypeIdentifierStepCount",
+                date_from=DATE_FROM,
+                date_to=DATE_TO,
+                limit=20,
+            ),
+        ),
+    }
+    results = []
+    for name, run in cases.items():
+        run()
+        profile = json.loads(con.get_profiling_information(format="json"))
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        results.append(
+            (
+                name,
+                profile["cumulative_rows_scanned"],
+                profile["total_bytes_read"],
+                statistics.median(timings),
+            ),
+        )
+    return results
+
+
+parser = argparse.ArgumentParser(
+    prog="Clustered storage benchmark",
+    description="Compare rows scanned by DuckDB queries on XML ordered and clustered tables",
+)
+parser.add_argument("-n", "--records", type=int, default=1_000_000, help="Synthetic records")
+parser.add_argument("--repeat", type=int, default=20, help="Runs per query, the median is shown")
+parser.add_argument("--xml", type=Path, default=None, help="Use an existing export instead")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = args.xml or write_export(Path(tmp) / "export.xml", args.records)
+        databases = {
+            "xml order": import_export(UnsortedImporter(), xml_path, Path(tmp) / "xml.duckdb"),
+            "clustered": import_export(ParquetImporter(), xml_path, Path(tmp) / "sorted.duckdb"),
+        }
+        print(f"{'layout':<10} {'query':<28} {'rows scanned':>13} {'MiB read':>9} {'ms':>8}")
+        for layout, path in databases.items():
+            os.environ["DUCKDB_FILENAME"] = str(path)
+            with context.Pool(1) as pool:
+                results = pool.apply(profile_queries, (args.repeat,))
+            for name, rows, read, latency in results:
+                print(
+                    f"{layout:<10} {name:<28} {rows:>13,} {read / 1024 / 1024:>9.2f}"
+                    f" {latency * 1000:>8.2f}",
+                )
@@ -0,0 +1,191 @@
+import argparse
+import contextlib
+import io
+import statistics
+import tempfile
+import time
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+from elasticsearch import NotFoundError
+
+from app.schemas.record import HealthRecordSearchParams
+from app.services.health.es_helpers import date_filter, filter_query, record_filters, type_filter
+from scripts.benchmarks.synthetic_export import write_export
+from scripts.xml2es import ESIndexer
+
+DATE_FROM: str = "2017-01-01T00:00:00+00:00"
+DATE_TO: str = "2017-12-31T23:59:59+00:00"
+HEART_RATE: str = "HKQuantityTypeIdentifierHeartRate"
+STEPS: str = "HKQuantityTypeIdentifierStepCount"
+DEEP_SLEEP: str = "HKCategoryValueSleepAnalysisAsleepDeep"
+TREND_AGGS: dict[str, Any] = {
+    "trend_over_time": {
+        "date_histogram": {"field": "dateComponents", "calendar_interval": "month"},
+        "aggs": {
+            "avg_value": {"avg": {"field": "value"}},
+            "value_sum": {"sum": {"field": "value"}},
+        },
+    },
+}
+
+
+def legacy_query(
+    must: list[dict[str, Any]],
+    size: int,
+    aggs: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """
+    Query shape of elasticsearch.py before the query compiler, scored match clauses in must
+    """
+    query: dict[str, Any] = {"size": size, "query": {"bool": {"must": must}}}
+    if aggs:
+        query["aggs"] = aggs
+    return query
+
+
+def compiled_query(
+    filters: Sequence[dict[str, Any] | None],
+    size: int,
+    aggs: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    query = filter_query(filters, size)
+    if aggs:
+        query["aggs"] = aggs
+    return query
+
+
+def scenarios() -> dict[str, tuple[dict[str, Any], dict[str, Any]]]:
+    """
+    The logic functions' queries as (before, after)
+    """
+    dates = {"range": {"dateComponents": {"gte": DATE_FROM, "lte": DATE_TO}}}
+    params = HealthRecordSearchParams(
+        record_type=HEART_RATE,
+        source_name="Polar Flow",
+        date_from=DATE_FROM,
+        date_to=DATE_TO,
+        value_min="120",
+        limit=50,
+    )
+    return {
+        "search records": (
+            legacy_query(
+                [
+                    {"match": {"type": HEART_RATE}},
+                    {"match": {"sourceName": "Polar Flow"}},
+                    dates,
+                    {"range": {"value": {"gte": "120"}}},
+                ],
+                size=50,
+            ),
+            compiled_query(record_filters(params), size=50),
+        ),
+        "statistics": (
+            legacy_query(
+                [{"match": {"type": HEART_RATE}}],
+                size=0,
+                aggs={"value_stats": {"stats": {"field": "value"}}},
+            ),
+            compiled_query(
+                [type_filter(HEART_RATE)],
+                size=0,
+                aggs={"value_stats": {"stats": {"field": "value"}}},
+            ),
+        ),
+        "monthly trend": (
+            legacy_query([{"match": {"type": STEPS}}, dates], size=0, aggs=TREND_AGGS),
+            compiled_query(
+                [type_filter(STEPS), date_filter(DATE_FROM, DATE_TO)],
+                size=0,
+                aggs=TREND_AGGS,
+            ),
+        ),
+        "search values": (
+            legacy_query([{"match": {"textvalue": DEEP_SLEEP}}], size=10),
+            compiled_query([{"match": {"textvalue": DEEP_SLEEP}}], size=10),
+        ),
+    }
+
+
+def load_index(indexer: ESIndexer, xml_path: Path) -> None:
+    indexer.es.xml_path = str(xml_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        indexer.delete_index()
+        indexer.run()
+
+
+def measure(
+    indexer: ESIndexer,
+    query: dict[str, Any],
+    request_cache: bool,
+    repeat: int,
+) -> tuple[float, float, float]:
+    """
+    Latency of the first run after the caches were cleared, then the median
+    client latency and the median time Elasticsearch reports of the repeated runs
+    """
+    engine, index = indexer.es.engine, indexer.es.index
+    engine.indices.clear_cache(index=index)
+    start = time.perf_counter()
+    engine.search(index=index, body=query, request_cache=request_cache)
+    cold = time.perf_counter() - start
+    latencies, took = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = engine.search(index=index, body=query, request_cache=request_cache)
+        latencies.append(time.perf_counter() - start)
+        took.append(response["took"] / 1000)
+    return cold, statistics.median(latencies), statistics.median(took)
+
+
+parser = argparse.ArgumentParser(
+    prog="Elasticsearch queries benchmark",
+    description="Compare scored must queries with filter context and the request cache",
+)
+parser.add_argument("-n", "--records", type=int, default=1_000_000, help="Synthetic records")
+parser.add_argument("--repeat", type=int, default=50, help="Runs per query, the median is shown")
+parser.add_argument("--xml", type=Path, default=None, help="Use an existing export instead")
+parser.add_argument(
+    "--index",
+    default="apple_health_benchmark",
+    help="Alias created on ES_HOST:ES_PORT for the benchmark and deleted afterwards",
+)
+parser.add_argument(
+    "--keep",
+    action="store_true",
+    help="Keep the index and query it again on the next run instead of importing",
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    indexer = ESIndexer()
+    indexer.es.index = args.index
+    if not (args.keep and indexer.document_count()):
+        with tempfile.TemporaryDirectory() as tmp:
+            xml_path = args.xml or write_export(Path(tmp) / "export.xml", args.records)
+            started = time.perf_counter()
+            load_index(indexer, xml_path)
+            print(f"Indexed in {time.perf_counter() - started:.2f}s")
+    print(f"{indexer.document_count()} documents in '{args.index}'")
+    print(f"{'query':<15} {'shape':<13} {'cold ms':>8} {'median ms':>10} {'took ms':>8}")
+    try:
+        for name, (before, after) in scenarios().items():
+            # without the request cache repeated runs measure how the query executes
+            shapes = {"must": (before, False), "filter": (after, False)}
+            # the request cache only keeps responses of size 0 requests
+            if after["size"] == 0:
+                shapes["filter+cache"] = (after, True)
+            for shape, (query, request_cache) in shapes.items():
+                cold, latency, took = measure(indexer, query, request_cache, args.repeat)
+                print(
+                    f"{name:<15} {shape:<13} {cold * 1000:>8.2f}"
+                    f" {latency * 1000:>10.2f} {took * 1000:>8.2f}",
+                )
+    finally:
+        if not args.keep:
+            with contextlib.redirect_stdout(io.StringIO()):
+                indexer.delete_index()
+            with contextlib.suppress(NotFoundError):
+                indexer.es.engine.indices.delete_index_template(name=indexer.template_name)
@@ -0,0 +1,130 @@
+import argparse
+import contextlib
+import io
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import chdb
+import duckdb
+import pyarrow as pa
+
+from scripts.benchmarks.synthetic_export import write_export
+from scripts.duckdb_importer import ParquetImporter
+from scripts.xml_exporter import XMLExporter
+
+QUERIES: dict[str, str] = {
+    "group by type": "SELECT type, count(*) FROM {table} GROUP BY type",
+    "group by type, source": "SELECT type, sourceName, avg(value) FROM {table} GROUP BY ALL",
+    "filter type": (
+        "SELECT count(*), avg(value) FROM {table} WHERE type = 'HKQuantityTypeIdentifierHeartRate'"
+    ),
+}
+
+
+def median_latency(run: Callable[[], object], repeat: int) -> float:
+    run()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def report(name: str, size: int, latencies: dict[str, float]) -> None:
+    timings = "  ".join(f"{query}: {latency * 1000:7.2f}ms" for query, latency in latencies.items())
+    print(f"{name:<28} {size / 1024 / 1024:8.2f} MiB  {timings}")
+
+
+def bench_duckdb(xml_path: Path, tmp: Path, repeat: int) -> None:
+    """
+    Imports with the DuckDB importer (ENUM columns) and copies the tables
+    with the dictionary columns cast back to VARCHAR for comparison
+    """
+    importer = ParquetImporter()
+    importer.xml_path = xml_path
+    importer.path = tmp / "enum.duckdb"
+    with contextlib.redirect_stdout(io.StringIO()):
+        importer.export_xml()
+
+    plain_path, enum_path = tmp / "varchar.duckdb", importer.path
+    with duckdb.connect(str(enum_path)) as con:
+        con.sql(f"ATTACH '{plain_path}' AS plain")
+        for table, columns in XMLExporter.DICTIONARY_COLUMNS.items():
+            casts = ", ".join(f'"{column}"::VARCHAR AS "{column}"' for column in columns)
+            con.sql(f"CREATE TABLE plain.{table} AS SELECT * REPLACE ({casts}) FROM {table}")
+
+    for name, path in (("duckdb VARCHAR", plain_path), ("duckdb ENUM", enum_path)):
+        with duckdb.connect(str(path)) as con:
+            con.sql("CHECKPOINT")
+            latencies = {
+                query: median_latency(lambda sql=sql: con.sql(sql).fetchall(), repeat)
+                for query, sql in ((q, sql.format(table="records")) for q, sql in QUERIES.items())
+            }
+            size = con.sql("SELECT used_blocks * block_size FROM pragma_database_size()")
+            report(name, size.fetchall()[0][0], latencies)
+
+
+def clickhouse_type(field: pa.Field, dictionary: bool) -> str:
+    if pa.types.is_timestamp(field.type):
+        return "DateTime"
+    if pa.types.is_floating(field.type):
+        return "Float64"
+    if dictionary and field.name in XMLExporter.DICTIONARY_COLUMNS["records"]:
+        return "LowCardinality(String)"
+    return "String"
+
+
+def bench_clickhouse(xml_path: Path, tmp: Path, repeat: int) -> None:
+    """
+    Loads the same record batches into a String and a LowCardinality(String) MergeTree table
+    """
+    exporter = XMLExporter()
+    batches = [chunk.batch for chunk in exporter.iter_batches(xml_path) if chunk.table == "records"]
+    session = chdb.session.Session(str(tmp / "bench.chdb"))
+    session.query("CREATE DATABASE IF NOT EXISTS bench")
+    schema = exporter.table_schemas["records"]
+
+    for name, dictionary in (("clickhouse String", False), ("clickhouse LowCardinality", True)):
+        table = "bench.low_cardinality" if dictionary else "bench.plain"
+        columns = ", ".join(
+            f"{field.name} {clickhouse_type(field, dictionary)}" for field in schema
+        )
+        session.query(f"CREATE TABLE {table} ({columns}) ENGINE = MergeTree ORDER BY startDate")
+        for batch in batches:
+            session.query(f"INSERT INTO {table} SELECT * FROM Python(batch)")
+        session.query(f"OPTIMIZE TABLE {table} FINAL")
+        size = int(
+            str(
+                session.query(
+                    f"SELECT sum(bytes_on_disk) FROM system.parts "
+                    f"WHERE active AND concat(database, '.', table) = '{table}'",
+                    "CSV",
+                ),
+            ).strip(),
+        )
+        latencies = {
+            query: median_latency(lambda sql=sql: session.query(sql.format(table=table)), repeat)
+            for query, sql in QUERIES.items()
+        }
+        report(name, size, latencies)
+    session.close()
+
+
+parser = argparse.ArgumentParser(
+    prog="Low cardinality columns benchmark",
+    description="Compare storage size and GROUP BY latency of plain and dictionary encoded columns",
+)
+parser.add_argument("-n", "--records", type=int, default=300_000, help="Synthetic records")
+parser.add_argument("--repeat", type=int, default=20, help="Runs per query, the median is shown")
+parser.add_argument("--xml", type=Path, default=None, help="Use an existing export instead")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = args.xml or write_export(Path(tmp) / "export.xml", args.records)
+        bench_duckdb(xml_path, Path(tmp), args.repeat)
+        bench_clickhouse(xml_path, Path(tmp), args.repeat)
@@ -0,0 +1,160 @@
+import argparse
+import contextlib
+import dataclasses
+import io
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Generator
+from pathlib import Path
+from urllib.error import URLError
+from urllib.request import urlopen
+
+import duckdb
+
+from app.services.health.parquet_dataset import MANIFEST_FILENAME
+from scripts.benchmarks.synthetic_export import write_export
+from scripts.duckdb_importer import ParquetImporter
+
+FILESERVER: Path = Path(__file__).parents[2] / "tests" / "fileserver.py"
+# absent values that sort between the min and max of the row groups holding the column,
+# so statistics cannot rule them out
+LOOKUPS: dict[str, tuple[str, str]] = {
+    "textValue = Awake": ("textValue", "HKCategoryValueSleepAnalysisAwake"),
+    "sourceName = iPad": ("sourceName", "Rob’s iPad"),
+}
+
+
+def export_dataset(xml_path: Path, path: Path, bloom_filters: bool) -> Path:
+    importer = ParquetImporter()
+    importer.xml_path = xml_path
+    importer.path = path
+    importer.parquet_options = dataclasses.replace(
+        importer.parquet_options,
+        bloom_filter_columns=("textValue", "sourceName") if bloom_filters else (),
+        write_page_index=bloom_filters,
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        importer.export_xml_parquet()
+    return path
+
+
+def pruned_row_groups(path: Path) -> dict[str, tuple[int, int]]:
+    """
+    Row groups holding the column and how many of them its Bloom filter excludes
+    """
+    files = f"{path}/type=*/*/*.parquet"
+    return {
+        name: duckdb.sql(f"""
+            SELECT count(*), count(*) FILTER (bloom_filter_excludes)
+            FROM parquet_bloom_probe('{files}', '{column}', '{value}')
+        """).fetchall()[0]
+        for name, (column, value) in LOOKUPS.items()
+    }
+
+
+def measure_lookups(repeat: int) -> list[tuple[str, int, int, float]]:
+    """
+    Runs in a fresh process with DUCKDB_FILENAME pointing at the dataset under test,
+    parquet_queries reads it when it is imported. Reads are taken from DuckDB's
+    file system log of the first run, over httpfs each one is a range request.
+    """
+    from app.services.health import parquet_queries
+
+    duckdb.sql("CALL enable_logging('FileSystem')")
+    results = []
+    for name, (column, value) in LOOKUPS.items():
+
+        def run(column: str = column, value: str = value) -> None:
+            if column == "textValue":
+                parquet_queries.search_values_from_duckdb(None, value)
+            else:
+                source = parquet_queries.records_source()
+                duckdb.sql(f"SELECT * FROM {source} WHERE {column} = '{value}'").fetchall()
+
+        duckdb.sql("CALL truncate_duckdb_logs()")
+        run()
+        reads, read_bytes = duckdb.sql("""
+            SELECT count(*), coalesce(sum(bytes), 0)
+            FROM duckdb_logs_parsed('FileSystem') WHERE op = 'READ'
+        """).fetchall()[0]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        results.append((name, reads, read_bytes, statistics.median(timings)))
+    return results
+
+
+@contextlib.contextmanager
+def serve(path: Path, port: int) -> Generator[str, None, None]:
+    """
+    Hosts the dataset with tests/fileserver.py for the httpfs mode
+    """
+    server = subprocess.Popen(
+        [sys.executable, str(FILESERVER), "-p", str(port)],
+        cwd=path,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://localhost:{port}"
+    try:
+        for _ in range(100):
+            with contextlib.suppress(URLError, ConnectionError):
+                urlopen(f"{url}/{MANIFEST_FILENAME}").close()
+                break
+            time.sleep(0.1)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+parser = argparse.ArgumentParser(
+    prog="Parquet lookups benchmark",
+    description="Compare point lookups on the Parquet dataset with and without Bloom filters",
+)
+parser.add_argument("-n", "--records", type=int, default=1_000_000, help="Synthetic records")
+parser.add_argument("--repeat", type=int, default=20, help="Runs per query, the median is shown")
+parser.add_argument("--xml", type=Path, default=None, help="Use an existing export instead")
+parser.add_argument(
+    "--remote",
+    action="store_true",
+    help="Also query the datasets over http through tests/fileserver.py (needs httpfs)",
+)
+parser.add_argument("-p", "--port", type=int, default=8080, help="Port of the file server")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = args.xml or write_export(Path(tmp) / "export.xml", args.records)
+        datasets = {
+            "stats only": export_dataset(xml_path, Path(tmp) / "plain", bloom_filters=False),
+            "bloom+index": export_dataset(xml_path, Path(tmp) / "bloom", bloom_filters=True),
+        }
+        print(f"{'layout':<12} {'mode':<7} {'lookup':<18} {'row groups skipped':>19}", end=" ")
+        print(f"{'reads':>6} {'KiB read':>9} {'ms':>8}")
+        for layout, path in datasets.items():
+            size = sum(file.stat().st_size for file in path.rglob("*.parquet"))
+            print(f"{layout}: {size / 1024 / 1024:.2f} MiB on disk")
+            pruned = pruned_row_groups(path)
+            modes = {"local": contextlib.nullcontext(str(path))}
+            if args.remote:
+                modes["httpfs"] = serve(path, args.port)
+            for mode, location in modes.items():
+                with location as root:
+                    os.environ["DUCKDB_FILENAME"] = root
+                    with context.Pool(1) as pool:
+                        results = pool.apply(measure_lookups, (args.repeat,))
+                for name, reads, read_bytes, latency in results:
+                    total, excluded = pruned[name]
+                    print(
+                        f"{layout:<12} {mode:<7} {name:<18} {f'{excluded}/{total}':>19}"
+                        f" {reads:>6} {read_bytes / 1024:>9.1f} {latency * 1000:>8.2f}",
+                    )
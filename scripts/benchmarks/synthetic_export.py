@@ -0,0 +1,145 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+RECORD_TYPES: dict[str, tuple[str, float, float]] = {
+    "HKQuantityTypeIdentifierHeartRate": ("count/min", 45.0, 180.0),
+    "HKQuantityTypeIdentifierStepCount": ("count", 1.0, 400.0),
+    "HKQuantityTypeIdentifierActiveEnergyBurned": ("Cal", 0.1, 20.0),
+    "HKQuantityTypeIdentifierBasalEnergyBurned": ("Cal", 0.5, 5.0),
+    "HKQuantityTypeIdentifierDistanceWalkingRunning": ("km", 0.001, 0.5),
+    "HKQuantityTypeIdentifierBodyMass": ("kg", 60.0, 90.0),
+    "HKQuantityTypeIdentifierEnvironmentalAudioExposure": ("dBASPL", 30.0, 95.0),
+}
+SLEEP_VALUES: tuple[str, ...] = (
+    "HKCategoryValueSleepAnalysisInBed",
+    "HKCategoryValueSleepAnalysisAsleepCore",
+    "HKCategoryValueSleepAnalysisAsleepDeep",
+    "HKCategoryValueSleepAnalysisAsleepREM",
+)
+SOURCES: tuple[tuple[str, str, str], ...] = (
+    ("Rob’s Apple Watch", "8.5", "<<HKDevice: 0x283ac1e50>, name:Apple Watch, model:Watch>"),
+    ("Rob’s iPhone", "15.4.1", "<<HKDevice: 0x283ac2f80>, name:iPhone, model:iPhone>"),
+    ("Polar Flow", "5.8.0", ""),
+)
+WORKOUT_TYPES: tuple[str, ...] = (
+    "HKWorkoutActivityTypeRunning",
+    "HKWorkoutActivityTypeWalking",
+    "HKWorkoutActivityTypeCycling",
+)
+METADATA_ENTRY: str = '  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="0"/>\n'
+HEADER: str = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation|Workout|ActivitySummary)*)>
+<!ATTLIST Record
+  type          CDATA #REQUIRED
+  unit          CDATA #IMPLIED
+  value         CDATA #IMPLIED
+>
+]>
+<HealthData locale="en_US">
+ <ExportDate value="2022-05-01 10:00:00 -0400"/>
+ <Me HKCharacteristicTypeIdentifierBiologicalSex="HKBiologicalSexMale"/>
+"""
+
+
+def _date(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d %H:%M:%S -0400")
+
+
+def _attributes(**attributes: str) -> str:
+    return " ".join(f"{key}={quoteattr(value)}" for key, value in attributes.items() if value)
+
+
+def write_export(path: Path, records: int, seed: int = 42) -> Path:
+    """
+    Writes an Apple Health-like export.xml with the given number of records,
+    including metadata children, blood pressure correlations and workouts with statistics.
+    Samples are synced in batches, so creationDate repeats like in real exports.
+    """
+    rng = random.Random(seed)
+    moment = datetime(2016, 1, 1)
+    with path.open("w", encoding="utf-8") as file:
+        file.write(HEADER)
+        for index in range(records):
+            moment += timedelta(seconds=rng.randint(10, 600))
+            synced = _date(moment.replace(minute=0, second=0) + timedelta(hours=1))
+            source, version, device = SOURCES[index % len(SOURCES)]
+            if index % 10 == 9:
+                record_type = "HKCategoryTypeIdentifierSleepAnalysis"
+                unit, value = "", rng.choice(SLEEP_VALUES)
+            else:
+                record_type = rng.choice(list(RECORD_TYPES))
+                unit, low, high = RECORD_TYPES[record_type]
+                value = f"{rng.uniform(low, high):.4g}"
+            attributes = _attributes(
+                type=record_type,
+                sourceName=source,
+                sourceVersion=version,
+                device=device,
+                unit=unit,
+                creationDate=synced,
+                startDate=_date(moment),
+                endDate=_date(moment + timedelta(seconds=rng.randint(0, 300))),
+                value=value,
+            )
+            if index % 4 == 0:
+                file.write(f" <Record {attributes}>\n")
+                file.write(METADATA_ENTRY)
+                file.write(" </Record>\n")
+            else:
+                file.write(f" <Record {attributes}/>\n")
+
+            if index % 2_000 == 0:
+                bounds = _attributes(
+                    creationDate=synced,
+                    startDate=_date(moment),
+                    endDate=_date(moment),
+                )
+                file.write(
+                    f' <Correlation type="HKCorrelationTypeIdentifierBloodPressure"'
+                    f' sourceName="Omron" {bounds}>\n'
+                    f'  <Record type="HKQuantityTypeIdentifierBloodPressureSystolic"'
+                    f' sourceName="Omron" unit="mmHg" {bounds} value="{rng.randint(105, 140)}"/>\n'
+                    f'  <Record type="HKQuantityTypeIdentifierBloodPressureDiastolic"'
+                    f' sourceName="Omron" unit="mmHg" {bounds} value="{rng.randint(65, 90)}"/>\n'
+                    f" </Correlation>\n",
+                )
+            if index % 1_000 == 0:
+                end = moment + timedelta(minutes=rng.randint(20, 90))
+                span = _attributes(startDate=_date(moment), endDate=_date(end))
+                file.write(
+                    f" <Workout {_attributes(workoutActivityType=rng.choice(WORKOUT_TYPES))}"
+                    f' duration="{(end - moment).seconds / 60:.2f}" durationUnit="min"'
+                    f' sourceName="{SOURCES[0][0]}" creationDate="{_date(end)}" {span}>\n'
+                    f'  <WorkoutEvent type="HKWorkoutEventTypeSegment" date="{_date(moment)}"/>\n'
+                    f'  <WorkoutStatistics type="HKQuantityTypeIdentifierActiveEnergyBurned"'
+                    f' {span} sum="{rng.uniform(100, 900):.2f}" unit="Cal"/>\n'
+                    f'  <WorkoutStatistics type="HKQuantityTypeIdentifierHeartRate" {span}'
+                    f' average="{rng.uniform(110, 160):.1f}" minimum="95" maximum="182"'
+                    f' unit="count/min"/>\n'
+                    f" </Workout>\n",
+                )
+                file.write(
+                    f' <ActivitySummary dateComponents="{moment.date()}"'
+                    f' activeEnergyBurned="{rng.uniform(200, 900):.1f}"'
+                    f' activeEnergyBurnedUnit="Cal"/>\n',
+                )
+        file.write("</HealthData>\n")
+    return path
+
+
+parser = argparse.ArgumentParser(
+    prog="Synthetic Apple Health export",
+    description="Generate an Apple Health-like export.xml for benchmarks",
+)
+parser.add_argument("output", type=Path, help="Path of the generated XML file")
+parser.add_argument("-n", "--records", type=int, default=100_000, help="Number of records")
+parser.add_argument("--seed", type=int, default=42, help="Random seed")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    write_export(args.output, args.records, args.seed)
+    print(f"Wrote {args.records} records to {args.output}")
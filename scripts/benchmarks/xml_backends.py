@@ -0,0 +1,85 @@
+import argparse
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from app.services.xml_backends import BACKENDS, get_backend
+from app.utils.config_utils import XMLParserBackend
+from scripts.benchmarks.synthetic_export import write_export
+
+TAGS: tuple[str, ...] = ("Record", "Workout", "WorkoutStatistics")
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_backend(backend: XMLParserBackend, source: Path, mode: str) -> tuple[int, float, float]:
+    """
+    Runs in a fresh process so that peak RSS is measured for this backend alone
+    """
+    start = time.perf_counter()
+    if mode == "elements":
+        elements = sum(1 for _ in get_backend(backend).iter_elements(source, TAGS))
+    else:
+        from scripts.xml_exporter import XMLExporter
+
+        exporter = XMLExporter()
+        exporter.backend = get_backend(backend)
+        elements = sum(chunk.batch.num_rows for chunk in exporter.iter_batches(source))
+    return elements, time.perf_counter() - start, peak_rss_mb()
+
+
+parser = argparse.ArgumentParser(
+    prog="XML backend benchmark",
+    description="Compare records/sec and peak memory of the XML parser backends",
+)
+parser.add_argument("-n", "--records", type=int, default=500_000, help="Synthetic records")
+parser.add_argument("--xml", type=Path, default=None, help="Use an existing export instead")
+parser.add_argument(
+    "--zip",
+    action="store_true",
+    help="Also parse the export streamed from a deflated export.zip",
+)
+parser.add_argument(
+    "--mode",
+    choices=("elements", "batches"),
+    default="elements",
+    help="Only stream elements, or build full XMLExporter record batches",
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = args.xml or write_export(Path(tmp) / "export.xml", args.records)
+        sources = [xml_path]
+        if args.zip:
+            sources.append(Path(tmp) / "export.zip")
+            with zipfile.ZipFile(sources[-1], "w", zipfile.ZIP_DEFLATED) as archive:
+                archive.write(xml_path, "apple_health_export/export.xml")
+        size_mb = xml_path.stat().st_size / (1024 * 1024)
+        print(f"{xml_path} ({size_mb:.1f} MB), mode: {args.mode}")
+        print(
+            f"{'backend':<8} {'source':<6} {'elements':>10} {'seconds':>8} "
+            f"{'elements/s':>12} {'peak MB':>8}",
+        )
+        for backend in BACKENDS:
+            for source in sources:
+                with context.Pool(1) as pool:
+                    try:
+                        result = pool.apply(run_backend, (backend, source, args.mode))
+                    except ImportError as e:
+                        print(f"{backend.value:<8} skipped: {e}")
+                        break
+                elements, elapsed, peak = result
+                print(
+                    f"{backend.value:<8} {source.suffix[1:]:<6} {elements:>10,} {elapsed:>8.2f} "
+                    f"{elements / elapsed:>12,.0f} {peak:>8.1f}",
+                )
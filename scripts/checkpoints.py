@@ -0,0 +1,62 @@
+import dataclasses
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Self
+
+# bytes before a checkpoint offset that are hashed to recognise the file on resume
+DIGEST_WINDOW: int = 64 * 1024
+
+
+def source_digest(path: Path, offset: int) -> str:
+    """
+    blake2b of the file size and the bytes just before offset, cheap to recompute
+    and different for another export or a file that changed before the offset
+    """
+    digest = hashlib.blake2b(str(path.stat().st_size).encode(), digest_size=16)
+    with path.open("rb") as file:
+        start = max(offset - DIGEST_WINDOW, 0)
+        file.seek(start)
+        digest.update(file.read(offset - start))
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """
+    Progress of an import that is committed up to a top-level element of the XML file.
+    Resuming parses from offset, numbers workouts after workout_base + workouts
+    and drops the rows a table holds beyond rows, written after the checkpoint was saved.
+    """
+
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    # byte offset of the first element that is not imported
+    offset: int = 0
+    # segments are split from multiples of segment_size, see split_segments
+    segment_size: int = 0
+    # workouts numbered by this import, ids start after workout_base
+    workouts: int = 0
+    workout_base: int = 0
+    rows: dict[str, int] = field(default_factory=dict)
+    digest: str = ""
+
+    def save(self, path: Path) -> None:
+        temporary = path.with_name(f"{path.name}.tmp")
+        temporary.write_text(json.dumps(dataclasses.asdict(self)))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: Path, xml_path: Path) -> Self:
+        if not path.exists():
+            raise SystemExit(f"No checkpoint at {path}, there is no import to resume")
+        checkpoint = cls(**json.loads(path.read_text()))
+        if checkpoint.digest != source_digest(xml_path, checkpoint.offset):
+            raise SystemExit(f"{xml_path} is not the file the checkpoint at {path} was taken of")
+        return checkpoint
+
+    def report(self) -> str:
+        rows = ", ".join(f"{count} {table}" for table, count in self.rows.items())
+        return f"resuming at byte {self.offset} with {rows or 'no rows'} committed"
@@ -1,65 +1,337 @@
+import argparse
+import dataclasses
+import json
+import uuid
+from collections.abc import Iterable
+from pathlib import Path
 from sys import stderr
 
+from app.config import settings
 from app.services.ch_client import CHClient
-from scripts.xml_exporter import XMLExporter
+from app.services.health.import_summary import SUMMARY_TABLES, ImportSummary
+from app.services.health.sql_helpers import ROLLUP_GRAINS, ROLLUP_TABLE, SUMMARY_TABLE
+from scripts.checkpoints import Checkpoint
+from scripts.incremental import IncrementalFilter
+from scripts.xml_exporter import TableBatch, XMLExporter
 
 
 class CHIndexer(XMLExporter, CHClient):
-    def __init__(self):
-        XMLExporter.__init__(self)
+    # inserts whose deduplication token is remembered per table, covers the inserts
+    # of a segment that was written again after resuming from the checkpoint before it
+    DEDUPLICATION_WINDOW: int = 1000
+
+    def __init__(self, workers: int = 1):
+        XMLExporter.__init__(self, workers)
         CHClient.__init__(self)
         self.ch_session.query(f"CREATE DATABASE IF NOT EXISTS {self.db_name}")
 
     def create_table(self) -> None:
         """
-        Create a new table for exported xml health data
+        Create a new table for exported xml health data,
+        the low cardinality string columns are dictionary encoded by ClickHouse
         """
         self.ch_session.query(f"""
                    CREATE TABLE IF NOT EXISTS {self.db_name}.{self.table_name}
                    (
-                       type String,
-                       sourceVersion String,
-                       sourceName String,
-                       device String,
+                       type LowCardinality(String),
+                       sourceVersion LowCardinality(String),
+                       sourceName LowCardinality(String),
+                       device LowCardinality(String),
                        startDate DateTime,
                        endDate DateTime,
                        creationDate DateTime,
-                       unit String,
+                       unit LowCardinality(String),
                        value Float32,
                        textvalue String,
                    )
                        ENGINE = MergeTree
-                       ORDER BY startDate
+                       ORDER BY (type, startDate)
+                        """)
+        # workouts and their statistics share the integer workout_id key,
+        # stats are sorted on it so joins and lookups by workout read contiguous ranges
+        self.ch_session.query(f"""
+                   CREATE TABLE IF NOT EXISTS {self.db_name}.workouts
+                   (
+                       workout_id UInt64,
+                       type LowCardinality(String),
+                       duration Float64,
+                       durationUnit LowCardinality(String),
+                       sourceName LowCardinality(String),
+                       startDate DateTime,
+                       endDate DateTime,
+                       creationDate DateTime,
+                   )
+                       ENGINE = MergeTree
+                       ORDER BY workout_id
+                        """)
+        self.ch_session.query(f"""
+                   CREATE TABLE IF NOT EXISTS {self.db_name}.stats
+                   (
+                       workout_id UInt64,
+                       type LowCardinality(String),
+                       startDate DateTime,
+                       endDate DateTime,
+                       sum Float64,
+                       average Float64,
+                       maximum Float64,
+                       minimum Float64,
+                       unit LowCardinality(String),
+                   )
+                       ENGINE = MergeTree
+                       ORDER BY (workout_id, type)
+                        """)
+
+        self.ch_session.query(f"""
+                   CREATE TABLE IF NOT EXISTS {self.db_name}.{ROLLUP_TABLE}
+                   (
+                       grain LowCardinality(String),
+                       type LowCardinality(String),
+                       sourceName LowCardinality(String),
+                       unit LowCardinality(String),
+                       period DateTime,
+                       sample_count UInt64,
+                       value_sum Float64,
+                       value_min Float64,
+                       value_max Float64,
+                   )
+                       ENGINE = MergeTree
+                       ORDER BY (grain, type, period)
+                        """)
+        self.ch_session.query(f"""
+                   CREATE TABLE IF NOT EXISTS {self.db_name}.{SUMMARY_TABLE}
+                   (
+                       table LowCardinality(String),
+                       type LowCardinality(String),
+                       count UInt64,
+                       start_date Nullable(DateTime),
+                       end_date Nullable(DateTime),
+                       sources Array(String),
+                       units Array(String),
+                       value_min Nullable(Float64),
+                       value_max Nullable(Float64),
+                   )
+                       ENGINE = MergeTree
+                       ORDER BY (table, type)
+                        """)
+        # tables created before checkpoints existed get the setting as well
+        for table in ("records", "workouts", "stats"):
+            self.ch_session.query(f"""
+                       ALTER TABLE {self.target_table(table)} MODIFY SETTING
+                       non_replicated_deduplication_window = {self.DEDUPLICATION_WINDOW}
                         """)
 
-    def index_data(self) -> bool:
-        for docs in self.parse_xml():
-            try:
-                self.ch_session.query(f"""
-                           INSERT INTO {self.db_name}.{self.table_name}
-                           SELECT *
-                           FROM Python(docs)
-                           """)
-            except RuntimeError as e:
-                print(f"Failed to insert {len(docs)} records")
-                print(e, file=stderr)
+    def build_rollups(self) -> None:
+        """
+        Recomputes daily aggregates per (type, sourceName, unit) from the records table,
+        the weekly, monthly and yearly rollups are derived from the daily rows
+        """
+        rollup = f"{self.db_name}.{ROLLUP_TABLE}"
+        self.ch_session.query(f"TRUNCATE TABLE {rollup}")
+        self.ch_session.query(f"""
+                   INSERT INTO {rollup}
+                   SELECT 'day', type, sourceName, unit, toStartOfDay(startDate) AS period,
+                   count(), sum(value), min(value), max(value)
+                   FROM {self.db_name}.{self.table_name}
+                   GROUP BY type, sourceName, unit, period
+                   """)
+        for grain in ROLLUP_GRAINS:
+            if grain == "day":
+                continue
+            self.ch_session.query(f"""
+                       INSERT INTO {rollup}
+                       SELECT '{grain}', type, sourceName, unit,
+                       toStartOfInterval(period, INTERVAL 1 {grain}) AS bucket,
+                       sum(sample_count), sum(value_sum), min(value_min), max(value_max)
+                       FROM {rollup} WHERE grain = 'day'
+                       GROUP BY type, sourceName, unit, bucket
+                       """)
+
+    def read_summary(self) -> ImportSummary | None:
+        """
+        Summary of the rows in the tables, None when they changed after it was written
+        """
+        summary = self.ch_session.query(
+            f"""SELECT * REPLACE (
+            formatDateTime(start_date, '%FT%T+00:00', 'UTC') AS start_date,
+            formatDateTime(end_date, '%FT%T+00:00', 'UTC') AS end_date)
+            FROM {self.db_name}.{SUMMARY_TABLE}""",
+            "JSONEachRow",
+        )
+        rows = [json.loads(line) for line in str(summary).splitlines() if line]
+        result = ImportSummary.from_rows(rows)
+        for table in SUMMARY_TABLES:
+            count = self.query_value(f"SELECT count() FROM {self.target_table(table)}")
+            if result.total(table) != count:
+                return None
+        return result
+
+    def write_summary(self, previous: ImportSummary | None) -> None:
+        """
+        Replaces the stored summary with the one of previous and the imported rows,
+        without a complete summary get_health_summary aggregates the tables instead
+        """
+        summary = None
+        if self.summary is not None and previous is not None:
+            summary = ImportSummary.merged(previous, self.summary)
+        self.ch_session.query(f"TRUNCATE TABLE {self.db_name}.{SUMMARY_TABLE}")
+        if summary is not None:
+            types = summary.to_arrow()
+            self.ch_session.query(f"""
+                       INSERT INTO {self.db_name}.{SUMMARY_TABLE}
+                       SELECT *
+                       FROM Python(types)
+                       """)
+            print(f"Summarised {types.num_rows} record and workout types")
+
+    @property
+    def state_path(self) -> Path:
+        return Path(settings.CH_DIRNAME) / f"{self.db_name}.import-state.npz"
+
+    def query_value(self, query: str) -> int:
+        return int(str(self.ch_session.query(query, "CSV")).strip() or 0)
+
+    def target_table(self, table: str) -> str:
+        if table == "records":
+            return f"{self.db_name}.{self.table_name}"
+        return f"{self.db_name}.{table}"
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return Path(settings.CH_DIRNAME) / f"{self.db_name}.checkpoint.json"
+
+    def start_checkpoint(self, resume: bool) -> Checkpoint:
+        if resume:
+            checkpoint = Checkpoint.load(self.checkpoint_path, self.xml_path)
+            print(checkpoint.report())
+            return checkpoint
+        self.checkpoint_path.unlink(missing_ok=True)
+        # appended workouts are numbered after the ones already in the table
+        last_workout = self.query_value(f"SELECT max(workout_id) FROM {self.db_name}.workouts")
+        return Checkpoint(workout_base=last_workout)
+
+    def index_data(self, resume: bool = False) -> bool:
+        """
+        Inserts the parsed batches, imports of an extracted XML file save a checkpoint
+        after every segment. Every insert carries a deduplication token of the import,
+        the segment and its position in it, so the inserts of a segment that was cut short
+        are skipped when resuming writes that segment again.
+        """
+        if resume and not self.can_checkpoint:
+            raise SystemExit("Only regular imports of an extracted XML file can be resumed")
+        checkpoint = self.start_checkpoint(resume)
+        if self.can_checkpoint:
+            batches = self.iter_checkpointed_batches(checkpoint)
+        else:
+            batches = (
+                self.offset_workout_ids(chunk, checkpoint.workout_base)
+                for chunk in self.parse_xml_batches()
+            )
+        rows = {table: checkpoint.rows.get(table, 0) for table in self.dictionaries}
+        inserts = dict.fromkeys(rows, 0)
+        for item in batches:
+            if isinstance(item, Checkpoint):
+                checkpoint = dataclasses.replace(item, rows=rows.copy())
+                checkpoint.save(self.checkpoint_path)
+                inserts = dict.fromkeys(rows, 0)
+                continue
+            table, docs = item
+            if not docs.num_rows:
+                continue
+            token = f"{checkpoint.run_id}-{checkpoint.offset}-{table}-{inserts[table]}"
+            if not self.insert_batch(TableBatch(table, docs), token):
                 return False
+            rows[table] += docs.num_rows
+            inserts[table] += 1
         return True
 
-    def run(self) -> bool:
+    def import_batches(self, batches: Iterable[TableBatch]) -> None:
         """
-        Creates a new table in the database and populates it with data from the XML file provided
+        Appends batches parsed by another exporter, such as the fan-out importer,
+        and rebuilds the rollups and the summary. The summary has to be complete
+        by the time batches is exhausted.
+        """
+        self.create_table()
+        previous = self.read_summary()
+        last_workout = self.query_value(f"SELECT max(workout_id) FROM {self.db_name}.workouts")
+        run_id = uuid.uuid4().hex
+        for index, chunk in enumerate(batches):
+            chunk = self.offset_workout_ids(chunk, last_workout)
+            if chunk.batch.num_rows and not self.insert_batch(chunk, f"{run_id}-{index}"):
+                raise RuntimeError(f"Failed to insert into {self.target_table(chunk.table)}")
+        self.build_rollups()
+        self.write_summary(previous)
+
+    def insert_batch(self, chunk: TableBatch, token: str) -> bool:
+        docs = chunk.batch
+        try:
+            self.ch_session.query(f"""
+                       INSERT INTO {self.target_table(chunk.table)}
+                       SETTINGS insert_deduplication_token = '{token}'
+                       SELECT *
+                       FROM Python(docs)
+                       """)
+        except RuntimeError as e:
+            print(f"Failed to insert {docs.num_rows} {chunk.table}")
+            print(e, file=stderr)
+            return False
+        return True
+
+    def run(self, resume: bool = False) -> bool:
+        """
+        Creates a new table in the database and populates it with data from the XML file provided,
+        resume continues a failed import from its last checkpoint
         """
         self.create_table()
         print(f"Created table {self.db_name}.{self.table_name}")
-        result: bool = self.index_data()
+        previous = self.read_summary()
+        result: bool = self.index_data(resume)
         if result:
+            self.build_rollups()
+            self.write_summary(previous)
+            self.checkpoint_path.unlink(missing_ok=True)
+            print(f"memory: {self.memory_report()}")
+            if self.incremental is not None:
+                self.incremental.commit()
+                print(f"incremental: {self.incremental.report()}")
             print("Inserted data into chdb correctly")
             return True
         print("Error during data indexing")
         return False
 
 
+parser = argparse.ArgumentParser(
+    prog="ClickHouse importer",
+    description="Import Apple Health XML data into a chdb database",
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="Number of processes parsing the XML file in parallel",
+    default=1,
+    dest="workers",
+    action="store",
+)
+parser.add_argument(
+    "--incremental",
+    help="Only append the elements that are not in the database yet",
+    dest="incremental",
+    action="store_true",
+)
+parser.add_argument(
+    "--resume",
+    help="Continue a failed import from its last checkpoint",
+    dest="resume",
+    action="store_true",
+)
+
 if __name__ == "__main__":
-    ch = CHIndexer()
-    ch.run()
+    args = parser.parse_args()
+    if args.resume and args.incremental:
+        parser.error("--resume continues a regular import, not an incremental one")
+    ch = CHIndexer(workers=args.workers)
+    if args.incremental:
+        ch.create_table()
+        records = ch.query_value(f"SELECT count() FROM {ch.db_name}.{ch.table_name}")
+        ch.incremental = IncrementalFilter.for_target(ch.state_path, records > 0)
+    ch.run(resume=args.resume)
@@ -0,0 +1,115 @@
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from functools import lru_cache
+
+import numpy as np
+import pyarrow as pa
+
+APPLE_DATE_FORMAT: str = "%Y-%m-%d %H:%M:%S %z"
+# "2022-04-29 05:49:44 -0400"
+APPLE_DATE_LENGTH: int = 25
+DATE_CACHE_SIZE: int = 65_536
+
+_SEPARATORS: dict[int, int] = {4: ord("-"), 7: ord("-"), 10: ord(" "), 13: ord(":"), 16: ord(":")}
+_DIGITS: tuple[int, ...] = (0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18, 21, 22, 23, 24)
+_PLACEHOLDER: str = "1970-01-01 00:00:00 +0000"
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(value: str) -> datetime:
+    """
+    Parses a single Apple Health date string.
+    Exports repeat the same timestamps a lot (creationDate especially),
+    so results are kept in a bounded cache keyed on the raw string.
+    """
+    return datetime.strptime(value, APPLE_DATE_FORMAT)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def to_isoformat(value: str) -> str:
+    return parse_date(value).isoformat()
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def to_utc_isoformat(value: str) -> str:
+    """
+    Moves an ISO 8601 date to UTC, so dates of different offsets compare as strings
+    """
+    return datetime.fromisoformat(value).astimezone(UTC).isoformat()
+
+
+def _slice_number(digits: np.ndarray, start: int, stop: int) -> np.ndarray:
+    number = np.zeros(len(digits), dtype=np.int64)
+    for position in range(start, stop):
+        number = number * 10 + digits[:, position]
+    return number
+
+
+def _days_from_civil(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    # proleptic gregorian date -> days since 1970-01-01
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146_097 + day_of_era - 719_468
+
+
+def parse_dates(values: Sequence[str | None]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parses a whole column of Apple Health date strings at once.
+    Returns UTC epoch seconds (int64), UTC offsets in minutes (int16)
+    and a mask of missing values. Strings that do not follow the fixed-width
+    export format go through the cached parse_date instead.
+    """
+    missing = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    raw = np.array([_PLACEHOLDER if value is None else value for value in values], dtype=str)
+    epoch = np.zeros(len(values), dtype=np.int64)
+    offset = np.zeros(len(values), dtype=np.int16)
+    if not len(values):
+        return epoch, offset, missing
+
+    # fixed-width unicode array viewed as a (rows, characters) matrix of code points
+    width = max(raw.dtype.itemsize // 4, APPLE_DATE_LENGTH)
+    chars = raw.astype(f"U{width}").view(np.uint32).reshape(len(values), width)
+    chars = chars[:, :APPLE_DATE_LENGTH].astype(np.int64)
+    digits = chars - ord("0")
+
+    valid = np.char.str_len(raw) == APPLE_DATE_LENGTH
+    valid &= ((digits[:, _DIGITS] >= 0) & (digits[:, _DIGITS] <= 9)).all(axis=1)
+    for position, separator in _SEPARATORS.items():
+        valid &= chars[:, position] == separator
+    valid &= (chars[:, 19] == ord(" ")) & np.isin(chars[:, 20], (ord("+"), ord("-")))
+
+    days = _days_from_civil(
+        _slice_number(digits, 0, 4),
+        _slice_number(digits, 5, 7),
+        _slice_number(digits, 8, 10),
+    )
+    seconds = (
+        _slice_number(digits, 11, 13) * 3600
+        + _slice_number(digits, 14, 16) * 60
+        + _slice_number(digits, 17, 19)
+    )
+    sign = np.where(chars[:, 20] == ord("-"), -1, 1)
+    minutes = sign * (_slice_number(digits, 21, 23) * 60 + _slice_number(digits, 23, 25))
+
+    epoch[:] = days * 86_400 + seconds - minutes * 60
+    offset[:] = minutes
+
+    for index in np.flatnonzero(~valid):
+        parsed = parse_date(str(raw[index]))
+        utcoffset = parsed.utcoffset()
+        epoch[index] = int(parsed.timestamp())
+        offset[index] = int(utcoffset.total_seconds() // 60) if utcoffset else 0
+
+    return epoch, offset, missing
+
+
+def to_timestamp_array(values: Sequence[str | None], type_: pa.DataType) -> pa.Array:
+    """
+    Converts a column of date strings into an Arrow timestamp array of the given type
+    """
+    epoch, _, missing = parse_dates(values)
+    scale = {"s": 1, "ms": 1_000, "us": 1_000_000, "ns": 1_000_000_000}[type_.unit]
+    return pa.array(epoch * scale, type=type_, mask=missing)
@@ -1,29 +1,159 @@
+import argparse
+import dataclasses
+import itertools
+import json
 import os
+import shutil
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+from typing import Any
+from urllib.parse import quote
 
 import duckdb
-import pandas as pd
-import polars as pl
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 
+from app.config import settings
 from app.services.duckdb_client import DuckDBClient
-from scripts.xml_exporter import XMLExporter
+from app.services.health.import_summary import SUMMARY_TABLES, ImportSummary
+from app.services.health.parquet_dataset import (
+    HIVE_NULL_PARTITION,
+    MANIFEST_FILENAME,
+    PARTITION_COLUMNS,
+    STATS_FILENAME,
+    WORKOUTS_FILENAME,
+    partition_values,
+)
+from app.services.health.sql_helpers import (
+    ROLLUP_GRAINS,
+    ROLLUP_TABLE,
+    SUMMARY_TABLE,
+    enum_name,
+)
+from app.services.xml_backends import is_zip_source
+from scripts.checkpoints import Checkpoint
+from scripts.incremental import IncrementalFilter
+from scripts.parquet_writer import ParquetDatasetWriter, ParquetOptions
+from scripts.pipeline import run_pipeline
+from scripts.xml_exporter import TableBatch, XMLExporter
 
 
 class ParquetImporter(XMLExporter, DuckDBClient):
-    def __init__(self):
-        XMLExporter.__init__(self)
+    def __init__(self, workers: int = 1):
+        XMLExporter.__init__(self, workers)
         DuckDBClient.__init__(self)
+        self.queue_depth: int = settings.IMPORT_QUEUE_DEPTH
+        # the pipeline queue and the chunk being written
+        self.queued_chunks = self.queue_depth + 1
+        self.row_group_size: int = settings.DUCKDB_ROW_GROUP_SIZE
+        self.parquet_options: ParquetOptions = ParquetOptions.from_settings()
 
-    chunk_files = []
+    # physical row order of every table, rows of one type are stored in date order
+    # so min/max zone maps let filtered scans skip the row groups of other types and dates,
+    # row groups smaller than DuckDB's default make the skipping finer grained
+    SORT_KEYS: dict[str, tuple[str, ...]] = {
+        "records": ("type", "startDate"),
+        "workouts": ("type", "startDate"),
+        "stats": ("workout_id", "type"),
+    }
 
-    def export_xml(self) -> None:
+    @property
+    def staging_path(self) -> Path:
+        return Path(self.path).with_name(f"{Path(self.path).name}.staging")
+
+    @property
+    def state_path(self) -> Path:
+        return Path(self.path).with_name(f"{Path(self.path).name}.import-state.npz")
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return Path(self.path).with_name(f"{Path(self.path).name}.checkpoint.json")
+
+    def export_xml(self, resume: bool = False) -> None:
         """
         Export xml data from Apple Health export file
-        to a .duckdb database with path specified by user
+        to a .duckdb database with path specified by user.
+        Rows are appended in XML order to a staging database first,
+        then finalize writes the sorted and dictionary encoded tables.
+        A checkpoint is saved next to the database after every segment of the XML file,
+        a failed import keeps its staging database and resume continues from the checkpoint.
+        Incremental imports only stage the new elements and leave the database
+        untouched when there are none.
         """
-        con = duckdb.connect(str(self.path))
+        if resume:
+            if not self.can_checkpoint:
+                raise SystemExit("Only regular imports of an extracted XML file can be resumed")
+            checkpoint = Checkpoint.load(self.checkpoint_path, self.xml_path)
+            if not self.staging_path.exists():
+                raise SystemExit(f"The staging database {self.staging_path} is gone, start over")
+            con = duckdb.connect(str(self.staging_path))
+            self.restore_checkpoint(con, checkpoint)
+            print(checkpoint.report())
+        else:
+            self.staging_path.unlink(missing_ok=True)
+            self.checkpoint_path.unlink(missing_ok=True)
+            con = duckdb.connect(str(self.staging_path))
+            self.create_staging_tables(con)
+            checkpoint = Checkpoint()
+
+        batches: Iterable[TableBatch | Checkpoint] = self.parse_xml_batches()
+        if self.can_checkpoint:
+            batches = self.iter_checkpointed_batches(checkpoint)
+        elif is_zip_source(self.xml_path):
+            print("Checkpoints need an extracted XML file, a failed import of the zip starts over")
+        rows = {table: checkpoint.rows.get(table, 0) for table in self.dictionaries}
+        docs_count = 0
+
+        def write(item: TableBatch | Checkpoint) -> None:
+            nonlocal docs_count
+            if isinstance(item, Checkpoint):
+                dataclasses.replace(item, rows=rows.copy()).save(self.checkpoint_path)
+                return
+            self.write_batch(con, item)
+            rows[item.table] += item.batch.num_rows
+            docs_count += item.batch.num_rows
+            print(f"processed {docs_count} docs")
+
+        try:
+            # parsing runs in a background thread while DuckDB inserts the previous chunks
+            stats = run_pipeline(batches, write, self.queue_depth)
+            print(f"pipeline: {stats.report()}")
+            print(f"memory: {self.memory_report()}")
+            if self.incremental is not None:
+                print(f"incremental: {self.incremental.report()}")
+            if docs_count or resume or not Path(self.path).exists():
+                self.finalize(con)
+            self.checkpoint_path.unlink(missing_ok=True)
+        finally:
+            con.close()
+            # without a checkpoint there is nothing to resume from
+            if not self.checkpoint_path.exists():
+                self.staging_path.unlink(missing_ok=True)
+        if self.incremental is not None:
+            self.incremental.commit()
+
+    def import_batches(self, batches: Iterable[TableBatch]) -> None:
+        """
+        Stages batches parsed by another exporter, such as the fan-out importer,
+        and finalizes the database. The dictionaries have to be complete
+        by the time batches is exhausted.
+        """
+        self.staging_path.unlink(missing_ok=True)
+        con = duckdb.connect(str(self.staging_path))
+        try:
+            self.create_staging_tables(con)
+            for chunk in batches:
+                self.write_batch(con, chunk)
+            self.finalize(con)
+        finally:
+            con.close()
+            self.staging_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def create_staging_tables(con: duckdb.DuckDBPyConnection) -> None:
         con.sql("""
-            CREATE TABLE IF NOT EXISTS records (
+            CREATE TABLE records (
                 type VARCHAR,
                 sourceVersion VARCHAR,
                 sourceName VARCHAR,
@@ -37,7 +167,8 @@ class ParquetImporter(XMLExporter, DuckDBClient):
             );
         """)
         con.sql("""
-            CREATE TABLE IF NOT EXISTS workouts (
+            CREATE TABLE workouts (
+                workout_id BIGINT,
                 type VARCHAR,
                 duration DOUBLE,
                 durationUnit VARCHAR,
@@ -48,7 +179,8 @@ class ParquetImporter(XMLExporter, DuckDBClient):
             )
         """)
         con.sql("""
-            CREATE TABLE IF NOT EXISTS stats (
+            CREATE TABLE stats (
+                workout_id BIGINT,
                 type VARCHAR,
                 startDate TIMESTAMP,
                 endDate TIMESTAMP,
@@ -60,102 +192,316 @@ class ParquetImporter(XMLExporter, DuckDBClient):
             )
         """)
 
-        docs_count = 0
-        for i, docs in enumerate(self.parse_xml(), 1):
-            cols = set(docs.columns)
-            if cols == set(self.RECORD_COLUMNS):
-                con.sql("""
-                    INSERT INTO records SELECT * FROM docs;
-                """)
-            if cols == set(self.WORKOUT_COLUMNS):
-                con.sql("""
-                    INSERT INTO workouts SELECT * FROM docs;
-                """)
-            if cols == set(self.WORKOUT_STATS_COLUMNS):
-                con.sql("""
-                    INSERT INTO stats SELECT * FROM docs;
-                """)
-            print(f"processed {docs_count + len(docs)} docs")
-            docs_count += len(docs)
-
-    def write_to_file(self, index: int, df: pl.DataFrame) -> None:
-        chunk_file: str | Path = ""
-        try:
-            # check for columns specific for each table
-            if "workoutActivityType" in df.columns:
-                chunk_file = Path(f"workouts.chunk_{index}.parquet")
-            elif "type" in df.columns:
-                chunk_file = Path(f"records.chunk_{index}.parquet")
-            elif "sum" in df.columns:
-                chunk_file = Path(f"workout_stats.chunk_{index}.parquet")
-            print(f"processed {index * self.chunk_size} docs")
-            df.write_parquet(chunk_file, compression="zstd", compression_level=1)
-            self.chunk_files.append(chunk_file)
-
-        except Exception:
-            for file in self.chunk_files:
-                os.remove(file)
-            raise RuntimeError(f"Failed to write chunk file to disk: {chunk_file}")
+    def restore_checkpoint(self, con: duckdb.DuckDBPyConnection, checkpoint: Checkpoint) -> None:
+        """
+        Deletes the staged rows that were appended after the checkpoint was saved
+        and collects the dictionaries of the rows before it.
+        Row ids keep insertion order but not their count once rows were deleted,
+        so the first row to drop is looked up by position.
+        """
+        for table, columns in self.dictionaries.items():
+            con.sql(f"""
+                DELETE FROM {table} WHERE rowid >= (
+                    SELECT rowid FROM {table}
+                    ORDER BY rowid LIMIT 1 OFFSET {checkpoint.rows.get(table, 0)}
+                )
+            """)
+            for column, values in columns.items():
+                distinct = con.sql(f'SELECT DISTINCT "{column}" FROM {table}').fetchall()
+                values.update(value for (value,) in distinct if value is not None)
 
-    def export_xml_parquet(self) -> None:
+    def finalize(self, con: duckdb.DuckDBPyConnection) -> None:
+        """
+        Writes the staged tables into a new database file sorted by SORT_KEYS,
+        with the DICTIONARY_COLUMNS stored as ENUMs, and swaps it in place of the old one.
+        Rows of an existing database are carried over, so re-running the import appends.
+        The import summary of the tables is written next to them when it is complete.
+        Writing a fresh file keeps it compact, rewriting tables in place would leave
+        the replaced blocks behind as free space.
+        """
+        path = Path(self.path)
+        output = path.with_name(f"{path.name}.tmp")
+        output.unlink(missing_ok=True)
+        if path.exists():
+            con.sql(f"ATTACH '{path}' AS previous (READ_ONLY)")
+            self.merge_previous(con)
+            con.sql("DETACH previous")
+
+        con.sql(f"ATTACH '{output}' AS final (ROW_GROUP_SIZE {self.row_group_size})")
+        for table, columns in self.dictionaries.items():
+            casts = []
+            for column, values in columns.items():
+                enum = enum_name(table, column)
+                members = ", ".join(quote_literal(value) for value in sorted(values))
+                con.sql(f"CREATE TYPE final.{enum} AS ENUM ({members})")
+                casts.append(f'"{column}"::final.{enum} AS "{column}"')
+            order = ", ".join(f'"{key}"' for key in self.SORT_KEYS.get(table, ()))
+            con.sql(f"""
+                CREATE TABLE final.{table} AS
+                SELECT * REPLACE ({", ".join(casts)}) FROM {table}
+                {f"ORDER BY {order}" if order else ""}
+            """)
+        self.create_rollups(con)
+        self.write_summary(con)
+        con.sql("DETACH final")
+        os.replace(output, path)
+
+    @staticmethod
+    def create_rollups(con: duckdb.DuckDBPyConnection) -> None:
+        """
+        Materialises daily aggregates of the final records per (type, sourceName, unit),
+        with the weekly, monthly and yearly ones derived from the daily rows,
+        so trend queries do not have to aggregate raw samples
+        """
+        con.sql("""
+            CREATE TEMP TABLE daily AS
+            SELECT type, sourceName, unit, time_bucket(INTERVAL '1 day', startDate) AS period,
+            count(*) AS sample_count, sum(value) AS value_sum,
+            min(value) AS value_min, max(value) AS value_max
+            FROM final.records GROUP BY ALL
+        """)
+        coarser = [
+            f"""
+            SELECT '{grain}', type, sourceName, unit,
+            time_bucket(INTERVAL '1 {grain}', period), sum(sample_count)::BIGINT,
+            sum(value_sum), min(value_min), max(value_max)
+            FROM daily GROUP BY ALL
+            """
+            for grain in ROLLUP_GRAINS
+            if grain != "day"
+        ]
+        con.sql(f"""
+            CREATE TABLE final.{ROLLUP_TABLE} AS
+            SELECT 'day' AS grain, * FROM daily
+            UNION ALL {" UNION ALL ".join(coarser)}
+            ORDER BY grain, type, period
+        """)
+        con.sql("DROP TABLE daily")
+
+    def write_summary(self, con: duckdb.DuckDBPyConnection) -> None:
         """
-        Deprecated method for exporting to multiple parquet files
-        corresponding to each table in the duckdb database
-        use export_xml instead
+        Stores the summary collected while parsing, an incomplete one is left out
+        and get_health_summary aggregates the tables instead
         """
+        if self.summary is None:
+            return
+        con.sql(f"""
+            CREATE TABLE final.{SUMMARY_TABLE} (
+                "table" VARCHAR,
+                type VARCHAR,
+                count BIGINT,
+                start_date TIMESTAMP,
+                end_date TIMESTAMP,
+                sources VARCHAR[],
+                units VARCHAR[],
+                value_min DOUBLE,
+                value_max DOUBLE
+            )
+        """)
+        con.from_arrow(self.summary.to_arrow()).insert_into(f"final.{SUMMARY_TABLE}")
 
-        for i, docs in enumerate(self.parse_xml(), 1):
-            df: pl.DataFrame = pl.DataFrame(docs)
-            self.write_to_file(i, df)
+    @staticmethod
+    def read_previous_summary(con: duckdb.DuckDBPyConnection) -> ImportSummary | None:
+        """
+        Summary of the attached previous database, None when it has none
+        or its tables were changed after it was written
+        """
+        exists = con.execute(
+            "SELECT 1 FROM duckdb_tables() WHERE database_name = 'previous' AND table_name = ?",
+            [SUMMARY_TABLE],
+        )
+        if not exists.fetchall():
+            return None
+        previous = con.sql(f"SELECT * FROM previous.{SUMMARY_TABLE}")
+        rows = [dict(zip(previous.columns, row, strict=True)) for row in previous.fetchall()]
+        summary = ImportSummary.from_rows(rows)
+        for table in SUMMARY_TABLES:
+            (count,) = con.sql(f"SELECT count(*) FROM previous.{table}").fetchall()[0]
+            if summary.total(table) != count:
+                return None
+        return summary
 
-        record_chunk_dfs: list[pd.DataFrame] = []
-        workout_chunk_dfs: list[pd.DataFrame] = []
-        stat_chunk_dfs: list[pd.DataFrame] = []
+    def merge_previous(self, con: duckdb.DuckDBPyConnection) -> None:
+        """
+        Copies the tables of the attached previous database into the staging tables.
+        ENUM labels are added to the dictionaries, the new workouts are numbered
+        after the previous ones and the summary of the previous rows is added to the new one.
+        """
+        for table, columns in self.dictionaries.items():
+            for column, values in columns.items():
+                labels = con.sql(f"""
+                    SELECT unnest(enum_range(NULL::previous.{enum_name(table, column)}))
+                """).fetchall()
+                values.update(label for (label,) in labels)
 
-        for chunk_file in self.chunk_files:
-            df = pl.read_parquet(chunk_file)
-            cols = set(df.columns)
-            if cols == set(self.RECORD_COLUMNS):
-                df = df.select(self.RECORD_COLUMNS)
-                record_chunk_dfs.append(df)
-            elif cols == set(self.WORKOUT_COLUMNS):
-                df = df.select(self.WORKOUT_COLUMNS)
-                workout_chunk_dfs.append(df)
-            elif cols == set(self.WORKOUT_STATS_COLUMNS):
-                df = df.select(self.WORKOUT_STATS_COLUMNS)
-                stat_chunk_dfs.append(df)
+        last_workout = con.sql("SELECT coalesce(max(workout_id), 0) FROM previous.workouts")
+        if offset := last_workout.fetchall()[0][0]:
+            for table in ("workouts", "stats"):
+                con.sql(f"UPDATE {table} SET workout_id = workout_id + {offset}")
+        for table in self.dictionaries:
+            con.sql(f"INSERT INTO {table} SELECT * FROM previous.{table}")
+        if self.summary is not None:
+            previous = self.read_previous_summary(con)
+            merged = None if previous is None else ImportSummary.merged(previous, self.summary)
+            self.summary = merged
 
-        record_df = None
-        workout_df = None
-        stat_df = None
+    @staticmethod
+    def write_batch(con: duckdb.DuckDBPyConnection, chunk: TableBatch) -> None:
+        """
+        Appends an Arrow record batch to its table, DuckDB scans the batch without copying it
+        """
+        con.from_arrow(chunk.batch).insert_into(chunk.table)
 
+    def export_xml_parquet(self) -> None:
+        """
+        Export xml data to a Parquet dataset in the directory specified by user.
+        Records are Hive partitioned as type=<type>/year=<year>/part-0.parquet,
+        so queries filtered on type and dates only open the matching files.
+        Workouts and stats are written to workouts.parquet and stats.parquet next to them,
+        manifest.json lists the record files with their partition values
+        and the per type summary of the records and workouts.
+        Every batch is appended to its open file as it is parsed, see ParquetDatasetWriter.
+        """
+        self.write_parquet(self.parse_xml_batches())
+        print(f"memory: {self.memory_report()}")
+
+    def write_parquet(self, batches: Iterable[TableBatch]) -> None:
+        """
+        Writes the dataset to the staging directory and swaps it in place of the previous one
+        once it is complete, a failed import leaves the previous dataset as it was
+        """
+        root = Path(self.path)
+        shutil.rmtree(self.staging_path, ignore_errors=True)
         try:
-            if record_chunk_dfs:
-                record_df = pl.concat(record_chunk_dfs)
-            if workout_chunk_dfs:
-                workout_df = pl.concat(workout_chunk_dfs)
-            if stat_chunk_dfs:
-                stat_df = pl.concat(stat_chunk_dfs)
-        except Exception as e:
-            for f in self.chunk_files:
-                os.remove(f)
-            raise RuntimeError(f"Failed to concatenate dataframes: {str(e)}")
-        try:
-            if record_df is not None:
-                record_df.write_parquet(f"{self.path / 'records.parquet'}", compression="zstd")
-            if workout_df is not None:
-                workout_df.write_parquet(f"{self.path / 'workouts.parquet'}", compression="zstd")
-            if stat_df is not None:
-                stat_df.write_parquet(f"{self.path / 'stats.parquet'}", compression="zstd")
-        except Exception as e:
-            for f in self.chunk_files:
-                os.remove(f)
-            raise RuntimeError(f"Failed to write to path {self.path}: {str(e)}")
+            self.write_dataset(self.staging_path, batches)
+        except BaseException:
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+            raise
+        previous = root.with_name(f"{root.name}.previous")
+        shutil.rmtree(previous, ignore_errors=True)
+        if root.exists():
+            root.rename(previous)
+        self.staging_path.rename(root)
+        shutil.rmtree(previous, ignore_errors=True)
+        print(f"replaced the dataset in {root}")
+
+    def write_dataset(self, root: Path, batches: Iterable[TableBatch]) -> None:
+        root.mkdir(parents=True)
+        schemas = self.table_schemas
+        tables = {"workouts": WORKOUTS_FILENAME, "stats": STATS_FILENAME}
+        docs_count = 0
+        with ParquetDatasetWriter(root, self.parquet_options, self.chunk_size) as writer:
+            for table, filename in tables.items():
+                writer.open(filename, schemas[table])
+            for chunk in batches:
+                if chunk.table == "records":
+                    for path, batch in partition_batches(chunk.batch):
+                        writer.write(path, batch)
+                else:
+                    writer.write(tables[chunk.table], chunk.batch)
+                docs_count += chunk.batch.num_rows
+                print(f"processed {docs_count} docs")
+
+        records = []
+        for path, rows in sorted(writer.written.items()):
+            if path in tables.values():
+                continue
+            values = partition_values(path)
+            year = values.get("year", "")
+            records.append(
+                {
+                    "path": path,
+                    "type": values.get("type"),
+                    "year": int(year) if year.isdigit() else None,
+                    "rows": rows,
+                },
+            )
+        manifest: dict[str, Any] = {
+            "partitioning": list(PARTITION_COLUMNS),
+            "records": records,
+            "workouts": WORKOUTS_FILENAME,
+            "stats": STATS_FILENAME,
+        }
+        if self.summary is not None:
+            manifest["summary"] = self.summary.rows()
+        (root / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=2))
+        print(f"wrote {len(records)} record files to {root}")
+
+
+def partition_batches(batch: pa.RecordBatch) -> Iterator[tuple[str, pa.RecordBatch]]:
+    """
+    Splits a records batch into its type=<type>/year=<year> partitions, years are UTC.
+    Rows are sorted on (type, startDate) and the type column is dropped,
+    partition values are read back from the path.
+    Every partition is taken into its own buffers, a zero-copy slice left pending
+    in the writer would keep the whole chunk alive.
+    """
+    if not batch.num_rows:
+        return
+    order = pc.SortOptions([("type", "ascending"), ("startDate", "ascending")])
+    indices = pc.call_function("sort_indices", [batch], order)
+    types = batch.column("type").take(indices).to_numpy(zero_copy_only=False)
+    start_dates = batch.column("startDate").take(indices)
+    years = pc.call_function("year", [start_dates]).fill_null(-1).to_numpy()
+    starts = np.flatnonzero((types[1:] != types[:-1]) | (years[1:] != years[:-1])) + 1
+    bounds = [0, *starts.tolist(), batch.num_rows]
+    data = batch.drop_columns(["type"])
+    for start, end in itertools.pairwise(bounds):
+        year = years[start] if years[start] >= 0 else HIVE_NULL_PARTITION
+        path = f"type={quote(str(types[start]), safe='')}/year={year}/part-0.parquet"
+        yield path, data.take(indices.slice(start, end - start))
+
+
+def quote_literal(value: str) -> str:
+    escaped = value.replace("'", "''")
+    return f"'{escaped}'"
 
-        for f in self.chunk_files:
-            os.remove(f)
 
+parser = argparse.ArgumentParser(
+    prog="DuckDB importer",
+    description="Import Apple Health XML data into a DuckDB database",
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="Number of processes parsing the XML file in parallel",
+    default=1,
+    dest="workers",
+    action="store",
+)
+parser.add_argument(
+    "--incremental",
+    help="Only append the elements that are not in the database yet",
+    dest="incremental",
+    action="store_true",
+)
+parser.add_argument(
+    "--resume",
+    help="Continue a failed import from its last checkpoint",
+    dest="resume",
+    action="store_true",
+)
+parser.add_argument(
+    "--parquet",
+    help="Write a Hive partitioned Parquet dataset to the DUCKDB_FILENAME directory instead",
+    dest="parquet",
+    action="store_true",
+)
 
 if __name__ == "__main__":
-    importer = ParquetImporter()
-    importer.export_xml()
+    args = parser.parse_args()
+    if args.incremental and args.parquet:
+        parser.error("--incremental appends to the DuckDB database, --parquet rewrites the dataset")
+    if args.resume and (args.incremental or args.parquet):
+        parser.error("--resume continues a regular import into the DuckDB database")
+    importer = ParquetImporter(workers=args.workers)
+    if args.incremental:
+        importer.incremental = IncrementalFilter.for_target(
+            importer.state_path,
+            Path(importer.path).exists(),
+        )
+    if args.parquet:
+        importer.export_xml_parquet()
+    else:
+        importer.export_xml(resume=args.resume)
@@ -0,0 +1,107 @@
+import argparse
+import time
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+from app.config import settings
+from scripts.clickhouse_importer import CHIndexer
+from scripts.duckdb_importer import ParquetImporter
+from scripts.pipeline import fan_out
+from scripts.xml2es import ESIndexer
+from scripts.xml_exporter import TableBatch, XMLExporter
+
+SINKS: tuple[str, ...] = ("duckdb", "parquet", "ch", "es")
+
+
+def make_sinks(
+    names: list[str],
+    exporter: XMLExporter,
+    parquet_path: str,
+) -> dict[str, Callable[[Iterable[TableBatch]], None]]:
+    """
+    Consumers of the parsed batches for every chosen sink, the DuckDB importer
+    finalizes its tables with the dictionaries the shared exporter collects
+    and every sink stores the summary it collects
+    """
+    sinks: dict[str, Callable[[Iterable[TableBatch]], None]] = {}
+    if "duckdb" in names:
+        importer = ParquetImporter()
+        importer.dictionaries = exporter.dictionaries
+        importer.summary = exporter.summary
+        sinks["duckdb"] = importer.import_batches
+    if "parquet" in names:
+        dataset = ParquetImporter()
+        dataset.path = parquet_path
+        dataset.summary = exporter.summary
+        sinks["parquet"] = dataset.write_parquet
+    if "ch" in names:
+        indexer = CHIndexer()
+        indexer.summary = exporter.summary
+        sinks["ch"] = indexer.import_batches
+    if "es" in names:
+        es_indexer = ESIndexer()
+        es_indexer.summary = exporter.summary
+        sinks["es"] = es_indexer.index_batches
+    return sinks
+
+
+def run(names: list[str], workers: int, parquet_path: str) -> None:
+    """
+    Parses the XML file once and writes its batches to all sinks at the same time,
+    every sink reads from a queue of IMPORT_QUEUE_DEPTH batches
+    """
+    exporter = XMLExporter(workers)
+    exporter.queued_chunks = settings.IMPORT_QUEUE_DEPTH + 1
+    sinks = make_sinks(names, exporter, parquet_path)
+    print(f"Importing {exporter.xml_path} into {', '.join(sinks)}")
+    start = time.perf_counter()
+    stats = fan_out(
+        exporter.parse_xml_batches(),
+        sinks,
+        settings.IMPORT_QUEUE_DEPTH,
+        lambda chunk: chunk.batch.num_rows,
+    )
+    print(f"imported in {time.perf_counter() - start:.2f}s")
+    for name, sink in stats.items():
+        print(f"{name}: {sink.report()}")
+    print(f"memory: {exporter.memory_report()}")
+
+
+parser = argparse.ArgumentParser(
+    prog="Fan-out importer",
+    description="Parse Apple Health XML data once and import it into several backends",
+)
+parser.add_argument(
+    "-s",
+    "--sinks",
+    nargs="+",
+    choices=SINKS,
+    help="Backends to import into, IMPORT_SINKS by default",
+    default=None,
+    dest="sinks",
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="Number of processes parsing the XML file in parallel",
+    default=1,
+    dest="workers",
+    action="store",
+)
+parser.add_argument(
+    "--parquet-path",
+    help="Directory of the Parquet dataset, DUCKDB_FILENAME by default",
+    default=settings.DUCKDB_FILENAME,
+    dest="parquet_path",
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    names = args.sinks or settings.IMPORT_SINKS
+    if unknown := set(names) - set(SINKS):
+        parser.error(f"unknown sinks {', '.join(sorted(unknown))}, choose from {', '.join(SINKS)}")
+    shared_path = Path(args.parquet_path) == Path(settings.DUCKDB_FILENAME)
+    if shared_path and {"duckdb", "parquet"} <= set(names):
+        parser.error("the duckdb and parquet sinks need --parquet-path to be a separate directory")
+    run(names, args.workers, args.parquet_path)
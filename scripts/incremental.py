@@ -0,0 +1,145 @@
+import hashlib
+import os
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from app.config import settings
+
+DATE_FORMAT: str = "%Y-%m-%d %H:%M:%S"
+# export dates look like "2022-04-29 05:49:44 -0400", only the local time is compared,
+# the lookback window is wider than any difference between offsets
+DATE_PREFIX: int = 19
+
+
+class IncrementalFilter:
+    """
+    Skips the elements of a full Apple Health export that an earlier import already wrote.
+
+    Elements created before the high-water mark of the last import minus the lookback window
+    are skipped on a string comparison of creationDate. Inside the window every element
+    is hashed over its tag and attributes and checked against the hashes the last import
+    saved. Nested elements such as WorkoutStatistics follow the decision of their parent.
+    The state is saved by commit, once the target holds the new rows.
+    """
+
+    CHILD_TAGS: frozenset[str] = frozenset({"WorkoutStatistics"})
+
+    def __init__(self, state_path: Path, lookback_days: int | None = None):
+        self.state_path = state_path
+        self.lookback = timedelta(days=settings.IMPORT_LOOKBACK_DAYS)
+        if lookback_days is not None:
+            self.lookback = timedelta(days=lookback_days)
+        self.high_water: str = ""
+        self.hashes: np.ndarray = np.empty(0, dtype=np.uint64)
+        self.created: np.ndarray = np.empty(0, dtype=f"S{DATE_PREFIX}")
+        if state_path.exists():
+            with np.load(state_path) as state:
+                self.high_water = str(state["high_water"])
+                self.hashes = state["hashes"]
+                self.created = state["created"]
+        self.cutoff: str = self.shift(self.high_water, -self.lookback)
+        self.seen: set[int] = set(self.hashes.tolist())
+        # newest creationDate of this import and the start of the window its hashes cover
+        self.newest: str = self.high_water
+        self.keep_from: str = self.cutoff
+        self.new_hashes: list[int] = []
+        self.new_created: list[str] = []
+        self.parent_accepted: bool = True
+        self.accepted: int = 0
+        self.skipped: int = 0
+
+    @classmethod
+    def for_target(cls, state_path: Path, target_exists: bool) -> "IncrementalFilter":
+        """
+        A state without its target is stale and dropped. A target without a state was
+        filled by a full import whose rows cannot be told apart from new ones.
+        """
+        if not target_exists:
+            state_path.unlink(missing_ok=True)
+        elif not state_path.exists():
+            raise SystemExit(
+                f"No import state at {state_path}, the existing data was not imported with "
+                "--incremental. Run the first incremental import into an empty target.",
+            )
+        return cls(state_path)
+
+    @staticmethod
+    def shift(date: str, delta: timedelta) -> str:
+        if not date:
+            return ""
+        return (datetime.strptime(date, DATE_FORMAT) + delta).strftime(DATE_FORMAT)
+
+    @staticmethod
+    def element_hash(tag: str, attrib: Mapping[str, str]) -> int:
+        """
+        64 bit blake2b digest of the tag, attribute names and values in document order,
+        the Health app writes the attributes of an element in the same order every export
+        """
+        key = "\x1f".join((tag, *attrib.keys(), *attrib.values()))
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+    def accept(self, tag: str, attrib: Mapping[str, str]) -> bool:
+        if tag in self.CHILD_TAGS:
+            accepted = self.parent_accepted
+        else:
+            accepted = self.parent_accepted = self.is_new(tag, attrib)
+        if accepted:
+            self.accepted += 1
+        else:
+            self.skipped += 1
+        return accepted
+
+    def is_new(self, tag: str, attrib: Mapping[str, str]) -> bool:
+        created = attrib.get("creationDate", "")[:DATE_PREFIX]
+        if len(created) < DATE_PREFIX:
+            created = ""
+        if created and created < self.cutoff:
+            return False
+        # only elements up to the old high-water mark can have been imported,
+        # only elements inside the window of the new one need to be remembered
+        check = bool(self.seen) and (not created or created <= self.high_water)
+        keep = not created or created >= self.keep_from
+        if not check and not keep:
+            return True
+        digest = self.element_hash(tag, attrib)
+        if check and digest in self.seen:
+            return False
+        if created > self.newest:
+            self.advance(created)
+        if keep:
+            self.new_hashes.append(digest)
+            self.new_created.append(created)
+        return True
+
+    def advance(self, created: str) -> None:
+        day = created[:10]
+        if day != self.newest[:10]:
+            self.keep_from = self.shift(f"{day} 00:00:00", -self.lookback)
+        self.newest = created
+
+    def commit(self) -> None:
+        """
+        Saves the new high-water mark with the hashes of the elements inside its window,
+        elements without a creationDate are always kept
+        """
+        cutoff = self.shift(self.newest, -self.lookback).encode()
+        hashes = np.concatenate([self.hashes, np.array(self.new_hashes, dtype=np.uint64)])
+        created = np.concatenate(
+            [self.created, np.array(self.new_created, dtype=f"S{DATE_PREFIX}")],
+        )
+        window = (created == b"") | (created >= cutoff)
+        temporary = self.state_path.with_name(f"{self.state_path.name}.tmp")
+        with temporary.open("wb") as file:
+            np.savez(
+                file,
+                high_water=np.array(self.newest),
+                hashes=hashes[window],
+                created=created[window],
+            )
+        os.replace(temporary, self.state_path)
+
+    def report(self) -> str:
+        return f"{self.accepted} new elements, {self.skipped} already imported"
@@ -0,0 +1,15 @@
+import sys
+
+
+def peak_rss_mb(children: bool = False) -> float | None:
+    """
+    Peak resident set size of this process, or of the largest of its finished children,
+    None on Windows where the resource module does not exist
+    """
+    if sys.platform == "win32":
+        return None
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # kilobytes on Linux, bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024) if sys.platform == "darwin" else usage.ru_maxrss / 1024
@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Self
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.config import settings
+
+
+@dataclass
+class ParquetOptions:
+    row_group_size: int
+    compression: str
+    compression_level: int | None
+    write_statistics: bool
+    bloom_filter_columns: tuple[str, ...] = ()
+    bloom_filter_ndv: int = 1024
+    bloom_filter_fpp: float = 0.05
+    write_page_index: bool = False
+
+    @classmethod
+    def from_settings(cls) -> Self:
+        return cls(
+            row_group_size=settings.PARQUET_ROW_GROUP_SIZE,
+            compression=settings.PARQUET_COMPRESSION,
+            compression_level=settings.PARQUET_COMPRESSION_LEVEL,
+            write_statistics=settings.PARQUET_WRITE_STATISTICS,
+            bloom_filter_columns=tuple(settings.PARQUET_BLOOM_FILTER_COLUMNS),
+            bloom_filter_ndv=settings.PARQUET_BLOOM_FILTER_NDV,
+            bloom_filter_fpp=settings.PARQUET_BLOOM_FILTER_FPP,
+            write_page_index=settings.PARQUET_WRITE_PAGE_INDEX,
+        )
+
+    def writer_kwargs(self, schema: pa.Schema) -> dict[str, Any]:
+        """
+        Bloom filters are sized per row group, they only let readers skip row groups
+        when the searched value is absent, which min/max statistics of high cardinality
+        string columns rarely prove
+        """
+        bloom_filters = {
+            column: {"ndv": self.bloom_filter_ndv, "fpp": self.bloom_filter_fpp}
+            for column in self.bloom_filter_columns
+            if column in schema.names
+        }
+        return {
+            "compression": self.compression,
+            "compression_level": self.compression_level,
+            "write_statistics": self.write_statistics,
+            "bloom_filter_options": bloom_filters or None,
+            "write_page_index": self.write_page_index,
+        }
+
+
+class BufferedFile:
+    """
+    An open ParquetWriter and the batches waiting to become its next row group
+    """
+
+    def __init__(self, path: Path, schema: pa.Schema, options: ParquetOptions):
+        self.schema = schema
+        self.options = options
+        self.writer = pq.ParquetWriter(path, schema, **options.writer_kwargs(schema))
+        self.pending: list[pa.RecordBatch] = []
+        self.pending_rows = 0
+        self.rows = 0
+
+    def append(self, batch: pa.RecordBatch) -> None:
+        self.pending.append(batch)
+        self.pending_rows += batch.num_rows
+
+    def write(self, table: pa.Table) -> None:
+        self.writer.write_table(table, row_group_size=self.options.row_group_size)
+        self.rows += table.num_rows
+
+    def flush_full_groups(self) -> None:
+        """
+        Writes the complete row groups and keeps the remainder pending
+        """
+        size = self.options.row_group_size
+        full = self.pending_rows // size * size
+        if not full:
+            return
+        table = pa.Table.from_batches(self.pending, self.schema)
+        self.write(table.slice(0, full))
+        self.pending = table.slice(full).to_batches()
+        self.pending_rows -= full
+
+    def flush(self) -> None:
+        if self.pending_rows:
+            self.write(pa.Table.from_batches(self.pending, self.schema))
+        self.pending = []
+        self.pending_rows = 0
+
+
+class ParquetDatasetWriter:
+    """
+    Streams record batches into Parquet files under root, keeping one ParquetWriter open per file.
+    Batches are buffered per file until they fill a row group of row_group_size rows.
+    At most max_buffered_rows are held across all files, past that the largest buffer
+    is written as a smaller row group, so memory stays bounded by about one chunk
+    no matter how many files are open.
+    """
+
+    def __init__(self, root: Path, options: ParquetOptions, max_buffered_rows: int):
+        self.root = root
+        self.options = options
+        self.max_buffered_rows = max_buffered_rows
+        self.files: dict[str, BufferedFile] = {}
+        self.buffered_rows = 0
+
+    def open(self, path: str, schema: pa.Schema) -> BufferedFile:
+        if path not in self.files:
+            target = self.root / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            self.files[path] = BufferedFile(target, schema, self.options)
+        return self.files[path]
+
+    def write(self, path: str, batch: pa.RecordBatch) -> None:
+        if not batch.num_rows:
+            return
+        file = self.open(path, batch.schema)
+        file.append(batch)
+        self.buffered_rows += batch.num_rows
+        if file.pending_rows >= self.options.row_group_size:
+            self.buffered_rows -= file.pending_rows
+            file.flush_full_groups()
+            self.buffered_rows += file.pending_rows
+        while self.buffered_rows > self.max_buffered_rows:
+            largest = max(self.files.values(), key=lambda buffered: buffered.pending_rows)
+            self.buffered_rows -= largest.pending_rows
+            largest.flush()
+
+    @property
+    def written(self) -> dict[str, int]:
+        return {path: file.rows for path, file in self.files.items()}
+
+    def close(self) -> None:
+        """
+        Writes the remaining buffers and closes every file
+        """
+        for file in self.files.values():
+            file.flush()
+            file.writer.close()
+        self.buffered_rows = 0
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
@@ -0,0 +1,279 @@
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+# how often a blocked producer checks whether the consumer gave up
+STOP_POLL_INTERVAL: float = 0.1
+
+
+@dataclass
+class PipelineStats:
+    items: int = 0
+    elapsed: float = 0.0
+    # producer blocked on a full queue
+    put_wait: float = 0.0
+    # consumer blocked on an empty queue
+    get_wait: float = 0.0
+    max_depth: int = 0
+
+    @property
+    def producer_idle(self) -> float:
+        return self.put_wait / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def consumer_idle(self) -> float:
+        return self.get_wait / self.elapsed if self.elapsed else 0.0
+
+    def report(self) -> str:
+        return (
+            f"{self.items} batches in {self.elapsed:.2f}s, "
+            f"queue wait: producer {self.put_wait:.2f}s, consumer {self.get_wait:.2f}s, "
+            f"idle: producer {self.producer_idle:.0%}, consumer {self.consumer_idle:.0%}, "
+            f"max queue depth {self.max_depth}"
+        )
+
+
+class SharedIterator(Generic[T]):
+    """
+    Hands the items of one iterable to several threads, each item to exactly one of them.
+    After stop the threads get no further items.
+    """
+
+    def __init__(self, items: Iterable[T]):
+        self.items = iter(items)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def __iter__(self) -> Iterator[T]:
+        return self
+
+    def __next__(self) -> T:
+        with self.lock:
+            if self.stopped.is_set():
+                raise StopIteration
+            return next(self.items)
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+class _Done:
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+
+
+class Pipeline(Generic[T]):
+    """
+    Runs a producer iterable in a background thread and hands its items to a consumer
+    in the calling thread through a bounded queue, so parsing and writing overlap.
+    A full queue blocks the producer (backpressure), producer errors are re-raised
+    in the caller and a failing consumer stops the producer.
+    """
+
+    def __init__(self, producer: Iterable[T], depth: int):
+        self.producer = producer
+        self.queue: queue.Queue[T | _Done] = queue.Queue(maxsize=max(depth, 1))
+        self.stopped = threading.Event()
+        self.stats = PipelineStats()
+
+    def _put(self, item: T | _Done) -> None:
+        start = time.perf_counter()
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=STOP_POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        self.stats.put_wait += time.perf_counter() - start
+        self.stats.max_depth = max(self.stats.max_depth, self.queue.qsize())
+
+    def _produce(self) -> None:
+        try:
+            for item in self.producer:
+                if self.stopped.is_set():
+                    return
+                self._put(item)
+        except BaseException as e:
+            self._put(_Done(e))
+        else:
+            self._put(_Done())
+
+    def run(self, consume: Callable[[T], None]) -> PipelineStats:
+        thread = threading.Thread(target=self._produce, name="pipeline-producer", daemon=True)
+        start = time.perf_counter()
+        thread.start()
+        try:
+            while True:
+                wait = time.perf_counter()
+                item = self.queue.get()
+                self.stats.get_wait += time.perf_counter() - wait
+                if isinstance(item, _Done):
+                    if item.error is not None:
+                        raise item.error
+                    break
+                consume(item)
+                self.stats.items += 1
+        finally:
+            self.stopped.set()
+            thread.join()
+            self.stats.elapsed = time.perf_counter() - start
+        return self.stats
+
+
+def run_pipeline(
+    producer: Iterable[T],
+    consume: Callable[[T], None],
+    depth: int,
+) -> PipelineStats:
+    """
+    Consumes producer items as they are produced, with at most depth items buffered
+    """
+    return Pipeline(producer, depth).run(consume)
+
+
+@dataclass
+class SinkStats:
+    batches: int = 0
+    rows: int = 0
+    elapsed: float = 0.0
+    # sink blocked on its empty queue
+    get_wait: float = 0.0
+    # producer blocked on the full queue of this sink
+    put_wait: float = 0.0
+    max_depth: int = 0
+    # time the sink kept running after the producer finished
+    lag: float = 0.0
+    error: BaseException | None = None
+
+    @property
+    def busy(self) -> float:
+        return self.elapsed - self.get_wait
+
+    def report(self) -> str:
+        throughput = self.rows / self.busy if self.busy else 0.0
+        status = f", failed: {self.error!r}" if self.error is not None else ""
+        return (
+            f"{self.rows} rows in {self.batches} batches, busy {self.busy:.2f}s "
+            f"({throughput:,.0f} rows/s), lag {self.lag:.2f}s, "
+            f"producer blocked {self.put_wait:.2f}s, max queue depth {self.max_depth}{status}"
+        )
+
+
+class FanOutAbortedError(Exception):
+    """
+    Ends the items of the sinks that are still running when the producer or another sink failed,
+    so they stop without committing what they wrote so far
+    """
+
+
+class FanOut(Generic[T]):
+    """
+    Hands every item of a producer to several sinks that run concurrently.
+    Each sink consumes an iterable of the items in its own thread, fed by a bounded queue
+    of its own, so one slow sink holds back the producer but not the other sinks.
+    Items are shared between the sinks and must not be modified by them.
+    When the producer or a sink fails, the iterables of the other sinks raise FanOutAbortedError
+    and the first error is re-raised once every sink returned.
+    """
+
+    def __init__(
+        self,
+        producer: Iterable[T],
+        sinks: dict[str, Callable[[Iterable[T]], None]],
+        depth: int,
+        size: Callable[[T], int] = lambda _: 1,
+    ):
+        self.producer = producer
+        self.sinks = sinks
+        self.size = size
+        self.queues: dict[str, queue.Queue[T | _Done]] = {
+            name: queue.Queue(maxsize=max(depth, 1)) for name in sinks
+        }
+        self.stopped = threading.Event()
+        self.stats: dict[str, SinkStats] = {name: SinkStats() for name in sinks}
+        self.produced: float = 0.0
+
+    def _put(self, name: str, item: T | _Done, thread: threading.Thread) -> None:
+        stats = self.stats[name]
+        start = time.perf_counter()
+        # a sink that returned no longer drains its queue
+        while thread.is_alive():
+            try:
+                self.queues[name].put(item, timeout=STOP_POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        stats.put_wait += time.perf_counter() - start
+        stats.max_depth = max(stats.max_depth, self.queues[name].qsize())
+
+    def _items(self, name: str) -> Iterator[T]:
+        stats = self.stats[name]
+        while True:
+            wait = time.perf_counter()
+            item = self.queues[name].get()
+            stats.get_wait += time.perf_counter() - wait
+            if isinstance(item, _Done):
+                if item.error is not None:
+                    raise item.error
+                return
+            stats.batches += 1
+            stats.rows += self.size(item)
+            yield item
+
+    def _consume(self, name: str, start: float) -> None:
+        stats = self.stats[name]
+        try:
+            self.sinks[name](self._items(name))
+        except BaseException as e:
+            stats.error = e
+            self.stopped.set()
+        stats.elapsed = time.perf_counter() - start
+
+    def run(self) -> dict[str, SinkStats]:
+        start = time.perf_counter()
+        threads = {
+            name: threading.Thread(target=self._consume, args=(name, start), name=f"sink-{name}")
+            for name in self.sinks
+        }
+        for thread in threads.values():
+            thread.start()
+        error: BaseException | None = None
+        try:
+            for item in self.producer:
+                if self.stopped.is_set():
+                    break
+                for name, thread in threads.items():
+                    self._put(name, item, thread)
+        except BaseException as e:
+            error = e
+        self.produced = time.perf_counter() - start
+        failed = error is not None or self.stopped.is_set()
+        for name, thread in threads.items():
+            self._put(name, _Done(FanOutAbortedError() if failed else None), thread)
+        for thread in threads.values():
+            thread.join()
+        for stats in self.stats.values():
+            stats.lag = max(stats.elapsed - self.produced, 0.0)
+        if error is None:
+            errors = (stats.error for stats in self.stats.values())
+            error = next((e for e in errors if not isinstance(e, FanOutAbortedError | None)), None)
+        if error is not None:
+            raise error
+        return self.stats
+
+
+def fan_out(
+    producer: Iterable[T],
+    sinks: dict[str, Callable[[Iterable[T]], None]],
+    depth: int,
+    size: Callable[[T], int] = lambda _: 1,
+) -> dict[str, SinkStats]:
+    """
+    Feeds every producer item to all sinks, with at most depth items buffered per sink
+    """
+    return FanOut(producer, sinks, depth, size).run()
@@ -1,25 +1,451 @@
-import sys
+import argparse
+import contextlib
+import hashlib
+import json
+import threading
+import time
 import xml.etree.ElementTree as ET
-from collections.abc import Generator
-from datetime import datetime
-from typing import Any
+from collections.abc import Callable, Generator, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import IO, Any
 
-from elasticsearch import NotFoundError, helpers
+from elasticsearch import BadRequestError, NotFoundError, helpers
 
+from app.config import settings
 from app.services.es_client import ESClient
+from app.services.health.es_helpers import (
+    DATE_FIELD,
+    ROLLUP_PERIOD,
+    SUMMARY_DOCUMENT_ID,
+    SUMMARY_PERIOD,
+    fresh_summary,
+    parse_partition,
+    partition_index,
+    partition_period,
+    rollup_alias,
+    summary_alias,
+)
+from app.services.health.import_summary import ImportSummary, TypeSummary
+from app.services.xml_backends import is_zip_source, open_source
+from app.utils.config_utils import PartitionInterval
+from scripts.dates import to_isoformat, to_utc_isoformat
+from scripts.incremental import IncrementalFilter
+from scripts.pipeline import SharedIterator
+from scripts.xml_exporter import TableBatch
+from scripts.xml_shards import (
+    MIN_SHARD_SIZE,
+    SHARDS_PER_WORKER,
+    Shard,
+    iter_sharded,
+    open_shard,
+    split_segments,
+)
+
+# how Apple Health writes dates, "2022-04-29 05:49:44 -0400"
+EXPORT_DATE_FORMAT: str = "%Y-%m-%d %H:%M:%S %z"
+# largest byte range a parser process turns into documents at once
+MAX_SHARD_SIZE: int = 16 * 1024 * 1024
+# seconds between two progress lines of a bulk import
+PROGRESS_INTERVAL: float = 10.0
+
+
+@dataclass
+class BulkProgress:
+    indexed: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+    reported: float = field(default_factory=time.perf_counter)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, ok: bool) -> None:
+        with self.lock:
+            if ok:
+                self.indexed += 1
+            else:
+                self.failed += 1
+            now = time.perf_counter()
+            self.elapsed = now - self.started
+            if now - self.reported >= PROGRESS_INTERVAL:
+                self.reported = now
+                print(f"indexed {self.report()}")
+
+    @property
+    def throughput(self) -> float:
+        return self.indexed / self.elapsed if self.elapsed else 0.0
+
+    def report(self) -> str:
+        failed = f", {self.failed} failed" if self.failed else ""
+        return (
+            f"{self.indexed} documents in {self.elapsed:.2f}s "
+            f"({self.throughput:,.0f} documents/s){failed}"
+        )
+
+
+@dataclass
+class Generation:
+    """
+    Partition indices written by one import, named <alias>-<name>-<period>
+    """
+
+    alias: str
+    name: str
+    interval: PartitionInterval
+    # index -> settings restored once the bulk load finishes
+    indices: dict[str, dict[str, Any]] = field(default_factory=dict)
+    # indices the import created, dropped again if it fails
+    created: list[str] = field(default_factory=list)
+    # whether the import writes the daily aggregates of its records, incremental imports
+    # into a generation without them leave them out rather than aggregating only new records
+    rollup: bool = True
+
+    @property
+    def pattern(self) -> str:
+        return partition_index(self.alias, self.name, "*")
+
+    @property
+    def rollup_index(self) -> str:
+        return partition_index(self.alias, self.name, ROLLUP_PERIOD)
+
+    @property
+    def summary_index(self) -> str:
+        return partition_index(self.alias, self.name, SUMMARY_PERIOD)
+
+    @property
+    def side_indices(self) -> dict[str, str]:
+        """
+        Indices of the generation that are not searched through the alias -> their own alias
+        """
+        return {
+            self.rollup_index: rollup_alias(self.alias),
+            self.summary_index: summary_alias(self.alias),
+        }
+
+    def index_for(self, document: dict[str, Any]) -> str:
+        period = partition_period(document.get(DATE_FIELD), self.interval)
+        return partition_index(self.alias, self.name, period)
 
 
 class ESIndexer:
-    def __init__(self):
+    # columns of the exporter's typed batches that are indexed under another field name,
+    # workout statistics are nested elements that are not indexed
+    BATCH_FIELDS: dict[str, dict[str, str]] = {
+        "records": {"textValue": "textvalue"},
+        "workouts": {"type": "workoutActivityType", "workout_id": ""},
+    }
+    # mapping of the index template, attributes without a mapping are indexed as keywords
+    INDEX_MAPPINGS: dict[str, Any] = {
+        "dynamic_templates": [
+            {
+                "strings_as_keywords": {
+                    "match_mapping_type": "string",
+                    "mapping": {"type": "keyword"},
+                },
+            },
+        ],
+        "properties": {
+            "type": {"type": "keyword"},
+            "workoutActivityType": {"type": "keyword"},
+            "sourceName": {"type": "keyword"},
+            "sourceVersion": {"type": "keyword"},
+            "device": {"type": "keyword"},
+            "unit": {"type": "keyword"},
+            "durationUnit": {"type": "keyword"},
+            "startDate": {"type": "date"},
+            "endDate": {"type": "date"},
+            "dateComponents": {"type": "date"},
+            "creationDate": {
+                "type": "date",
+                "format": "yyyy-MM-dd HH:mm:ss Z||strict_date_optional_time",
+            },
+            "value": {"type": "float"},
+            "duration": {"type": "float"},
+            # only matched by search_values, scoring by field length is not needed
+            "textvalue": {"type": "text", "norms": False},
+        },
+    }
+    # segments are sorted newest first, so date filtered and sorted queries stop early
+    INDEX_SETTINGS: dict[str, Any] = {
+        "index.sort.field": "dateComponents",
+        "index.sort.order": "desc",
+    }
+    # daily aggregates per type, source and unit, read through rollup_alias(ES_INDEX)
+    # by the statistics and trend tools instead of the records of every day
+    ROLLUP_MAPPINGS: dict[str, Any] = {
+        "properties": {
+            "type": {"type": "keyword"},
+            "sourceName": {"type": "keyword"},
+            "unit": {"type": "keyword"},
+            "day": {"type": "date"},
+            "documents": {"type": "long"},
+            "count": {"type": "long"},
+            "sum": {"type": "double"},
+            "sumsq": {"type": "double"},
+            "min": {"type": "double"},
+            "max": {"type": "double"},
+        },
+    }
+    ROLLUP_SETTINGS: dict[str, Any] = {
+        "index.sort.field": "day",
+        "index.sort.order": "asc",
+    }
+    # settings that speed up the bulk load, restored once it finishes
+    BULK_LOAD_SETTINGS: dict[str, Any] = {
+        "index.refresh_interval": "-1",
+        "index.number_of_replicas": 0,
+    }
+
+    def __init__(self, workers: int = 1):
         self.es = ESClient()
+        self.workers = workers
+        # set for incremental imports, skips the elements an earlier import indexed
+        self.incremental: IncrementalFilter | None = None
+        # summary of the indexed batches, set by the fan-out importer
+        self.summary: ImportSummary | None = None
+        self.chunk_size: int = settings.ES_BULK_CHUNK_SIZE
+        self.max_chunk_bytes: int = settings.ES_BULK_MAX_CHUNK_MB * 1024 * 1024
+        self.threads: int = settings.ES_BULK_THREADS
+        self.max_retries: int = settings.ES_BULK_MAX_RETRIES
+        self.initial_backoff: float = settings.ES_BULK_INITIAL_BACKOFF
+        self.max_backoff: float = settings.ES_BULK_MAX_BACKOFF
+        self.interval: PartitionInterval = settings.ES_PARTITION_INTERVAL
+
+    @property
+    def state_path(self) -> Path:
+        return Path(f"{self.es.index}.import-state.npz")
+
+    @property
+    def template_name(self) -> str:
+        return f"{self.es.index}-template"
+
+    def install_template(self) -> None:
+        """
+        Installs the index template of the partition indices behind the alias.
+        Mappings and sorting only apply to new indices, so indices of an earlier import
+        keep theirs until the next import that is not incremental replaces them.
+        """
+        self.es.engine.indices.put_index_template(
+            name=self.template_name,
+            index_patterns=[f"{self.es.index}-*"],
+            template={"settings": self.INDEX_SETTINGS, "mappings": self.INDEX_MAPPINGS},
+        )
+
+    def aliased_indices(self, alias: str | None = None) -> list[str]:
+        try:
+            return sorted(self.es.engine.indices.get_alias(name=alias or self.es.index))
+        except NotFoundError:
+            return []
+
+    def generation_indices(self) -> list[str]:
+        """
+        Indices of every generation of the alias, named explicitly because
+        wildcard deletes are refused by default and could match unrelated indices
+        """
+        response = self.es.engine.indices.get_settings(
+            index=f"{self.es.index}-*",
+            name="index.number_of_shards",
+            flat_settings=True,
+        )
+        return sorted(
+            index
+            for index in response
+            if (partition := parse_partition(self.es.index, index)) and partition[0].isdigit()
+        )
+
+    def has_unpartitioned_index(self) -> bool:
+        """
+        Whether ES_INDEX is still the single index of an import before partitioning
+        """
+        return bool(
+            self.es.engine.indices.exists(index=self.es.index)
+            and not self.es.engine.indices.exists_alias(name=self.es.index),
+        )
+
+    def open_generation(self) -> Generation:
+        """
+        Incremental imports add to the indices behind the alias,
+        other imports write a new generation of indices that replaces them
+        """
+        self.install_template()
+        if self.incremental is not None:
+            if self.has_unpartitioned_index():
+                raise ValueError(
+                    f"'{self.es.index}' was imported before indices were partitioned, "
+                    "import it again without --incremental first",
+                )
+            for index in self.aliased_indices():
+                if partition := parse_partition(self.es.index, index):
+                    generation = Generation(self.es.index, partition[0], self.interval)
+                    generation.rollup = generation.rollup_index in self.aliased_indices(
+                        rollup_alias(self.es.index),
+                    )
+                    return generation
+        return Generation(self.es.index, time.strftime("%Y%m%d%H%M%S"), self.interval)
+
+    def partition(self, generation: Generation, document: dict[str, Any]) -> str:
+        """
+        Index of the document, created with the bulk load settings when it is the first one
+        """
+        index = generation.index_for(document)
+        if index not in generation.indices:
+            self.create_index(generation, index)
+        return index
+
+    def create_index(
+        self,
+        generation: Generation,
+        index: str,
+        settings: dict[str, Any] | None = None,
+        mappings: dict[str, Any] | None = None,
+    ) -> None:
+        """
+        Creates an index of the generation with the bulk load settings,
+        on top of the template's settings and mappings
+        """
+        try:
+            self.es.engine.indices.create(
+                index=index,
+                settings={**self.BULK_LOAD_SETTINGS, **(settings or {})},
+                mappings=mappings,
+            )
+        except BadRequestError as e:
+            if e.error != "resource_already_exists_exception":
+                raise
+        # the settings return to the template's when the load finishes
+        generation.indices[index] = dict.fromkeys(self.BULK_LOAD_SETTINGS)
+        generation.created.append(index)
+
+    @contextmanager
+    def bulk_load(self, generation: Generation) -> Generator[None, None, None]:
+        """
+        Turns off refreshes and replicas of the generation's indices while documents are loaded.
+        Both are restored afterwards, indices created by a failed load are dropped,
+        and a successful load is force-merged and refreshed.
+        """
+        response = self.es.engine.indices.get_settings(
+            index=generation.pattern,
+            name=list(self.BULK_LOAD_SETTINGS),
+            flat_settings=True,
+        )
+        for index, current in response.items():
+            # settings left at their default are reset to it with None
+            generation.indices[index] = {
+                name: current["settings"].get(name) for name in self.BULK_LOAD_SETTINGS
+            }
+        if generation.indices:
+            self.es.engine.indices.put_settings(
+                index=generation.pattern,
+                settings=self.BULK_LOAD_SETTINGS,
+            )
+        try:
+            yield
+        except BaseException:
+            for index in generation.created:
+                self.es.engine.indices.delete(index=index)
+                del generation.indices[index]
+            raise
+        finally:
+            for index, restore in generation.indices.items():
+                self.es.engine.indices.put_settings(index=index, settings=restore)
+        started = time.perf_counter()
+        self.es.engine.indices.forcemerge(index=generation.pattern, max_num_segments=1)
+        self.es.engine.indices.refresh(index=generation.pattern)
+        print(f"Force-merged '{generation.pattern}' in {time.perf_counter() - started:.2f}s")
+
+    def swap_alias(self, generation: Generation) -> None:
+        """
+        Points the alias at the generation's indices in one request, so searches
+        see either the previous import or this one, then drops the previous indices.
+        The single index of an import before partitioning is replaced the same way,
+        and the daily aggregates and the summary move to their own aliases in the same request.
+        """
+        side_indices = generation.side_indices
+        partitions = [index for index in generation.indices if index not in side_indices]
+        previous = [index for index in self.aliased_indices() if index not in generation.indices]
+        actions: list[dict[str, Any]] = [
+            {"add": {"index": index, "alias": self.es.index}} for index in partitions
+        ]
+        actions += [{"remove": {"index": index, "alias": self.es.index}} for index in previous]
+        for index, alias in side_indices.items():
+            if index in generation.indices:
+                actions.append({"add": {"index": index, "alias": alias}})
+            replaced = [aliased for aliased in self.aliased_indices(alias) if aliased != index]
+            actions += [{"remove": {"index": aliased, "alias": alias}} for aliased in replaced]
+            previous += replaced
+        if self.has_unpartitioned_index():
+            actions.append({"remove_index": {"index": self.es.index}})
+        if not actions:
+            return
+        self.es.engine.indices.update_aliases(actions=actions)
+        for index in previous:
+            self.es.engine.indices.delete(index=index)
+        print(f"Alias '{self.es.index}' points at {len(partitions)} indices")
+
+    def document_count(self) -> int:
+        try:
+            return self.es.engine.count(index=self.es.index)["count"]
+        except NotFoundError:
+            return 0
+
+    def read_summary(self) -> tuple[ImportSummary | None, int]:
+        """
+        Summary of the documents an import keeps and their count,
+        the summary is None when the index changed after it was written
+        """
+        if self.incremental is None:
+            # the indices behind the alias are replaced
+            return ImportSummary(), 0
+        documents = self.document_count()
+        if not documents:
+            return ImportSummary(), 0
+        try:
+            response = self.es.engine.get(
+                index=summary_alias(self.es.index),
+                id=SUMMARY_DOCUMENT_ID,
+            )
+        except NotFoundError:
+            return None, documents
+        return fresh_summary(response["_source"], documents), documents
+
+    def write_summary(
+        self,
+        generation: Generation,
+        previous: tuple[ImportSummary | None, int],
+        summary: ImportSummary | None,
+        indexed: int,
+    ) -> None:
+        """
+        Saves the summary of the previous and the indexed documents in the generation's
+        summary index, get_health_summary_from_es answers from it while the document count
+        behind the alias matches. Without a complete summary an earlier one is dropped.
+        """
+        previous_summary, documents = previous
+        if previous_summary is None or summary is None:
+            if generation.summary_index in generation.indices:
+                with contextlib.suppress(NotFoundError):
+                    self.es.engine.delete(index=generation.summary_index, id=SUMMARY_DOCUMENT_ID)
+            return
+        merged = ImportSummary.merged(previous_summary, summary)
+        merged.fingerprint = {"documents": documents + indexed}
+        if generation.summary_index not in generation.indices:
+            # the document is only read back whole, none of its fields are searched
+            self.create_index(generation, generation.summary_index, mappings={"dynamic": False})
+        self.es.engine.index(
+            index=generation.summary_index,
+            id=SUMMARY_DOCUMENT_ID,
+            document=merged.document(),
+        )
 
     @staticmethod
     def convert_str2datetime(date_str: str) -> str:
         """Convert date strings to ISO 8601 datetime format."""
         try:
             # Parse string like "2022-04-29 05:49:44 -0400"
-            dt = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S %z")
-            return dt.isoformat()
+            return to_isoformat(date_str)
         except Exception:
             return date_str  # fallback to original if parsing fails
 
@@ -31,47 +457,197 @@ class ESIndexer:
         except (ValueError, TypeError):
             return 0.0  # fallback to 0 if parsing fails
 
-    def parse_xml(self) -> Generator[dict[str, Any], None, None]:
+    @classmethod
+    def build_document(cls, attrib: dict[str, str]) -> dict[str, Any]:
         """
-        Parses the XML file and yields dictionaries for each document/item.
-        Extracts attributes from each Record element.
+        Builds an index document from the attributes of a top-level element.
         Converts date fields to ISO 8601 datetime strings and value to numeric type.
         """
-        tree = ET.parse(self.es.xml_path)
-        root = tree.getroot()
-        for child in root:
-            document: dict[str, Any] = child.attrib.copy()  # dictionary of attributes
+        document: dict[str, Any] = attrib.copy()  # dictionary of attributes
 
-            document["textvalue"] = document.get("value", "")
+        document["textvalue"] = document.get("value", "")
 
+        if "startDate" in document:
+            document["startDate"] = cls.convert_str2datetime(document["startDate"])
+            document["dateComponents"] = document["startDate"]
+        if "endDate" in document:
+            document["endDate"] = cls.convert_str2datetime(document["endDate"])
+
+        if "value" in document:
+            document["value"] = cls.convert_str2float(document["value"])
+
+        return document
+
+    @classmethod
+    def batch_documents(cls, chunk: TableBatch) -> list[dict[str, Any]]:
+        """
+        Builds index documents from a records or workouts batch of the XML exporter
+        with the fields build_document gives their elements.
+        Dates are UTC, creationDate keeps the format of the export as build_document
+        does not convert it, and absent attributes are left out.
+        """
+        fields = cls.BATCH_FIELDS[chunk.table]
+        documents = []
+        for row in chunk.batch.to_pylist():
+            document: dict[str, Any] = {}
+            for column, value in row.items():
+                name = fields.get(column, column)
+                if not name or value is None:
+                    continue
+                if isinstance(value, datetime):
+                    value = (
+                        value.strftime(EXPORT_DATE_FORMAT)
+                        if name == "creationDate"
+                        else value.isoformat()
+                    )
+                document[name] = value
             if "startDate" in document:
-                document["startDate"] = self.convert_str2datetime(document["startDate"])
                 document["dateComponents"] = document["startDate"]
-            if "endDate" in document:
-                document["endDate"] = self.convert_str2datetime(document["endDate"])
+            documents.append(document)
+        return documents
 
-            if "value" in document:
-                document["value"] = self.convert_str2float(document["value"])
+    def index_batches(self, batches: Iterable[TableBatch]) -> None:
+        """
+        Indexes the records and workouts of batches parsed by another exporter,
+        such as the fan-out importer. The summary has to be complete
+        by the time batches is exhausted.
+        """
+        documents = (
+            document
+            for chunk in batches
+            if chunk.table in self.BATCH_FIELDS
+            for document in self.batch_documents(chunk)
+        )
+        self.import_documents(documents, lambda: self.summary)
 
-            yield document
+    def parse_xml(self) -> Generator[dict[str, Any], None, None]:
+        """
+        Streams a document for every top-level element of the XML file,
+        finished elements are cleared so memory does not grow with the file.
+        With more than one worker the file is parsed in byte-range shards
+        of at most MAX_SHARD_SIZE.
+        """
+        if self.workers > 1 and is_zip_source(self.es.xml_path):
+            print("Sharded parsing needs an extracted XML file, reading the zip with one worker")
+        elif self.workers > 1 and self.incremental is not None:
+            print("Incremental imports compare elements in file order, parsing with one worker")
+        elif self.workers > 1:
+            path = Path(self.es.xml_path)
+            shard_size = path.stat().st_size // (self.workers * SHARDS_PER_WORKER)
+            segments = split_segments(path, min(max(shard_size, MIN_SHARD_SIZE), MAX_SHARD_SIZE))
+            for documents in iter_sharded(path, self.workers, parse_shard_documents, segments):
+                yield from documents
+            return
+        with open_source(self.es.xml_path) as file:
+            for tag, attrib in iter_top_level(file):
+                if self.incremental is None or self.incremental.accept(tag, attrib):
+                    yield self.build_document(attrib)
 
-    def index_to_es(self, documents: list[dict[str, Any]]) -> None:
+    def bulk_index(
+        self,
+        generation: Generation,
+        documents: Iterable[dict[str, Any]],
+    ) -> BulkProgress:
         """
-        Bulk insert the documents into elasticsearch index.
+        Streams documents into the generation's indices, see send_bulk
         """
-        actions = [{"_index": self.es.index, "_source": document} for document in documents]
-        helpers.bulk(self.es.engine, actions)
-        print(f"Indexed {len(actions)} documents into '{self.es.index}'")
+        progress = self.send_bulk(
+            # pulled under the iterator's lock, so partitions are created once
+            {"_index": self.partition(generation, document), "_source": document}
+            for document in documents
+        )
+        print(f"Indexed {progress.report()} into '{generation.pattern}'")
+        return progress
 
-    def delete_index(self) -> None:
-        try:
-            resp = self.es.engine.delete_by_query(
-                index=self.es.index,
-                body={"query": {"match_all": {}}},
+    def index_rollup(self, generation: Generation, rollup: "DailyRollup") -> None:
+        """
+        Adds the daily aggregates of the indexed records to the generation's rollup index,
+        days an earlier incremental import aggregated are updated in place
+        """
+        if not generation.rollup:
+            print(f"'{generation.pattern}' has no daily aggregates, the tools read the records")
+            return
+        if generation.rollup_index not in generation.indices:
+            self.create_index(
+                generation,
+                generation.rollup_index,
+                settings=self.ROLLUP_SETTINGS,
+                mappings=self.ROLLUP_MAPPINGS,
             )
-            print(f"Deleted {resp.get('deleted', 0)} documents from '{self.es.index}'")
-        except NotFoundError:
-            print(f"Index '{self.es.index}' does not exist. Nothing to delete.")
+        progress = self.send_bulk(rollup.actions(generation.rollup_index))
+        print(f"Rolled up {progress.indexed} days into '{generation.rollup_index}'")
+
+    def send_bulk(self, actions: Iterable[dict[str, Any]]) -> BulkProgress:
+        """
+        Sends actions in bulk requests of at most chunk_size documents and max_chunk_bytes,
+        sent by several threads that take turns pulling from actions.
+        Documents rejected with 429 Too Many Requests are sent again after a backoff
+        that doubles from initial_backoff up to max_backoff, at most max_retries times.
+        Other failures raise, the remaining threads stop pulling actions.
+        """
+        progress = BulkProgress()
+        shared = SharedIterator(actions)
+
+        def send() -> None:
+            try:
+                # with raise_on_error the helper raises on the first 429 instead of retrying it
+                for ok, item in helpers.streaming_bulk(
+                    self.es.engine,
+                    shared,
+                    chunk_size=self.chunk_size,
+                    max_chunk_bytes=self.max_chunk_bytes,
+                    max_retries=self.max_retries,
+                    initial_backoff=self.initial_backoff,
+                    max_backoff=self.max_backoff,
+                    raise_on_error=False,
+                ):
+                    progress.add(ok)
+                    if not ok:
+                        raise helpers.BulkIndexError("1 document(s) failed to index.", [item])
+            except BaseException:
+                shared.stop()
+                raise
+
+        with ThreadPoolExecutor(max(self.threads, 1), thread_name_prefix="bulk") as executor:
+            senders = [executor.submit(send) for _ in range(max(self.threads, 1))]
+            for sender in senders:
+                sender.result()
+        return progress
+
+    def delete_index(self) -> None:
+        """
+        Drops every index behind the alias and any left by failed imports,
+        the next import creates them again from the current index template
+        """
+        documents = self.document_count()
+        targets = self.generation_indices()
+        if self.has_unpartitioned_index():
+            targets.append(self.es.index)
+        if targets:
+            self.es.engine.indices.delete(index=",".join(targets))
+        print(f"Deleted the indices of '{self.es.index}' with {documents} documents")
+        self.state_path.unlink(missing_ok=True)
+
+    def import_documents(
+        self,
+        documents: Iterable[dict[str, Any]],
+        summary: Callable[[], ImportSummary | None],
+    ) -> BulkProgress:
+        """
+        Writes documents to the partition indices of this import, their daily aggregates
+        to its rollup index and the summary of the documents, which is called once
+        documents is exhausted, to its summary index.
+        Then points the aliases at them once they are loaded.
+        """
+        previous = self.read_summary()
+        generation = self.open_generation()
+        rollup = DailyRollup()
+        with self.bulk_load(generation):
+            progress = self.bulk_index(generation, rollup.observe(documents))
+            self.index_rollup(generation, rollup)
+            self.write_summary(generation, previous, summary(), progress.indexed)
+        self.swap_alias(generation)
+        return progress
 
     def run(self, delete_all: bool = False) -> None:
         if delete_all:
@@ -79,13 +655,234 @@ class ESIndexer:
             self.delete_index()
             return
 
-        print(f"Parsing XML from {self.es.xml_path}...")
-        documents = list(self.parse_xml())
-        print(f"Parsed {len(documents)} documents. Indexing to Elasticsearch...")
-        self.index_to_es(documents)
+        print(f"Indexing XML from {self.es.xml_path} into '{self.es.index}'...")
+        summary = DocumentSummary()
+        self.import_documents(summary.observe(self.parse_xml()), summary.result)
+        if self.incremental is not None:
+            self.incremental.commit()
+            print(f"incremental: {self.incremental.report()}")
+
+
+class DocumentSummary:
+    """
+    Summarises index documents per type while they stream to the index.
+    Dates of one UTC offset compare as strings, so only the earliest start
+    and latest end per offset are moved to UTC.
+    """
+
+    # summary table -> (type field, value field, unit field) of its documents,
+    # every document with a type counts as a record like in get_health_summary_from_es
+    SUMMARY_FIELDS: dict[str, tuple[str, str, str]] = {
+        "records": ("type", "value", "unit"),
+        "workouts": ("workoutActivityType", "duration", "durationUnit"),
+    }
+
+    def __init__(self):
+        self.summary = ImportSummary()
+        # (table, type, date field, utc offset) -> earliest start or latest end date
+        self.bounds: dict[tuple[str, str, str, str], str] = {}
+
+    def observe(self, documents: Iterable[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+        for document in documents:
+            self.add(document)
+            yield document
+
+    def add(self, document: dict[str, Any]) -> None:
+        for table, (type_field, value_field, unit_field) in self.SUMMARY_FIELDS.items():
+            if (name := document.get(type_field)) is None:
+                continue
+            self.summary.types[table].setdefault(name, TypeSummary()).observe(
+                document.get("sourceName"),
+                document.get(unit_field),
+                ESIndexer.convert_str2float(document.get(value_field, "")),
+            )
+            for field_name, pick in (("startDate", min), ("endDate", max)):
+                if date := document.get(field_name):
+                    key = (table, name, field_name, date[-6:])
+                    self.bounds[key] = pick(self.bounds.get(key, date), date)
+
+    def result(self) -> ImportSummary:
+        summary = ImportSummary.merged(self.summary)
+        for (table, name, field_name, _), date in self.bounds.items():
+            utc = to_utc(date)
+            if field_name == "startDate":
+                summary.add(table, name, TypeSummary(start_date=utc))
+            else:
+                summary.add(table, name, TypeSummary(end_date=utc))
+        return summary
+
+
+@dataclass
+class DayAggregates:
+    """
+    Aggregates of the records of one type, source and unit on one day,
+    documents without a numeric value only add to documents
+    """
+
+    documents: int = 0
+    count: int = 0
+    sum: float = 0.0
+    sumsq: float = 0.0
+    min: float | None = None
+    max: float | None = None
+
+    def observe(self, value: Any) -> None:
+        self.documents += 1
+        if not isinstance(value, int | float):
+            return
+        self.count += 1
+        self.sum += value
+        self.sumsq += value * value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+
+class DailyRollup:
+    """
+    Aggregates the values of the records per type, source, unit and UTC day
+    while they stream to the index. Records of one hour share their UTC day,
+    so each hour and offset is converted once.
+    """
+
+    # painless script adding the aggregates of an import to those of a day already rolled up
+    MERGE_SCRIPT: str = """
+        ctx._source.documents += params.documents;
+        ctx._source.count += params.count;
+        ctx._source.sum += params.sum;
+        ctx._source.sumsq += params.sumsq;
+        if (params.min != null) {
+            ctx._source.min = ctx._source.min == null
+                ? params.min : Math.min(ctx._source.min, params.min);
+            ctx._source.max = ctx._source.max == null
+                ? params.max : Math.max(ctx._source.max, params.max);
+        }
+    """
+
+    def __init__(self):
+        # (type, sourceName, unit, day) -> aggregates of its records
+        self.days: dict[tuple[str, str | None, str | None, str], DayAggregates] = {}
+        # hour and offset of a date -> its UTC day
+        self.utc_days: dict[str, str | None] = {}
+
+    def observe(self, documents: Iterable[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+        for document in documents:
+            self.add(document)
+            yield document
+
+    def utc_day(self, date: str) -> str | None:
+        # offsets such as +05:30 move the day boundary within the hour
+        prefix = date[:13] if date.endswith("00") else date[:16]
+        key = prefix + date[-6:]
+        if key not in self.utc_days:
+            try:
+                day = datetime.fromisoformat(date).astimezone(UTC).date().isoformat()
+            except ValueError:
+                day = None
+            self.utc_days[key] = day
+        return self.utc_days[key]
+
+    def add(self, document: dict[str, Any]) -> None:
+        if (name := document.get("type")) is None or not (date := document.get(DATE_FIELD)):
+            return
+        if (day := self.utc_day(date)) is None:
+            return
+        key = (name, document.get("sourceName"), document.get("unit"), day)
+        aggregates = self.days.get(key)
+        if aggregates is None:
+            aggregates = self.days[key] = DayAggregates()
+        aggregates.observe(document.get("value"))
+
+    def actions(self, index: str) -> Iterator[dict[str, Any]]:
+        """
+        Upserts of the aggregates, identified by their key so an incremental import
+        adds to the days it shares with the earlier ones
+        """
+        for key, aggregates in self.days.items():
+            name, source, unit, day = key
+            document = {
+                "type": name,
+                "sourceName": source,
+                "unit": unit,
+                "day": day,
+                **asdict(aggregates),
+            }
+            yield {
+                "_op_type": "update",
+                "_index": index,
+                "_id": hashlib.sha1(json.dumps(key).encode()).hexdigest(),
+                "script": {"source": self.MERGE_SCRIPT, "params": document},
+                "upsert": {
+                    field_name: value for field_name, value in document.items() if value is not None
+                },
+            }
+
+
+def to_utc(date: str) -> str | None:
+    try:
+        return to_utc_isoformat(date)
+    except ValueError:
+        return None
+
+
+def iter_top_level(stream: IO[bytes]) -> Iterator[tuple[str, dict[str, str]]]:
+    """
+    Streams (tag, attributes) of the children of the root element,
+    the root is cleared after each of them so nested elements are not kept either
+    """
+    depth = 0
+    root: ET.Element | None = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            root = elem if root is None else root
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1 and root is not None:
+            yield elem.tag, elem.attrib
+            root.clear()
+
+
+def parse_shard_documents(shard: Shard) -> list[dict[str, Any]]:
+    """
+    Worker entry point for sharded parsing, returns the documents
+    built from the top-level elements of one shard
+    """
+    with open_shard(shard) as stream:
+        return [ESIndexer.build_document(attrib) for _, attrib in iter_top_level(stream)]
+
 
+parser = argparse.ArgumentParser(
+    prog="Elasticsearch importer",
+    description="Import Apple Health XML data into an Elasticsearch index",
+)
+parser.add_argument(
+    "--delete-all",
+    help="Delete all documents from the index instead of importing",
+    dest="delete_all",
+    action="store_true",
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="Number of processes parsing the XML file in parallel",
+    default=1,
+    dest="workers",
+    action="store",
+)
+parser.add_argument(
+    "--incremental",
+    help="Only index the elements that are not in the index yet",
+    dest="incremental",
+    action="store_true",
+)
 
 if __name__ == "__main__":
-    delete_all_flag = len(sys.argv) > 1 and sys.argv[1] == "--delete-all"
-    indexer = ESIndexer()
-    indexer.run(delete_all=delete_all_flag)
+    args = parser.parse_args()
+    indexer = ESIndexer(workers=args.workers)
+    if args.incremental and not args.delete_all:
+        indexer.incremental = IncrementalFilter.for_target(
+            indexer.state_path,
+            indexer.document_count() > 0,
+        )
+    indexer.run(delete_all=args.delete_all)
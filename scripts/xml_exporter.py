@@ -1,30 +1,165 @@
-from datetime import datetime
+import dataclasses
+import sys
+from collections.abc import Mapping
+from functools import partial
 from pathlib import Path
-from typing import Any, Generator
-from xml.etree import ElementTree as ET
+from typing import Any, Generator, NamedTuple
 
-import pandas as pd
+import pyarrow as pa
 
 from app.config import settings
+from app.services.health.import_summary import (
+    ImportSummary,
+    TypeSummary,
+    file_fingerprint,
+    sidecar_path,
+)
+from app.services.xml_backends import XMLBackend, XMLSource, get_backend, is_zip_source
+from scripts.checkpoints import Checkpoint, source_digest
+from scripts.dates import to_timestamp_array
+from scripts.incremental import IncrementalFilter
+from scripts.memory import peak_rss_mb
+from scripts.xml_shards import (
+    MIN_SHARD_SIZE,
+    SHARDS_PER_WORKER,
+    Shard,
+    iter_sharded,
+    open_shard,
+    split_segments,
+)
+
+# bounds of the chunk sizes a memory budget picks
+MIN_CHUNK_ROWS: int = 1_000
+MAX_CHUNK_ROWS: int = 1_000_000
+# rows whose Python strings are measured when a buffer is flushed
+SAMPLE_ROWS: int = 1_000
+# list slot holding a reference to each buffered value
+POINTER_SIZE: int = 8
+
+
+class TableBatch(NamedTuple):
+    table: str
+    batch: pa.RecordBatch
+
+
+class ColumnBuffer:
+    """
+    Typed per-column buffers for a single table.
+    Raw attribute strings are appended straight into one list per column
+    and converted to Arrow arrays only when the buffer is flushed.
+    With a chunk budget, every flush resizes the next chunk to the bytes per row
+    measured on the flushed one.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        schema: pa.Schema,
+        sources: dict[str, str],
+        defaults: dict[str, Any],
+        chunk_size: int,
+        chunk_budget: int = 0,
+    ):
+        self.table = table
+        self.schema = schema
+        self.defaults = defaults
+        self.chunk_size = chunk_size
+        self.chunk_budget = chunk_budget
+        # (column name, xml attribute name, column values)
+        self.columns: list[tuple[str, str, list[str | None]]] = [
+            (name, sources.get(name, name), []) for name in schema.names
+        ]
+        self.rows: int = 0
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def append(self, attrib: Mapping[str, str]) -> None:
+        for _, source, values in self.columns:
+            values.append(attrib.get(source))
+        self.rows += 1
+
+    @staticmethod
+    def to_float(value: str | None) -> float:
+        try:
+            return float(value or "")
+        except (TypeError, ValueError):
+            return 0.0
+
+    def convert(self, field: pa.Field, values: list[str | None]) -> pa.Array:
+        if pa.types.is_timestamp(field.type):
+            return to_timestamp_array(values, field.type)
+        if pa.types.is_integer(field.type):
+            return pa.array(values, type=pa.string()).cast(field.type)
+        if pa.types.is_floating(field.type):
+            return pa.array([self.to_float(value) for value in values], type=field.type)
+        if field.name in self.defaults:
+            default = self.defaults[field.name]
+            values = [default if value is None else value for value in values]
+        return pa.array(values, type=field.type)
+
+    def flush(self) -> TableBatch:
+        arrays = [
+            self.convert(field, values)
+            for field, (_, _, values) in zip(self.schema, self.columns, strict=True)
+        ]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.chunk_budget and self.rows:
+            self.resize(batch)
+        for _, _, values in self.columns:
+            values.clear()
+        self.rows = 0
+        return TableBatch(self.table, batch)
+
+    def resize(self, batch: pa.RecordBatch) -> None:
+        """
+        A chunk is held as Python strings and as Arrow arrays at once while it is flushed,
+        the next one gets as many rows of that size as fit into the chunk budget.
+        Strings are measured on evenly spaced rows.
+        """
+        step = max(self.rows // SAMPLE_ROWS, 1)
+        sampled = len(range(0, self.rows, step))
+        buffered = sum(
+            sum(map(sys.getsizeof, values[::step])) + POINTER_SIZE * sampled
+            for _, _, values in self.columns
+        )
+        row_bytes = buffered / sampled + batch.nbytes / self.rows
+        self.chunk_size = min(
+            max(int(self.chunk_budget / row_bytes), MIN_CHUNK_ROWS),
+            MAX_CHUNK_ROWS,
+        )
 
 
 class XMLExporter:
-    def __init__(self):
+    def __init__(self, workers: int = 1):
         self.xml_path: Path = Path(settings.RAW_XML_PATH)
+        # rows of the first chunk of every table, the memory budget resizes the next ones
         self.chunk_size: int = settings.CHUNK_SIZE
+        self.memory_budget: int = settings.IMPORT_MEMORY_BUDGET_MB * 1024 * 1024
+        # flushed chunks the consumer holds on to while the parser fills the buffers
+        self.queued_chunks: int = 1
+        # table -> chunk size the buffers of the table settled on
+        self.chunk_sizes: dict[str, int] = {}
+        # table -> rows of the largest chunk parsed by a worker process
+        self.largest_chunks: dict[str, int] = {}
+        self.workers: int = workers
+        self.backend: XMLBackend = get_backend()
+        # set for incremental imports, skips the elements an earlier import wrote
+        self.incremental: IncrementalFilter | None = None
+        # table -> column -> distinct values seen so far
+        self.dictionaries: dict[str, dict[str, set[str]]] = {
+            table: {column: set() for column in columns}
+            for table, columns in self.DICTIONARY_COLUMNS.items()
+        }
+        # per type statistics of the parsed rows, None when some rows were not seen,
+        # like the ones staged before the checkpoint a resumed import starts from
+        self.summary: ImportSummary | None = ImportSummary()
 
-    DATE_FIELDS: tuple[str, ...] = ("startDate", "endDate", "creationDate")
     DEFAULT_VALUES: dict[str, str] = {
         "unit": "",
         "sourceVersion": "",
         "device": "",
-        "value": "",
-    }
-    DEFAULT_STATS: dict[str, float] = {
-        "sum": 0.0,
-        "average": 0.0,
-        "maximum": 0.0,
-        "minimum": 0.0,
+        "textValue": "",
     }
     RECORD_COLUMNS: tuple[str, ...] = (
         "type",
@@ -39,6 +174,7 @@ class XMLExporter:
         "textValue",
     )
     WORKOUT_COLUMNS: tuple[str, ...] = (
+        "workout_id",
         "type",
         "duration",
         "durationUnit",
@@ -48,6 +184,7 @@ class XMLExporter:
         "creationDate",
     )
     WORKOUT_STATS_COLUMNS: tuple[str, ...] = (
+        "workout_id",
         "type",
         "startDate",
         "endDate",
@@ -57,86 +194,300 @@ class XMLExporter:
         "minimum",
         "unit",
     )
+    COLUMN_TYPES: dict[str, pa.DataType] = {
+        "workout_id": pa.int64(),
+        "startDate": pa.timestamp("us", tz="UTC"),
+        "endDate": pa.timestamp("us", tz="UTC"),
+        "creationDate": pa.timestamp("us", tz="UTC"),
+        "value": pa.float64(),
+        "duration": pa.float64(),
+        "sum": pa.float64(),
+        "average": pa.float64(),
+        "maximum": pa.float64(),
+        "minimum": pa.float64(),
+    }
+    # xml attributes that feed columns with a different name
+    COLUMN_SOURCES: dict[str, dict[str, str]] = {
+        "records": {"textValue": "value"},
+        "workouts": {"type": "workoutActivityType"},
+        "stats": {},
+    }
+    TABLE_TAGS: dict[str, str] = {
+        "Record": "records",
+        "Workout": "workouts",
+        "WorkoutStatistics": "stats",
+    }
+    # low cardinality string columns, their distinct values are collected while parsing
+    DICTIONARY_COLUMNS: dict[str, tuple[str, ...]] = {
+        "records": ("type", "sourceVersion", "sourceName", "device", "unit"),
+        "workouts": ("type", "durationUnit", "sourceName"),
+        "stats": ("type", "unit"),
+    }
+    # (value column, unit column) summarised per type, see collect_summary
+    SUMMARY_COLUMNS: dict[str, tuple[str, str]] = {
+        "records": ("value", "unit"),
+        "workouts": ("duration", "durationUnit"),
+    }
+    # surrogate key numbering workouts in file order, their statistics are nested inside them
+    WORKOUT_KEY: str = "workout_id"
+
+    @classmethod
+    def table_schema(cls, columns: tuple[str, ...]) -> pa.Schema:
+        return pa.schema([(name, cls.COLUMN_TYPES.get(name, pa.string())) for name in columns])
+
+    @property
+    def table_schemas(self) -> dict[str, pa.Schema]:
+        return {
+            "records": self.table_schema(self.RECORD_COLUMNS),
+            "workouts": self.table_schema(self.WORKOUT_COLUMNS),
+            "stats": self.table_schema(self.WORKOUT_STATS_COLUMNS),
+        }
 
-    def update_record(self, kind: str, document: dict[str, Any]) -> dict[str, Any]:
+    @property
+    def chunk_budget(self) -> int:
         """
-        Updates records to fill out columns without specified data:
-        There are 9 columns that need to be filled out, and there are 4 columns
-        that are optional and aren't filled out in every record
-        Additionally a textValue field is added for querying text values
+        Bytes a single chunk may take, the budget is shared by the buffer of every table
+        and the chunks queued for the consumer
         """
-        for field in self.DATE_FIELDS:
-            if field in document:
-                document[field] = datetime.strptime(document[field], "%Y-%m-%d %H:%M:%S %z")
+        return self.memory_budget // (len(self.TABLE_TAGS) + self.queued_chunks)
 
-        if kind == "record":
-            if len(document) != 9:
-                document.update({k: v for k, v in self.DEFAULT_VALUES.items() if k not in document})
+    def make_buffers(self) -> dict[str, ColumnBuffer]:
+        return {
+            table: ColumnBuffer(
+                table,
+                schema,
+                self.COLUMN_SOURCES[table],
+                self.DEFAULT_VALUES if table == "records" else {},
+                self.chunk_sizes.get(table, self.chunk_size),
+                self.chunk_budget,
+            )
+            for table, schema in self.table_schemas.items()
+        }
 
-            document["textValue"] = document["value"]
+    def iter_batches(self, source: XMLSource) -> Generator[TableBatch, Any, None]:
+        """
+        Parses an XML document and yields Arrow record batches of at most chunk_size rows,
+        or of the chunk sizes the memory budget picks, each tagged with the name of the table
+        it belongs to.
+        Attributes are appended directly into typed per-column buffers, so no
+        per-row dicts or intermediate DataFrames are built.
+        Workouts are numbered from 1 and their statistics carry the same workout_id.
+        """
+        buffers = self.make_buffers()
+        workout_id = 0
 
-            try:
-                document["value"] = float(document["value"])
-            except (TypeError, ValueError):
-                document["value"] = 0.0
+        for tag, attrib in self.backend.iter_elements(source, self.TABLE_TAGS):
+            if self.incremental is not None and not self.incremental.accept(tag, attrib):
+                continue
+            buffer = buffers[self.TABLE_TAGS[tag]]
+            if tag == "Record":
+                buffer.append(attrib)
+            else:
+                if tag == "Workout":
+                    workout_id += 1
+                buffer.append({**attrib, self.WORKOUT_KEY: str(workout_id)})
+            if len(buffer) >= buffer.chunk_size:
+                yield buffer.flush()
+
+        # yield remaining records
+        for table, buffer in buffers.items():
+            yield buffer.flush()
+            self.chunk_sizes[table] = buffer.chunk_size
+
+    def memory_report(self) -> str:
+        """
+        Chunk sizes the buffers settled on and the peak RSS of the import,
+        sharded parsing sizes the chunks in the worker processes and reports the largest ones
+        """
+        report = []
+        if self.chunk_sizes:
+            sizes = ", ".join(f"{table} {rows}" for table, rows in self.chunk_sizes.items())
+            report.append(f"chunk rows {sizes}")
+        elif self.largest_chunks:
+            sizes = ", ".join(f"{table} {rows}" for table, rows in self.largest_chunks.items())
+            report.append(f"largest chunks {sizes}")
+        if (peak := peak_rss_mb()) is not None:
+            report.append(f"peak RSS {peak:.0f} MiB")
+        if self.workers > 1 and (workers_peak := peak_rss_mb(children=True)):
+            report.append(f"parser workers {workers_peak:.0f} MiB")
+        return ", ".join(report)
 
-        elif kind == "workout":
-            document["type"] = document.pop("workoutActivityType")
+    def track_chunk(self, chunk: TableBatch) -> None:
+        rows = chunk.batch.num_rows
+        self.largest_chunks[chunk.table] = max(self.largest_chunks.get(chunk.table, 0), rows)
 
-            try:
-                document["duration"] = float(document["duration"])
-            except (TypeError, ValueError):
-                document["duration"] = 0.0
+    def collect_dictionaries(self, chunk: TableBatch) -> None:
+        for column, values in self.dictionaries[chunk.table].items():
+            values.update(chunk.batch.column(column).unique().drop_null().to_pylist())
 
-        elif kind == "stat":
-            document.update({k: v for k, v in self.DEFAULT_STATS.items() if k not in document})
+    def collect_summary(self, chunk: TableBatch) -> None:
+        if self.summary is None or chunk.table not in self.SUMMARY_COLUMNS:
+            return
+        if not chunk.batch.num_rows:
+            return
+        value, unit = self.SUMMARY_COLUMNS[chunk.table]
+        grouped = (
+            pa.Table.from_batches([chunk.batch])
+            .group_by("type")
+            .aggregate(
+                [
+                    ("type", "count"),
+                    ("startDate", "min"),
+                    ("endDate", "max"),
+                    ("sourceName", "distinct"),
+                    (unit, "distinct"),
+                    (value, "min"),
+                    (value, "max"),
+                ],
+            )
+        )
+        for row in grouped.to_pylist():
+            start_date, end_date = row["startDate_min"], row["endDate_max"]
+            summary = TypeSummary(
+                count=row["type_count"],
+                start_date=start_date and start_date.isoformat(),
+                end_date=end_date and end_date.isoformat(),
+                sources=sorted(source for source in row["sourceName_distinct"] if source),
+                units=sorted(name for name in row[f"{unit}_distinct"] if name),
+                value_min=row[f"{value}_min"],
+                value_max=row[f"{value}_max"],
+            )
+            self.summary.add(chunk.table, row["type"] or "", summary)
 
-        return document
+    def save_xml_summary(self) -> None:
+        """
+        Saves the summary of a complete parse next to the XML file,
+        analyze_xml_structure answers from it until the file changes.
+        Incremental imports only summarise the new elements.
+        """
+        if self.summary is None or self.incremental is not None:
+            return
+        summary = ImportSummary.merged(self.summary)
+        summary.fingerprint = file_fingerprint(self.xml_path)
+        summary.save(sidecar_path(self.xml_path))
 
-    def parse_xml(self) -> Generator[pd.DataFrame, Any, None]:
+    def parse_xml_batches(self) -> Generator[TableBatch, Any, None]:
         """
-        Parses the XML file and yields pandas dataframes of specified chunk_size.
-        Extracts attributes from each Record element.
+        Parses the XML file into record batches, with more than one worker
+        the file is split into byte ranges parsed in parallel processes
+        and the batches are yielded in file order.
+        Distinct values of DICTIONARY_COLUMNS are collected into dictionaries
+        and the rows are summarised per type on the way.
         """
-        records: list[dict[str, Any]] = []
-        workouts: list[dict[str, Any]] = []
-        workout_stats: list[dict[str, Any]] = []
+        for chunk in self.iter_file_batches():
+            self.collect_dictionaries(chunk)
+            self.collect_summary(chunk)
+            yield chunk
+        self.save_xml_summary()
 
-        for event, elem in ET.iterparse(self.xml_path, events=("start",)):
-            if elem.tag == "Record" and event == "start":
-                if len(records) >= self.chunk_size:
-                    yield pd.DataFrame(records).reindex(columns=self.RECORD_COLUMNS)
-                    records = []
-                record: dict[str, Any] = elem.attrib.copy()
+    def iter_file_batches(self) -> Generator[TableBatch, Any, None]:
+        if self.workers > 1 and is_zip_source(self.xml_path):
+            print("Sharded parsing needs an extracted XML file, reading the zip with one worker")
+        elif self.workers > 1 and self.incremental is not None:
+            print("Incremental imports compare elements in file order, parsing with one worker")
+        elif self.workers > 1:
+            parse_shard = partial(
+                parse_shard_batches,
+                chunk_size=self.chunk_size,
+                memory_budget=self.memory_budget,
+            )
+            # every shard numbers its workouts from 1, shift them past the previous shards
+            offset = 0
+            for batches in iter_sharded(self.xml_path, self.workers, parse_shard):
+                workouts = 0
+                for chunk in batches:
+                    if chunk.table == "workouts":
+                        workouts += chunk.batch.num_rows
+                    self.track_chunk(chunk)
+                    yield self.offset_workout_ids(chunk, offset)
+                offset += workouts
+            return
+        yield from self.iter_batches(self.xml_path)
 
-                # fill out empty cells if they exist and convert dates to datetime
-                self.update_record("record", record)
-                records.append(record)
+    @property
+    def can_checkpoint(self) -> bool:
+        """
+        Checkpoints are byte offsets into the extracted XML file,
+        incremental imports keep the hashes of new elements in memory until they commit
+        """
+        return not is_zip_source(self.xml_path) and self.incremental is None
 
-            elif elem.tag == "Workout" and event == "start":
-                if len(workouts) >= self.chunk_size:
-                    yield pd.DataFrame(workouts).reindex(columns=self.WORKOUT_COLUMNS)
-                    workouts = []
-                workout: dict[str, Any] = elem.attrib.copy()
+    def iter_checkpointed_batches(
+        self,
+        checkpoint: Checkpoint,
+    ) -> Generator[TableBatch | Checkpoint, Any, None]:
+        """
+        Parses the XML file from the offset of checkpoint on in segments of about
+        IMPORT_CHECKPOINT_MB, with more than one worker they are parsed like shards
+        and made small enough to give every worker SHARDS_PER_WORKER of them.
+        Every table is flushed at the end of a segment, so after the batches of a segment
+        a checkpoint at its end is yielded that neither skips nor repeats an element.
+        The checkpoint keeps the segment size, a resumed import parses the same segments
+        and chunks them alike.
+        The rows of the checkpoints are left to the consumer.
+        Resumed imports do not see the rows before the checkpoint, so they have no summary.
+        """
+        path = Path(self.xml_path)
+        if checkpoint.offset:
+            self.summary = None
+        segment_size = checkpoint.segment_size or settings.IMPORT_CHECKPOINT_MB * 1024 * 1024
+        if self.workers > 1 and not checkpoint.segment_size:
+            shard_size = path.stat().st_size // (self.workers * SHARDS_PER_WORKER)
+            segment_size = min(segment_size, max(shard_size, MIN_SHARD_SIZE))
+        segments = split_segments(path, segment_size, checkpoint.offset)
+        if self.workers > 1:
+            parse_shard = partial(
+                parse_shard_batches,
+                chunk_size=self.chunk_size,
+                memory_budget=self.memory_budget,
+            )
+            results = iter_sharded(path, self.workers, parse_shard, segments)
+        else:
+            results = (self.iter_segment_batches(segment) for segment in segments)
 
-                for stat in elem:
-                    if stat.tag != "WorkoutStatistics":
-                        continue
-                    statistic = stat.attrib.copy()
-                    self.update_record("stat", statistic)
-                    workout_stats.append(statistic)
-                    if len(workout_stats) >= self.chunk_size:
-                        yield pd.DataFrame(workout_stats).reindex(
-                            columns=self.WORKOUT_STATS_COLUMNS,
-                        )
-                        workout_stats = []
+        workouts = checkpoint.workouts
+        for segment, batches in zip(segments, results, strict=True):
+            numbered = 0
+            for chunk in batches:
+                if chunk.table == "workouts":
+                    numbered += chunk.batch.num_rows
+                self.track_chunk(chunk)
+                chunk = self.offset_workout_ids(chunk, checkpoint.workout_base + workouts)
+                self.collect_dictionaries(chunk)
+                self.collect_summary(chunk)
+                yield chunk
+            workouts += numbered
+            yield dataclasses.replace(
+                checkpoint,
+                offset=segment.end,
+                segment_size=segment_size,
+                workouts=workouts,
+                digest=source_digest(path, segment.end),
+            )
+        self.save_xml_summary()
 
-                self.update_record("workout", workout)
-                workouts.append(workout)
+    def iter_segment_batches(self, segment: Shard) -> Generator[TableBatch, Any, None]:
+        # every segment is chunked from chunk_size like the shards of the worker processes,
+        # so a resumed import cuts the segment into the same chunks as the original one
+        self.chunk_sizes.clear()
+        with open_shard(segment) as stream:
+            yield from self.iter_batches(stream)
 
-            elem.clear()
+    @classmethod
+    def offset_workout_ids(cls, chunk: TableBatch, offset: int) -> TableBatch:
+        if not offset or cls.WORKOUT_KEY not in chunk.batch.schema.names:
+            return chunk
+        index = chunk.batch.schema.get_field_index(cls.WORKOUT_KEY)
+        ids = pa.array(chunk.batch.column(index).to_numpy() + offset)
+        return TableBatch(chunk.table, chunk.batch.set_column(index, cls.WORKOUT_KEY, ids))
 
-        # yield remaining records
-        yield pd.DataFrame(records).reindex(columns=self.RECORD_COLUMNS)
-        yield pd.DataFrame(workouts).reindex(columns=self.WORKOUT_COLUMNS)
-        yield pd.DataFrame(workout_stats).reindex(columns=self.WORKOUT_STATS_COLUMNS)
+
+def parse_shard_batches(shard: Shard, chunk_size: int, memory_budget: int) -> list[TableBatch]:
+    """
+    Worker entry point for sharded parsing, returns the non-empty batches of one shard
+    """
+    exporter = XMLExporter()
+    exporter.chunk_size = chunk_size
+    exporter.memory_budget = memory_budget
+    with open_shard(shard) as stream:
+        return [chunk for chunk in exporter.iter_batches(stream) if chunk.batch.num_rows]
@@ -0,0 +1,175 @@
+import io
+import os
+import re
+from collections import deque
+from collections.abc import Buffer, Callable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TypeVar
+
+T = TypeVar("T")
+
+# shards may only start at elements that are direct children of <HealthData>
+BOUNDARY_PATTERN: re.Pattern[bytes] = re.compile(rb"<(?:Record|Workout)[\s/>]")
+SHARDS_PER_WORKER: int = 4
+MIN_SHARD_SIZE: int = 8 * 1024 * 1024
+SCAN_BLOCK_SIZE: int = 1024 * 1024
+# Records nested in a Correlation are never split from their parent,
+# correlations are a few hundred bytes so this window always covers one
+CORRELATION_WINDOW: int = 64 * 1024
+
+
+@dataclass(frozen=True)
+class Shard:
+    path: Path
+    index: int
+    start: int
+    end: int
+    last: bool
+
+
+class ShardStream(io.RawIOBase):
+    """
+    Read-only stream over a byte range of an export, wrapped in a <HealthData>
+    root element so that every shard is a well-formed document on its own.
+    """
+
+    def __init__(self, shard: Shard):
+        self.file = shard.path.open("rb")
+        self.file.seek(shard.start)
+        self.remaining = shard.end - shard.start
+        self.prefix = b"" if shard.index == 0 else b"<HealthData>"
+        self.suffix = b"" if shard.last else b"</HealthData>"
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        size = len(view)
+        if self.prefix:
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+        elif self.remaining:
+            data = self.file.read(min(size, self.remaining))
+            self.remaining -= len(data)
+        else:
+            data, self.suffix = self.suffix[:size], self.suffix[size:]
+        view[: len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        self.file.close()
+        super().close()
+
+
+def open_shard(shard: Shard) -> io.BufferedReader:
+    return io.BufferedReader(ShardStream(shard), buffer_size=SCAN_BLOCK_SIZE)
+
+
+def _inside_correlation(file: io.BufferedReader, position: int) -> bool:
+    start = max(position - CORRELATION_WINDOW, 0)
+    file.seek(start)
+    window = file.read(position - start)
+    return window.rfind(b"<Correlation") > window.rfind(b"</Correlation>")
+
+
+def find_boundary(file: io.BufferedReader, position: int, size: int) -> int:
+    """
+    Returns the offset of the first top-level <Record> or <Workout> at or after position
+    """
+    while position < size:
+        file.seek(position)
+        block = file.read(SCAN_BLOCK_SIZE + 16)
+        match = BOUNDARY_PATTERN.search(block)
+        if match is None:
+            position += SCAN_BLOCK_SIZE
+            continue
+        candidate = position + match.start()
+        if not _inside_correlation(file, candidate):
+            return candidate
+        file.seek(candidate)
+        closing = file.read(CORRELATION_WINDOW).find(b"</Correlation>")
+        position = candidate + (closing if closing >= 0 else 1)
+    return size
+
+
+def split_shards(path: Path, count: int) -> list[Shard]:
+    """
+    Splits an export into at most count byte ranges aligned on element boundaries
+    """
+    size = path.stat().st_size
+    count = max(1, min(count, size // MIN_SHARD_SIZE))
+    offsets = [0]
+    with path.open("rb") as file:
+        for index in range(1, count):
+            boundary = find_boundary(file, max(size * index // count, offsets[-1] + 1), size)
+            if boundary >= size:
+                break
+            offsets.append(boundary)
+    offsets.append(size)
+    return to_shards(path, offsets)
+
+
+def split_segments(path: Path, segment_size: int, start: int = 0) -> list[Shard]:
+    """
+    Splits an export from the start boundary on into byte ranges of about segment_size
+    aligned on element boundaries. Boundaries are looked up from multiples of segment_size,
+    so splitting from any boundary of an earlier split ends the ranges at the same offsets.
+    """
+    size = path.stat().st_size
+    if start >= size:
+        return []
+    offsets = [start]
+    with path.open("rb") as file:
+        first = (start // segment_size + 1) * segment_size
+        for position in range(first, size, segment_size):
+            boundary = find_boundary(file, position, size)
+            if boundary >= size:
+                break
+            if boundary > offsets[-1]:
+                offsets.append(boundary)
+    offsets.append(size)
+    return to_shards(path, offsets)
+
+
+def to_shards(path: Path, offsets: list[int]) -> list[Shard]:
+    # only the shard at offset 0 holds the document header and the opening root tag
+    first = 0 if offsets[0] == 0 else 1
+    size = offsets[-1]
+    return [
+        Shard(path, first + index, start, end, last=end == size)
+        for index, (start, end) in enumerate(zip(offsets, offsets[1:]))
+    ]
+
+
+def iter_sharded(
+    path: Path,
+    workers: int,
+    parse_shard: Callable[[Shard], list[T]],
+    shards: list[Shard] | None = None,
+) -> Iterator[list[T]]:
+    """
+    Parses shards of the export in a process pool and yields the result of each shard
+    in file order, the export is split into SHARDS_PER_WORKER shards per worker
+    unless the shards are given.
+    At most two shards per worker are in flight, so memory stays bounded.
+    parse_shard must be picklable (a module level function or a partial of one).
+    """
+    if shards is None:
+        shards = split_shards(path, workers * SHARDS_PER_WORKER)
+    workers = min(workers, len(shards), os.cpu_count() or 1)
+    print(f"Parsing {len(shards)} shards of {path} with {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future[list[T]]] = deque()
+        queued = iter(shards)
+        for shard in queued:
+            pending.append(executor.submit(parse_shard, shard))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            results = pending.popleft().result()
+            for shard in queued:
+                pending.append(executor.submit(parse_shard, shard))
+                break
+            yield results
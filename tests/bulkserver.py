@@ -0,0 +1,343 @@
+import argparse
+import fnmatch
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from collections.abc import Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+# documents accepted and settings per index and the indices of every alias,
+# shared by the request threads
+documents: dict[str, int] = {}
+# sources of the documents written one at a time, (index, id) -> source
+stored: dict[tuple[str, str], dict[str, Any]] = {}
+index_settings: dict[str, dict[str, Any]] = {}
+aliases: dict[str, set[str]] = {}
+lock = threading.Lock()
+
+
+def resolve(expression: str) -> list[str]:
+    """
+    Indices named by a comma separated list of indices, aliases and wildcards
+    """
+    indices: list[str] = []
+    for name in expression.split(","):
+        if "*" in name:
+            indices += fnmatch.filter(sorted(index_settings), name)
+        elif name in aliases:
+            indices += sorted(aliases[name])
+        elif name in index_settings:
+            indices.append(name)
+    return indices
+
+
+class BulkHandler(BaseHTTPRequestHandler):
+    """
+    Answers the Elasticsearch requests of scripts/xml2es.py without storing documents:
+    bulk requests, document counts, delete by query and the index administration
+    around a bulk load, of which only the index settings and aliases are kept.
+    Documents written one at a time are kept and can be read back by id.
+    Rejections with 429 Too Many Requests are answered per document or per request
+    at the configured rates, like a cluster whose write queue is full.
+    """
+
+    server_version = "BulkStub"
+
+    def send_json(self, body: dict[str, Any], status: int = 200) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        # the client refuses responses without it
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    def send_error_json(self, error_type: str, status: int) -> None:
+        error = {"type": error_type, "reason": f"[{self.index_name()}] {error_type}"}
+        self.send_json({"error": error, "status": status}, status=status)
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def path_parts(self) -> list[str]:
+        return self.path.split("?")[0].strip("/").split("/")
+
+    def index_name(self) -> str:
+        return self.path_parts()[0]
+
+    def do_HEAD(self) -> None:
+        parts = self.path_parts()
+        with lock:
+            if parts[0] == "_alias":
+                found = bool(aliases.get(parts[1]))
+            else:
+                found = bool(resolve(parts[0]))
+        self.send_json({}, status=200 if found else 404)
+
+    def do_GET(self) -> None:
+        parts = self.path_parts()
+        self.read_body()
+        if len(parts) == 3 and parts[1] == "_doc":
+            self.get_document(parts[0], parts[2])
+            return
+        with lock:
+            if parts[-1] == "_count":
+                count = sum(documents.get(index, 0) for index in resolve(parts[0]))
+                self.send_json({"count": count})
+            elif parts[0] == "_alias":
+                indices = sorted(aliases.get(parts[1], ()))
+                if indices:
+                    self.send_json({index: {"aliases": {parts[1]: {}}} for index in indices})
+                else:
+                    self.send_error_json("aliases_not_found_exception", 404)
+            elif len(parts) > 1 and parts[1] == "_settings":
+                self.send_json(
+                    {
+                        index: {"settings": dict(index_settings[index])}
+                        for index in resolve(parts[0])
+                    },
+                )
+            else:
+                self.send_json({"version": {"number": "9.0.0"}, "tagline": "You Know, for Search"})
+
+    def do_POST(self) -> None:
+        parts = self.path_parts()
+        if parts[-1] == "_count":
+            self.do_GET()
+        elif parts[-1] == "_bulk":
+            self.bulk(self.read_body())
+        elif parts[-1] == "_aliases":
+            self.update_aliases(json.loads(self.read_body())["actions"])
+        elif parts[-1] == "_delete_by_query":
+            self.read_body()
+            with lock:
+                deleted = sum(documents.pop(index, 0) for index in resolve(parts[0]))
+            self.send_json({"deleted": deleted})
+        elif parts[-1] in ("_forcemerge", "_refresh"):
+            self.read_body()
+            self.send_json({"_shards": {"total": 1, "successful": 1, "failed": 0}})
+        else:
+            self.read_body()
+            self.send_json({"error": f"no stub for {self.path}"}, status=404)
+
+    def do_PUT(self) -> None:
+        parts = self.path_parts()
+        if parts[-1] == "_bulk":
+            self.do_POST()
+            return
+        body = json.loads(self.read_body() or b"{}")
+        if len(parts) == 3 and parts[1] == "_doc":
+            self.put_document(parts[0], parts[2], body)
+        elif parts[0] == "_index_template":
+            self.send_json({"acknowledged": True})
+        elif len(parts) > 1 and parts[1] == "_settings":
+            with lock:
+                for index in resolve(parts[0]):
+                    update_settings(index, body)
+            self.send_json({"acknowledged": True})
+        elif len(parts) == 1 and not parts[0].startswith("_"):
+            self.create_index(body.get("settings", {}))
+        else:
+            self.send_json({"error": f"no stub for {self.path}"}, status=404)
+
+    def do_DELETE(self) -> None:
+        parts = self.path_parts()
+        if len(parts) == 3 and parts[1] == "_doc":
+            self.delete_document(parts[0], parts[2])
+            return
+        if "*" in self.index_name():
+            # action.destructive_requires_name defaults to true
+            self.send_error_json("illegal_argument_exception", 400)
+            return
+        with lock:
+            indices = resolve(self.index_name())
+            for index in indices:
+                drop_index(index)
+                for members in aliases.values():
+                    members.discard(index)
+        if indices:
+            self.send_json({"acknowledged": True})
+        else:
+            self.send_error_json("index_not_found_exception", 404)
+
+    def create_index(self, settings: dict[str, Any]) -> None:
+        index = self.index_name()
+        with lock:
+            exists = index in index_settings or bool(aliases.get(index))
+            if not exists:
+                index_settings[index] = {}
+                update_settings(index, settings)
+        if exists:
+            self.send_error_json("resource_already_exists_exception", 400)
+        else:
+            self.send_json({"acknowledged": True, "index": index})
+
+    def update_aliases(self, actions: list[dict[str, Any]]) -> None:
+        """
+        Applies all actions under one lock, like the cluster applies them in one state update
+        """
+        with lock:
+            for action in actions:
+                kind, target = next(iter(action.items()))
+                if kind == "add":
+                    aliases.setdefault(target["alias"], set()).add(target["index"])
+                elif kind == "remove":
+                    aliases.get(target["alias"], set()).discard(target["index"])
+                elif kind == "remove_index":
+                    drop_index(target["index"])
+        self.send_json({"acknowledged": True})
+
+    def get_document(self, target: str, document_id: str) -> None:
+        with lock:
+            indices = resolve(target)
+            source = stored.get((indices[0], document_id)) if len(indices) == 1 else None
+        if source is None:
+            self.send_json({"_index": target, "_id": document_id, "found": False}, status=404)
+        else:
+            body = {"_index": indices[0], "_id": document_id, "found": True, "_source": source}
+            self.send_json(body)
+
+    def put_document(self, index: str, document_id: str, source: dict[str, Any]) -> None:
+        with lock:
+            index_settings.setdefault(index, {})
+            created = (index, document_id) not in stored
+            stored[index, document_id] = source
+            if created:
+                documents[index] = documents.get(index, 0) + 1
+        result = "created" if created else "updated"
+        self.send_json({"_index": index, "_id": document_id, "result": result}, status=201)
+
+    def delete_document(self, index: str, document_id: str) -> None:
+        with lock:
+            found = stored.pop((index, document_id), None) is not None
+            if found:
+                documents[index] -= 1
+        result = "deleted" if found else "not_found"
+        body = {"_index": index, "_id": document_id, "result": result}
+        self.send_json(body, status=200 if found else 404)
+
+    def bulk(self, body: bytes) -> None:
+        time.sleep(args.delay / 1000)
+        if random.random() < args.throttle_rate:
+            error = {"type": "es_rejected_execution_exception", "reason": "stub throttled"}
+            self.send_json({"error": error, "status": 429}, status=429)
+            return
+        lines = [line for line in body.split(b"\n") if line]
+        items = []
+        for action_line in lines[::2]:
+            action, meta = next(iter(json.loads(action_line).items()))
+            index = meta["_index"]
+            if random.random() < args.reject_rate:
+                error = {"type": "es_rejected_execution_exception", "reason": "stub rejected"}
+                items.append({action: {"_index": index, "status": 429, "error": error}})
+                continue
+            with lock:
+                # indices are created by their first document, like with auto_create_index
+                index_settings.setdefault(index, {})
+                documents[index] = documents.get(index, 0) + 1
+            items.append({action: {"_index": index, "status": 201, "result": "created"}})
+        errors = any(item[action]["status"] >= 300 for item in items for action in item)
+        self.send_json({"took": args.delay, "errors": errors, "items": items})
+
+    def log_message(self, format: str, *values: Any) -> None:
+        if args.verbose:
+            super().log_message(format, *values)
+
+
+def drop_index(index: str) -> None:
+    index_settings.pop(index, None)
+    documents.pop(index, None)
+    for key in [key for key in stored if key[0] == index]:
+        del stored[key]
+
+
+def update_settings(index: str, changes: dict[str, Any]) -> None:
+    current = index_settings.setdefault(index, {})
+    for name, value in changes.items():
+        if value is None:
+            current.pop(name, None)
+        else:
+            current[name] = str(value)
+
+
+@contextmanager
+def bulk_server(*options: str) -> Iterator[int]:
+    """
+    Runs the bulk stub in a subprocess on a free port until the block exits
+    """
+    with socket.socket() as probe:
+        probe.bind(("localhost", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, __file__, "-p", str(port), *options])
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                urllib.request.urlopen(f"http://localhost:{port}/")
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        yield port
+    finally:
+        server.terminate()
+        server.wait()
+
+
+parser = argparse.ArgumentParser(
+    prog="Bulk stub server",
+    description="Stand in for the Elasticsearch bulk API on localhost",
+)
+parser.add_argument(
+    "-p",
+    "--port",
+    type=int,
+    help="Port on which to serve",
+    default=9200,
+    dest="port",
+    action="store",
+)
+parser.add_argument(
+    "--reject-rate",
+    type=float,
+    help="Fraction of documents rejected with 429",
+    default=0.0,
+    dest="reject_rate",
+)
+parser.add_argument(
+    "--throttle-rate",
+    type=float,
+    help="Fraction of bulk requests rejected with 429 as a whole",
+    default=0.0,
+    dest="throttle_rate",
+)
+parser.add_argument(
+    "--delay",
+    type=float,
+    help="Milliseconds every bulk request takes",
+    default=0.0,
+    dest="delay",
+)
+parser.add_argument(
+    "-v",
+    "--verbose",
+    help="Log every request",
+    dest="verbose",
+    action="store_true",
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("localhost", args.port), BulkHandler)
+    print(f"Serving the bulk stub on http://localhost:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,47 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# the query modules open the configured databases when they are imported,
+# so the settings point at a sample export that is imported before tests are collected
+DATA_DIR = Path(tempfile.mkdtemp(prefix="apple-health-tests-"))
+os.environ["RAW_XML_PATH"] = str(DATA_DIR / "export.xml")
+os.environ["DUCKDB_FILENAME"] = str(DATA_DIR / "applehealth.duckdb")
+# chdb runs a single server per process, every test shares its data directory
+os.environ["CH_DIRNAME"] = str(DATA_DIR / "applehealth.chdb")
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    from scripts.duckdb_importer import ParquetImporter
+    from tests.sample_export import write_export
+
+    write_export(Path(os.environ["RAW_XML_PATH"]))
+    with contextlib.redirect_stdout(io.StringIO()):
+        ParquetImporter().export_xml()
+
+
+def pytest_unconfigure(config: pytest.Config) -> None:
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def export_path() -> Path:
+    return Path(os.environ["RAW_XML_PATH"])
+
+
+@pytest.fixture(scope="session")
+def ch_database() -> str:
+    """
+    Name of the chdb database the sample export is imported into once per session
+    """
+    from scripts.clickhouse_importer import CHIndexer
+
+    indexer = CHIndexer()
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert indexer.run()
+    return indexer.db_name
@@ -7,7 +7,7 @@ from fastapi.responses import FileResponse
 app = FastAPI()
 
 
-@app.get("/{filename}")
+@app.get("/{filename:path}")
 async def serve_file(filename: str) -> FileResponse:
     return FileResponse(filename)
 
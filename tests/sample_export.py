@@ -0,0 +1,162 @@
+from collections import Counter
+from datetime import UTC, datetime, timedelta, timezone
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+RECORD_UNITS: dict[str, str] = {
+    "HKQuantityTypeIdentifierHeartRate": "count/min",
+    "HKQuantityTypeIdentifierStepCount": "count",
+    "HKQuantityTypeIdentifierBodyMass": "kg",
+}
+SLEEP_TYPE = "HKCategoryTypeIdentifierSleepAnalysis"
+SLEEP_VALUES = ("HKCategoryValueSleepAnalysisAsleepDeep", "HKCategoryValueSleepAnalysisAsleepCore")
+SOURCES = ("Rob’s Watch", "Polar Flow")
+WORKOUT_TYPES = ("HKWorkoutActivityTypeRunning", "HKWorkoutActivityTypeWalking")
+STAT_TYPES = ("HKQuantityTypeIdentifierActiveEnergyBurned", "HKQuantityTypeIdentifierHeartRate")
+
+QUANTITY_RECORDS = 300
+SLEEP_RECORDS = 12
+WORKOUTS = 6
+# samples start in December 2023 and run into February 2024, every fifth hour
+FIRST_START = datetime(2023, 12, 20, 6, 0, tzinfo=UTC)
+SAMPLE_STEP = timedelta(hours=5)
+# local offsets the dates are written in, Apple Health exports the zone of the device
+OFFSETS = (0, -5, 2)
+
+
+def apple_date(moment: datetime, offset_hours: int) -> str:
+    local = moment.astimezone(timezone(timedelta(hours=offset_hours)))
+    return local.strftime("%Y-%m-%d %H:%M:%S %z")
+
+
+def parse_apple_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S %z").astimezone(UTC)
+
+
+def _records() -> list[dict[str, str]]:
+    records = []
+    types = list(RECORD_UNITS)
+    for i in range(QUANTITY_RECORDS):
+        record_type = types[i % len(types)]
+        start = FIRST_START + i * SAMPLE_STEP
+        offset = OFFSETS[i % len(OFFSETS)]
+        records.append(
+            {
+                "type": record_type,
+                "sourceName": SOURCES[i % len(SOURCES)],
+                "sourceVersion": "17.0",
+                "device": "Watch" if i % 2 == 0 else "",
+                "unit": RECORD_UNITS[record_type],
+                "creationDate": apple_date(start + timedelta(minutes=1), offset),
+                "startDate": apple_date(start, offset),
+                "endDate": apple_date(start + timedelta(minutes=1), offset),
+                "value": str(50 + i % 40),
+            },
+        )
+    for i in range(SLEEP_RECORDS):
+        start = FIRST_START + timedelta(days=i, hours=17)
+        records.append(
+            {
+                "type": SLEEP_TYPE,
+                "sourceName": SOURCES[0],
+                "sourceVersion": "17.0",
+                "creationDate": apple_date(start + timedelta(hours=3), 0),
+                "startDate": apple_date(start, 0),
+                "endDate": apple_date(start + timedelta(hours=3), 0),
+                "value": SLEEP_VALUES[i % len(SLEEP_VALUES)],
+            },
+        )
+    return records
+
+
+def _workouts() -> list[tuple[dict[str, str], list[dict[str, str]]]]:
+    workouts = []
+    for i in range(WORKOUTS):
+        start = FIRST_START + timedelta(days=7 * i, hours=12)
+        end = start + timedelta(minutes=30 + i)
+        workout = {
+            "workoutActivityType": WORKOUT_TYPES[i % len(WORKOUT_TYPES)],
+            "duration": str(30 + i),
+            "durationUnit": "min",
+            "sourceName": SOURCES[0],
+            "creationDate": apple_date(end, 0),
+            "startDate": apple_date(start, 0),
+            "endDate": apple_date(end, 0),
+        }
+        stats = [
+            {
+                "type": stat_type,
+                "startDate": apple_date(start, 0),
+                "endDate": apple_date(end, 0),
+                "sum": str(100 * (i + 1)),
+                "average": str(120 + i),
+                "maximum": str(150 + i),
+                "minimum": str(90 + i),
+                "unit": "kcal" if stat_type.endswith("Burned") else "count/min",
+            }
+            for stat_type in STAT_TYPES
+        ]
+        workouts.append((workout, stats))
+    return workouts
+
+
+# attributes of every element of the sample export, in file order
+RECORDS: list[dict[str, str]] = _records()
+WORKOUT_ELEMENTS: list[tuple[dict[str, str], list[dict[str, str]]]] = _workouts()
+RECORD_COUNTS: Counter[str] = Counter(record["type"] for record in RECORDS)
+TABLE_ROWS: dict[str, int] = {
+    "records": len(RECORDS),
+    "workouts": len(WORKOUT_ELEMENTS),
+    "stats": sum(len(stats) for _, stats in WORKOUT_ELEMENTS),
+}
+# (workout_id, duration, stat type, sum) of the statistics joined to their workout,
+# workouts are numbered from 1 in file order
+WORKOUT_STATS: list[tuple[int, float, str, float]] = [
+    (workout_id, float(workout["duration"]), stat["type"], float(stat["sum"]))
+    for workout_id, (workout, stats) in enumerate(WORKOUT_ELEMENTS, 1)
+    for stat in stats
+]
+
+
+def element(tag: str, attrib: dict[str, str], children: str = "") -> str:
+    attributes = " ".join(f"{name}={quoteattr(value)}" for name, value in attrib.items())
+    if not children:
+        return f"<{tag} {attributes}/>"
+    return f"<{tag} {attributes}>\n{children}\n</{tag}>"
+
+
+def export_xml(records: list[dict[str, str]] | None = None) -> str:
+    """
+    An Apple Health export.xml with the sample records, interleaved with the workouts
+    and their statistics, and elements the importers skip
+    """
+    records = RECORDS if records is None else records
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        "<!DOCTYPE HealthData [\n<!ELEMENT HealthData (ExportDate,Me,(Record|Workout)*)>\n]>",
+        '<HealthData locale="en_US">',
+        ' <ExportDate value="2024-03-01 10:00:00 +0000"/>',
+        ' <Me HKCharacteristicTypeIdentifierBiologicalSex="HKBiologicalSexMale"/>',
+    ]
+    workouts = iter(WORKOUT_ELEMENTS)
+    for i, record in enumerate(records):
+        metadata = ""
+        if i % 10 == 0:
+            metadata = element("MetadataEntry", {"key": "HKMetadataKeyTimeZone", "value": "UTC"})
+        lines.append(element("Record", record, metadata))
+        if i % 50 == 25 and (workout := next(workouts, None)):
+            attrib, stats = workout
+            children = [element("WorkoutStatistics", stat) for stat in stats]
+            children.append(element("WorkoutEvent", {"type": "HKWorkoutEventTypeSegment"}))
+            lines.append(element("Workout", attrib, "\n".join(children)))
+    for attrib, stats in workouts:
+        children = "\n".join(element("WorkoutStatistics", stat) for stat in stats)
+        lines.append(element("Workout", attrib, children))
+    lines.append(' <ActivitySummary dateComponents="2024-01-01" activeEnergyBurned="500"/>')
+    lines.append("</HealthData>")
+    return "\n".join(lines) + "\n"
+
+
+def write_export(path: Path, records: list[dict[str, str]] | None = None) -> Path:
+    path.write_text(export_xml(records), encoding="utf-8")
+    return path
@@ -0,0 +1,81 @@
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+from fastmcp import Client
+
+from app.mcp.v1.tools.ch_reader import ch_reader_router
+from app.services.health import clickhouse
+from tests.sample_export import RECORD_COUNTS
+
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+
+
+async def call_tool(name: str, **arguments: Any) -> Any:
+    async with Client(ch_reader_router) as client:
+        result = await client.call_tool(name, arguments)
+    return result.structured_content
+
+
+@pytest.fixture
+def legacy_database(ch_database: str, monkeypatch: pytest.MonkeyPatch) -> Iterator[str]:
+    """
+    Copy of the records imported before rollups and summaries existed
+    """
+    name = "legacy"
+    table = f"{name}.{clickhouse.ch.table_name}"
+    clickhouse.ch.ch_session.query(f"CREATE DATABASE IF NOT EXISTS {name}")
+    clickhouse.ch.ch_session.query(
+        f"CREATE TABLE {table} ENGINE = MergeTree ORDER BY (type, startDate) "
+        f"AS SELECT * FROM {ch_database}.{clickhouse.ch.table_name}",
+    )
+    monkeypatch.setattr(clickhouse.ch, "db_name", name)
+    yield name
+    clickhouse.ch.ch_session.query(f"DROP DATABASE {name}")
+
+
+def comparable(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    rows = [{**row, "average": round(row["average"], 6)} for row in rows]
+    return sorted(rows, key=lambda row: (row["interval"], row["sourceName"]))
+
+
+@pytest.mark.asyncio
+async def test_health_summary_tool_returns_every_record_type(ch_database: str) -> None:
+    summary = await call_tool("get_health_summary_ch")
+
+    assert {row["type"]: int(row["count"]) for row in summary["data"]} == RECORD_COUNTS
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("interval", "date_from", "date_to"),
+    [
+        ("month", None, None),
+        ("week", "2023-12-25", "2024-01-20"),
+    ],
+)
+async def test_trend_tool_answers_from_rollups_like_from_records(
+    interval: str,
+    date_from: str | None,
+    date_to: str | None,
+    legacy_database: str,
+    ch_database: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    arguments = {"interval": interval, "date_from": date_from, "date_to": date_to}
+    raw = await call_tool("get_trend_data_ch", record_type=HEART_RATE, **arguments)
+    monkeypatch.setattr(clickhouse.ch, "db_name", ch_database)
+    rolled_up = await call_tool("get_trend_data_ch", record_type=HEART_RATE, **arguments)
+
+    assert rolled_up["data"]
+    assert comparable(rolled_up["data"]) == comparable(raw["data"])
+
+
+def test_has_rollup(
+    legacy_database: str,
+    ch_database: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    assert not clickhouse.has_rollup()
+    monkeypatch.setattr(clickhouse.ch, "db_name", ch_database)
+    assert clickhouse.has_rollup()
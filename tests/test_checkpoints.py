@@ -0,0 +1,129 @@
+import contextlib
+import io
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from app.config import settings
+from scripts.checkpoints import Checkpoint, source_digest
+from scripts.duckdb_importer import ParquetImporter
+from scripts.xml_exporter import TableBatch, XMLExporter
+from tests.sample_export import RECORDS, TABLE_ROWS, WORKOUT_ELEMENTS, write_export
+
+# enough records for the export to be split into segments of a megabyte
+COPIES = 30
+
+
+@pytest.fixture(scope="module")
+def large_export(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    return write_export(tmp_path_factory.mktemp("checkpoints") / "export.xml", RECORDS * COPIES)
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "IMPORT_CHECKPOINT_MB", 1)
+
+
+def make_importer(path: Path, export: Path) -> ParquetImporter:
+    importer = ParquetImporter()
+    importer.path = path
+    importer.xml_path = export
+    importer.chunk_size = 1_000
+    importer.memory_budget = 0
+    return importer
+
+
+def read_tables(path: Path) -> dict[str, list[tuple]]:
+    with duckdb.connect(str(path), read_only=True) as con:
+        return {
+            table: con.sql(f"SELECT * FROM {table} ORDER BY ALL").fetchall() for table in TABLE_ROWS
+        }
+
+
+def test_checkpoint_round_trip(tmp_path: Path, export_path: Path) -> None:
+    offset = export_path.stat().st_size // 2
+    checkpoint = Checkpoint(
+        offset=offset,
+        segment_size=4096,
+        workouts=3,
+        rows={"records": 10},
+        digest=source_digest(export_path, offset),
+    )
+    checkpoint.save(tmp_path / "checkpoint.json")
+
+    assert Checkpoint.load(tmp_path / "checkpoint.json", export_path) == checkpoint
+    assert checkpoint.report() == f"resuming at byte {offset} with 10 records committed"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["checkpoint.json"]
+
+
+def test_checkpoint_of_another_file_is_refused(tmp_path: Path, export_path: Path) -> None:
+    offset = export_path.stat().st_size // 2
+    Checkpoint(offset=offset, digest=source_digest(export_path, offset)).save(
+        tmp_path / "checkpoint.json",
+    )
+    changed = tmp_path / "export.xml"
+    changed.write_bytes(export_path.read_bytes().replace(b"Polar Flow", b"Polar Flaw", 1))
+
+    with pytest.raises(SystemExit, match="is not the file"):
+        Checkpoint.load(tmp_path / "checkpoint.json", changed)
+    with pytest.raises(SystemExit, match="No checkpoint"):
+        Checkpoint.load(tmp_path / "missing.json", export_path)
+
+
+def test_checkpoints_split_the_batches_at_segment_ends(large_export: Path) -> None:
+    exporter = XMLExporter()
+    exporter.xml_path = large_export
+    exporter.memory_budget = 0
+    items = list(exporter.iter_checkpointed_batches(Checkpoint()))
+    checkpoints = [item for item in items if isinstance(item, Checkpoint)]
+
+    assert len(checkpoints) > 1
+    assert checkpoints[-1].offset == large_export.stat().st_size
+    assert checkpoints[-1].workouts == len(WORKOUT_ELEMENTS)
+    assert all(checkpoint.segment_size == 1024 * 1024 for checkpoint in checkpoints)
+
+    # resuming from the first checkpoint yields the batches after it
+    resumed = XMLExporter()
+    resumed.xml_path = large_export
+    resumed.memory_budget = 0
+    first = items.index(checkpoints[0])
+    after = list(resumed.iter_checkpointed_batches(checkpoints[0]))
+    assert [item.batch for item in after if isinstance(item, TableBatch)] == [
+        item.batch for item in items[first + 1 :] if isinstance(item, TableBatch)
+    ]
+    assert resumed.summary is None
+
+
+def test_resumed_import_equals_a_full_import(
+    tmp_path: Path,
+    large_export: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    full = make_importer(tmp_path / "full.duckdb", large_export)
+    with contextlib.redirect_stdout(io.StringIO()):
+        full.export_xml()
+
+    importer = make_importer(tmp_path / "resumed.duckdb", large_export)
+    write_batch = ParquetImporter.write_batch
+
+    def crash_after_checkpoint(con: duckdb.DuckDBPyConnection, chunk: TableBatch) -> None:
+        if importer.checkpoint_path.exists():
+            raise OSError("killed")
+        write_batch(con, chunk)
+
+    with monkeypatch.context() as patch, contextlib.redirect_stdout(io.StringIO()):
+        patch.setattr(ParquetImporter, "write_batch", staticmethod(crash_after_checkpoint))
+        with pytest.raises(OSError, match="killed"):
+            importer.export_xml()
+    assert importer.staging_path.exists()
+    assert not importer.path.exists()
+
+    resumed = make_importer(tmp_path / "resumed.duckdb", large_export)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        resumed.export_xml(resume=True)
+
+    assert "resuming at byte" in output.getvalue()
+    assert read_tables(resumed.path) == read_tables(full.path)
+    assert not resumed.checkpoint_path.exists()
+    assert not resumed.staging_path.exists()
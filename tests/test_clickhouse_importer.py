@@ -0,0 +1,48 @@
+from typing import Any
+
+from app.services.health import clickhouse
+from app.services.health.sql_helpers import ROLLUP_GRAINS, ROLLUP_TABLE
+from tests.sample_export import RECORD_COUNTS, TABLE_ROWS, WORKOUT_STATS
+
+
+def query_rows(query: str) -> list[dict[str, Any]]:
+    return clickhouse.ch.inquire(query)["data"]
+
+
+def test_import_writes_every_element(ch_database: str) -> None:
+    for table, rows in TABLE_ROWS.items():
+        name = clickhouse.ch.table_name if table == "records" else table
+        (row,) = query_rows(f"SELECT count() AS rows FROM {ch_database}.{name}")
+        assert int(row["rows"]) == rows
+    counts = query_rows(
+        f"SELECT type, count() AS rows FROM {ch_database}.{clickhouse.ch.table_name} GROUP BY type",
+    )
+    assert {row["type"]: int(row["rows"]) for row in counts} == RECORD_COUNTS
+
+
+def test_stats_join_their_workout(ch_database: str) -> None:
+    joined = query_rows(
+        f"SELECT workout_id, duration, stats.type AS type, sum "
+        f"FROM {ch_database}.workouts INNER JOIN {ch_database}.stats USING (workout_id) "
+        f"ORDER BY workout_id, type",
+    )
+    assert [
+        (int(row["workout_id"]), row["duration"], row["type"], row["sum"]) for row in joined
+    ] == sorted(WORKOUT_STATS)
+
+
+def test_records_are_sorted_by_type_and_date(ch_database: str) -> None:
+    (row,) = query_rows(
+        f"SELECT sorting_key FROM system.tables "
+        f"WHERE database = '{ch_database}' AND name = '{clickhouse.ch.table_name}'",
+    )
+    assert row["sorting_key"] == "type, startDate"
+
+
+def test_rollups_count_every_record(ch_database: str) -> None:
+    for grain in ROLLUP_GRAINS:
+        counts = query_rows(
+            f"SELECT type, sum(sample_count) AS samples FROM {ch_database}.{ROLLUP_TABLE} "
+            f"WHERE grain = '{grain}' GROUP BY type",
+        )
+        assert {row["type"]: int(row["samples"]) for row in counts} == RECORD_COUNTS
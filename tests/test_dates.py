@@ -0,0 +1,72 @@
+from datetime import UTC, datetime
+
+import pyarrow as pa
+import pytest
+
+from scripts.dates import parse_dates, to_isoformat, to_timestamp_array, to_utc_isoformat
+from tests.sample_export import RECORDS
+
+DATES = [
+    "2022-04-29 05:49:44 -0400",
+    "2024-02-29 23:59:59 +0000",
+    "2023-12-31 22:00:00 -0500",
+    "2000-03-01 00:00:00 +1400",
+    "1969-07-20 20:17:40 -1200",
+    "2024-06-30 12:30:00 +0530",
+]
+
+
+def expected(value: str) -> tuple[int, int]:
+    parsed = datetime.strptime(value, "%Y-%m-%d %H:%M:%S %z")
+    utcoffset = parsed.utcoffset()
+    assert utcoffset is not None
+    return int(parsed.timestamp()), int(utcoffset.total_seconds() // 60)
+
+
+def test_parse_dates_matches_strptime() -> None:
+    values = DATES + [record["startDate"] for record in RECORDS]
+    epoch, offset, missing = parse_dates(values)
+
+    assert list(zip(epoch.tolist(), offset.tolist(), strict=True)) == [
+        expected(value) for value in values
+    ]
+    assert not missing.any()
+
+
+def test_parse_dates_masks_missing_values() -> None:
+    epoch, _, missing = parse_dates([None, DATES[0], None])
+
+    assert missing.tolist() == [True, False, True]
+    assert epoch[1] == expected(DATES[0])[0]
+
+
+def test_parse_dates_falls_back_for_other_formats() -> None:
+    # an offset with a colon does not fit the fixed-width layout
+    epoch, offset, _ = parse_dates(["2024-06-30 12:30:00 +05:30", DATES[1]])
+
+    assert (epoch[0], offset[0]) == expected("2024-06-30 12:30:00 +0530")
+    assert epoch[1] == expected(DATES[1])[0]
+
+
+def test_parse_dates_rejects_garbage() -> None:
+    with pytest.raises(ValueError, match="does not match format"):
+        parse_dates(["yesterday"])
+
+
+def test_parse_dates_of_nothing() -> None:
+    epoch, offset, missing = parse_dates([])
+
+    assert (len(epoch), len(offset), len(missing)) == (0, 0, 0)
+
+
+@pytest.mark.parametrize("unit", ["s", "ms", "us", "ns"])
+def test_to_timestamp_array(unit: str) -> None:
+    array = to_timestamp_array([DATES[0], None], pa.timestamp(unit, tz="UTC"))
+
+    assert array.type == pa.timestamp(unit, tz="UTC")
+    assert array.to_pylist() == [datetime(2022, 4, 29, 9, 49, 44, tzinfo=UTC), None]
+
+
+def test_isoformat() -> None:
+    assert to_isoformat(DATES[0]) == "2022-04-29T05:49:44-04:00"
+    assert to_utc_isoformat(to_isoformat(DATES[0])) == "2022-04-29T09:49:44+00:00"
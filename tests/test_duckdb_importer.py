@@ -0,0 +1,107 @@
+import contextlib
+import io
+from collections.abc import Iterator
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from app.config import settings
+from app.services.health.sql_helpers import ROLLUP_GRAINS, ROLLUP_TABLE, enum_name
+from scripts.duckdb_importer import ParquetImporter
+from scripts.xml_exporter import XMLExporter
+from tests.sample_export import RECORD_COUNTS, RECORDS, TABLE_ROWS, WORKOUT_STATS
+
+
+@pytest.fixture
+def con() -> Iterator[duckdb.DuckDBPyConnection]:
+    """
+    Database the sample export was imported into before the tests were collected
+    """
+    con = duckdb.connect(settings.DUCKDB_FILENAME, read_only=True)
+    yield con
+    con.close()
+
+
+def import_export(path: Path) -> None:
+    importer = ParquetImporter()
+    importer.path = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        importer.export_xml()
+
+
+def test_import_writes_every_element(con: duckdb.DuckDBPyConnection) -> None:
+    for table, rows in TABLE_ROWS.items():
+        assert con.sql(f"SELECT count(*) FROM {table}").fetchone() == (rows,)
+    counts = con.sql("SELECT type::VARCHAR, count(*) FROM records GROUP BY ALL").fetchall()
+    assert dict(counts) == RECORD_COUNTS
+
+
+def test_import_keeps_values(con: duckdb.DuckDBPyConnection) -> None:
+    # category records such as sleep analysis have a text value and no unit
+    total = sum(float(record["value"]) for record in RECORDS if "unit" in record)
+    (imported,) = con.sql("SELECT sum(value) FROM records WHERE unit::VARCHAR <> ''").fetchone()
+    assert imported == pytest.approx(total)
+    texts = con.sql("SELECT DISTINCT textValue FROM records WHERE unit::VARCHAR = ''").fetchall()
+    assert {text for (text,) in texts} == {
+        record["value"] for record in RECORDS if "unit" not in record
+    }
+
+
+def test_stats_join_their_workout(con: duckdb.DuckDBPyConnection) -> None:
+    joined = con.sql(
+        "SELECT workout_id, duration, stats.type::VARCHAR, sum "
+        "FROM workouts INNER JOIN stats USING (workout_id) ORDER BY ALL",
+    ).fetchall()
+    assert joined == sorted(WORKOUT_STATS)
+
+
+def test_dictionary_columns_are_enums(con: duckdb.DuckDBPyConnection) -> None:
+    for table, columns in XMLExporter.DICTIONARY_COLUMNS.items():
+        for column in columns:
+            enum = enum_name(table, column)
+            (column_type,) = con.sql(
+                f"SELECT data_type FROM duckdb_columns() "
+                f"WHERE table_name = '{table}' AND column_name = '{column}'",
+            ).fetchone()
+            assert column_type.startswith("ENUM(")
+            labels = con.sql(f"SELECT unnest(enum_range(NULL::{enum}))").fetchall()
+            values = con.sql(f'SELECT DISTINCT "{column}"::VARCHAR FROM {table}').fetchall()
+            assert sorted(labels) == sorted(values)
+
+
+def test_tables_are_stored_in_sort_key_order(con: duckdb.DuckDBPyConnection) -> None:
+    for table, keys in ParquetImporter.SORT_KEYS.items():
+        columns = ", ".join(f'"{key}"' for key in keys)
+        stored = con.sql(f"SELECT {columns} FROM {table} ORDER BY rowid").fetchall()
+        assert stored == sorted(stored)
+
+
+def test_import_appends_to_an_existing_database(tmp_path: Path) -> None:
+    path = tmp_path / "applehealth.duckdb"
+    import_export(path)
+    import_export(path)
+
+    with duckdb.connect(str(path), read_only=True) as con:
+        for table, rows in TABLE_ROWS.items():
+            assert con.sql(f"SELECT count(*) FROM {table}").fetchone() == (2 * rows,)
+        # the workouts of the second import are numbered after the first ones
+        ids = con.sql("SELECT workout_id FROM workouts ORDER BY ALL").fetchall()
+        assert ids == [(workout_id,) for workout_id in range(1, 2 * TABLE_ROWS["workouts"] + 1)]
+        orphans = con.sql("SELECT count(*) FROM stats ANTI JOIN workouts USING (workout_id)")
+        assert orphans.fetchone() == (0,)
+        stored = con.sql('SELECT "type", "startDate" FROM records ORDER BY rowid').fetchall()
+        assert stored == sorted(stored)
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["applehealth.duckdb"]
+
+
+def test_rollups_count_every_record(con: duckdb.DuckDBPyConnection) -> None:
+    for grain in ROLLUP_GRAINS:
+        counts = con.execute(
+            f"SELECT type::VARCHAR, sum(sample_count)::BIGINT, sum(value_sum) "
+            f"FROM {ROLLUP_TABLE} WHERE grain = ? GROUP BY ALL",
+            [grain],
+        ).fetchall()
+        assert {record_type: count for record_type, count, _ in counts} == RECORD_COUNTS
+        raw = con.sql("SELECT type::VARCHAR, sum(value) FROM records GROUP BY ALL").fetchall()
+        assert {record_type: pytest.approx(total) for record_type, _, total in counts} == dict(raw)
@@ -0,0 +1,127 @@
+from typing import Any
+
+import pytest
+from fastmcp import Client
+
+from app.mcp.v1.tools.duckdb_reader import duckdb_reader_router
+from app.services.health import duckdb_queries
+from tests.sample_export import (
+    RECORD_COUNTS,
+    RECORD_UNITS,
+    RECORDS,
+    SOURCES,
+    TABLE_ROWS,
+    WORKOUT_TYPES,
+    parse_apple_date,
+)
+
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+
+
+async def call_tool(name: str, **arguments: Any) -> Any:
+    """
+    Calls a tool like an MCP client, so results that do not serialize fail the test
+    """
+    async with Client(duckdb_reader_router) as client:
+        result = await client.call_tool(name, arguments)
+    return result.structured_content["result"]
+
+
+@pytest.mark.asyncio
+async def test_health_summary_tool_returns_every_type() -> None:
+    summary = await call_tool("get_health_summary_duckdb")
+
+    counts = {row["type"]: row["count"] for row in summary}
+    assert {record_type: counts[record_type] for record_type in RECORD_COUNTS} == RECORD_COUNTS
+    assert sum(counts[workout] for workout in WORKOUT_TYPES) == TABLE_ROWS["workouts"]
+    heart_rate = next(row for row in summary if row["type"] == HEART_RATE)
+    assert heart_rate["sources"] == sorted(SOURCES)
+    assert heart_rate["units"] == [RECORD_UNITS[HEART_RATE]]
+
+
+@pytest.mark.asyncio
+async def test_health_summary_tool_aggregates_without_summary(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    stored = await call_tool("get_health_summary_duckdb")
+    monkeypatch.setattr(duckdb_queries, "has_summary", False)
+
+    assert await call_tool("get_health_summary_duckdb") == stored
+
+
+def test_summary_is_fresh_after_import() -> None:
+    assert duckdb_queries.summary_is_fresh()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("enums", [True, False])
+async def test_search_tool_filters_by_type(
+    enums: bool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    assert duckdb_queries.has_enums
+    monkeypatch.setattr(duckdb_queries, "has_enums", enums)
+    params = {"record_type": HEART_RATE, "limit": 500}
+    records = await call_tool("search_health_records_duckdb", params=params)
+
+    assert len(records) == RECORD_COUNTS[HEART_RATE]
+    assert {record["type"] for record in records} == {HEART_RATE}
+
+
+@pytest.mark.asyncio
+async def test_unknown_type_matches_nothing() -> None:
+    params = {"record_type": "HKQuantityTypeIdentifierUnknown"}
+
+    assert await call_tool("search_health_records_duckdb", params=params) == []
+    assert await call_tool("get_statistics_by_type_duckdb", record_type=params["record_type"]) == []
+
+
+def comparable(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Trend rows in a stable order, averages computed in another order differ in the last bits
+    """
+    rows = [{**row, "average": round(row["average"], 9)} for row in rows]
+    return sorted(rows, key=lambda row: (row["interval"], row["sourceName"]))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("interval", "date_from", "date_to"),
+    [
+        ("week", None, None),
+        ("day", "2023-12-25", "2024-01-05"),
+        ("month", "2024-01-01T00:00:00+00:00", "2024-01-31T23:59:59+00:00"),
+    ],
+)
+async def test_trend_tool_answers_from_rollups_like_from_records(
+    interval: str,
+    date_from: str | None,
+    date_to: str | None,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    arguments = {"interval": interval, "date_from": date_from, "date_to": date_to}
+    rolled_up = await call_tool("get_trend_data_duckdb", record_type=HEART_RATE, **arguments)
+    monkeypatch.setattr(duckdb_queries, "has_rollup", False)
+    raw = await call_tool("get_trend_data_duckdb", record_type=HEART_RATE, **arguments)
+
+    assert rolled_up
+    assert comparable(rolled_up) == comparable(raw)
+
+
+@pytest.mark.asyncio
+async def test_trend_tool_includes_the_whole_last_day(monkeypatch: pytest.MonkeyPatch) -> None:
+    expected = sum(
+        1
+        for record in RECORDS
+        if record["type"] == HEART_RATE
+        and parse_apple_date(record["startDate"]).date().isoformat() <= "2024-01-05"
+    )
+    monkeypatch.setattr(duckdb_queries, "has_rollup", False)
+    trend = await call_tool(
+        "get_trend_data_duckdb",
+        record_type=HEART_RATE,
+        interval="year",
+        date_to="2024-01-05",
+    )
+
+    assert sum(row["count"] for row in trend) == expected
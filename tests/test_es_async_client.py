@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+from elastic_transport import NodeConfig
+
+from app.config import settings
+from app.services.es_async_client import AsyncESClient, KeepAliveHttpxNode
+from tests.bulkserver import bulk_server
+
+
+def node_of(client: AsyncESClient) -> KeepAliveHttpxNode:
+    (node,) = client.engine.transport.node_pool.all()
+    assert isinstance(node, KeepAliveHttpxNode)
+    return node
+
+
+def test_pool_keeps_idle_connections() -> None:
+    # reads the pool httpx built from the public limits, fails if httpx stops honouring them
+    pool = node_of(AsyncESClient()).client._transport._pool
+    assert pool._keepalive_expiry == settings.ES_KEEPALIVE_SECONDS
+    assert pool._max_connections == settings.ES_POOL_CONNECTIONS
+
+
+def test_node_refuses_tls() -> None:
+    with pytest.raises(ValueError, match="plain HTTP"):
+        KeepAliveHttpxNode(NodeConfig("https", "localhost", 9200))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_the_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    with bulk_server() as port:
+        monkeypatch.setattr(settings, "ES_PORT", port)
+        client = AsyncESClient()
+        responses = await asyncio.gather(*(client.engine.info() for _ in range(20)))
+        node = node_of(client)
+        await client.engine.close()
+
+    assert all(response["version"]["number"] for response in responses)
+    assert node.client.is_closed
+    assert node.base_client.is_closed
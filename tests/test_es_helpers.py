@@ -0,0 +1,140 @@
+import pytest
+
+from app.schemas.record import HealthRecordSearchParams
+from app.services.health.es_helpers import (
+    date_filter,
+    decode_cursor,
+    encode_cursor,
+    filter_query,
+    page_query,
+    range_filter,
+    record_filters,
+    rollup_days,
+    term_filter,
+    type_filter,
+)
+
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+RUNNING = "HKWorkoutActivityTypeRunning"
+
+
+def test_range_filter_keeps_the_given_bounds() -> None:
+    assert range_filter("value", 1, 2) == {"range": {"value": {"gte": 1, "lte": 2}}}
+    assert range_filter("value", lte=0) == {"range": {"value": {"lte": 0}}}
+    assert range_filter("value") is None
+    assert date_filter(None, None) is None
+    assert date_filter("2024-01-01", None) == {
+        "range": {"dateComponents": {"gte": "2024-01-01"}},
+    }
+
+
+def test_type_filter_matches_the_field_of_the_table() -> None:
+    assert type_filter(HEART_RATE) == term_filter("type", HEART_RATE)
+    assert type_filter(RUNNING) == {"term": {"workoutActivityType": RUNNING}}
+
+
+def test_filter_query_runs_every_clause_in_filter_context() -> None:
+    clauses = [term_filter("sourceName", "Watch"), None, range_filter("value", 1)]
+
+    assert filter_query(clauses, 5) == {
+        "size": 5,
+        "query": {"bool": {"filter": [clauses[0], clauses[2]]}},
+    }
+    assert filter_query([None, None], 0) == {"size": 0, "query": {"match_all": {}}}
+
+
+def test_record_filters() -> None:
+    params = HealthRecordSearchParams(
+        record_type=HEART_RATE,
+        source_name="Watch",
+        date_from="2024-01-01",
+        value_min="60",
+    )
+
+    assert record_filters(params) == [
+        {"term": {"type": HEART_RATE}},
+        {"term": {"sourceName": "Watch"}},
+        {"range": {"dateComponents": {"gte": "2024-01-01"}}},
+        {"range": {"value": {"gte": "60"}}},
+    ]
+    assert record_filters(HealthRecordSearchParams()) == []
+
+
+@pytest.mark.parametrize(
+    ("params", "expected"),
+    [
+        (
+            HealthRecordSearchParams(record_type=RUNNING, value_max="1800"),
+            {"range": {"duration": {"lte": "1800"}}},
+        ),
+        (
+            HealthRecordSearchParams(record_type=RUNNING, min_workout_duration="600"),
+            {"range": {"duration": {"gte": "600"}}},
+        ),
+    ],
+)
+def test_workout_values_are_their_durations(
+    params: HealthRecordSearchParams,
+    expected: dict,
+) -> None:
+    assert record_filters(params) == [type_filter(RUNNING), expected]
+
+
+def test_page_query_continues_after_the_last_hit() -> None:
+    pit = {"id": "pit", "keep_alive": "1m"}
+    first = page_query([type_filter(HEART_RATE)], 3, pit, None)
+
+    assert first == {
+        **filter_query([type_filter(HEART_RATE)], 3),
+        "pit": pit,
+        "sort": [{"dateComponents": "desc"}],
+        "track_total_hits": False,
+    }
+    after = ["2024-01-01T00:00:00+00:00", 7]
+    assert page_query([], 3, pit, after) == {
+        **filter_query([], 3),
+        "pit": pit,
+        "sort": [{"dateComponents": "desc"}],
+        "track_total_hits": False,
+        "search_after": after,
+    }
+
+
+def test_cursor_round_trip() -> None:
+    after = ["2024-01-01T00:00:00+00:00", 7]
+    cursor = encode_cursor("a+b/c==", after)
+
+    assert decode_cursor(cursor) == ("a+b/c==", after)
+    # the cursor is passed around in URLs and JSON
+    assert cursor.isascii()
+    assert not {"+", "/"} & set(cursor)
+
+
+# not base64, base64 of a truncated cursor and of an empty JSON list
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor("pit", [1])[:12], "W10="])
+def test_invalid_cursors_are_refused(cursor: str) -> None:
+    with pytest.raises(ValueError, match="not returned by a previous search"):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize(
+    ("date_from", "date_to", "days"),
+    [
+        (None, None, (None, None)),
+        ("2024-01-01", "2024-01-31", ("2024-01-01", "2024-01-31")),
+        ("2024-01-01T00:00:00+00:00", "2024-01-31T23:59:59Z", ("2024-01-01", "2024-01-31")),
+        (None, "2024-01-31T23:59:59", (None, "2024-01-31")),
+        # cuts through a day
+        ("2024-01-01T12:00:00+00:00", None, None),
+        (None, "2024-01-31T00:00:00+00:00", None),
+        # the days of another offset are not the UTC days of the aggregates
+        ("2024-01-01T00:00:00+02:00", None, None),
+        ("yesterday", None, None),
+    ],
+)
+def test_rollup_days(
+    date_from: str | None,
+    date_to: str | None,
+    days: tuple[str | None, str | None] | None,
+) -> None:
+    assert rollup_days(date_from, date_to) == days
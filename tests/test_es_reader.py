@@ -0,0 +1,380 @@
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import NotFoundError
+from fastmcp import Client
+
+from app.config import settings
+from app.mcp.v1.tools.es_reader import es_reader_router
+from app.schemas.record import HealthRecordSearchParams
+from app.services.health import elasticsearch as es_queries
+from app.services.health.es_helpers import (
+    decode_cursor,
+    filter_query,
+    record_filters,
+    rollup_alias,
+)
+
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+
+
+def not_found() -> NotFoundError:
+    meta = ApiResponseMeta(404, "1.1", HttpHeaders(), 0.0, NodeConfig("http", "localhost", 9200))
+    return NotFoundError("index_not_found_exception", meta, {})
+
+
+def hits(*sources: dict[str, Any]) -> dict[str, Any]:
+    return {"hits": {"hits": [{"_source": source} for source in sources]}}
+
+
+class FakeEngine:
+    """
+    Stands in for AsyncElasticsearch, answers the searches with the given responses in turn
+    and keeps the arguments of every request
+    """
+
+    def __init__(self, *responses: Any) -> None:
+        self.responses = list(responses)
+        self.requests: list[tuple[str, dict[str, Any]]] = []
+        self.indices = SimpleNamespace(get_alias=self.get_alias)
+
+    def respond(self, method: str, **kwargs: Any) -> Any:
+        self.requests.append((method, kwargs))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def search(self, **kwargs: Any) -> Any:
+        return self.respond("search", **kwargs)
+
+    async def get_alias(self, **kwargs: Any) -> Any:
+        # an index imported before the partitioning
+        self.requests.append(("get_alias", kwargs))
+        raise not_found()
+
+    def searches(self) -> list[dict[str, Any]]:
+        return [kwargs for method, kwargs in self.requests if method == "search"]
+
+
+@pytest.fixture
+def engine(monkeypatch: pytest.MonkeyPatch) -> FakeEngine:
+    engine = FakeEngine()
+    monkeypatch.setattr(es_queries.es_client, "engine", engine)
+    return engine
+
+
+class PointInTimeEngine(FakeEngine):
+    """
+    Pages through the documents newest first like a point in time,
+    whose id changes with every page like the ids Elasticsearch returns can
+    """
+
+    def __init__(self, documents: list[dict[str, Any]]) -> None:
+        super().__init__()
+        self.documents = sorted(documents, key=lambda d: d["dateComponents"], reverse=True)
+        self.open: set[str] = set()
+
+    async def open_point_in_time(self, **kwargs: Any) -> dict[str, str]:
+        self.requests.append(("open_point_in_time", kwargs))
+        self.open.add("pit")
+        return {"id": "pit"}
+
+    async def close_point_in_time(self, **kwargs: Any) -> dict[str, Any]:
+        self.requests.append(("close_point_in_time", kwargs))
+        self.open.remove(kwargs["id"])
+        return {"succeeded": True}
+
+    async def search(self, **kwargs: Any) -> dict[str, Any]:
+        self.requests.append(("search", kwargs))
+        body = kwargs["body"]
+        pit_id = body["pit"]["id"]
+        if pit_id not in self.open:
+            raise not_found()
+        # the sort values are the date and the _shard_doc tiebreaker, the position here
+        start = body["search_after"][1] + 1 if "search_after" in body else 0
+        page = self.documents[start : start + body["size"]]
+        self.open.remove(pit_id)
+        self.open.add(f"{pit_id}+")
+        return {
+            "pit_id": f"{pit_id}+",
+            "hits": {
+                "hits": [
+                    {"_source": document, "sort": [document["dateComponents"], position]}
+                    for position, document in enumerate(page, start)
+                ],
+            },
+        }
+
+
+def documents(count: int) -> list[dict[str, Any]]:
+    return [
+        {"type": HEART_RATE, "value": day, "dateComponents": f"2024-01-{day:02d}T00:00:00+00:00"}
+        for day in range(1, count + 1)
+    ]
+
+
+async def call_tool(name: str, **arguments: Any) -> Any:
+    async with Client(es_reader_router) as client:
+        result = await client.call_tool(name, arguments)
+    return result.structured_content
+
+
+@pytest.mark.asyncio
+async def test_only_aggregations_use_the_request_cache(engine: FakeEngine) -> None:
+    engine.responses = [{}, {}]
+    await es_queries._run_es_query({"size": 0, "aggs": {}})
+    await es_queries._run_es_query({"size": 10}, "records-2024")
+
+    assert [search["request_cache"] for search in engine.searches()] == [True, None]
+    assert [search["index"] for search in engine.searches()] == [settings.ES_INDEX, "records-2024"]
+
+
+@pytest.mark.asyncio
+async def test_search_tool_sends_the_compiled_filters(engine: FakeEngine) -> None:
+    params = HealthRecordSearchParams(record_type=HEART_RATE, date_from="2024-01-01", limit=2)
+    engine.responses = [hits({"type": HEART_RATE, "value": 60}, {"type": HEART_RATE})]
+
+    result = await call_tool("search_health_records_es", params=params.model_dump())
+
+    assert result["result"] == [{"type": HEART_RATE, "value": 60}, {"type": HEART_RATE}]
+    (search,) = engine.searches()
+    assert search == {
+        "index": settings.ES_INDEX,
+        "body": filter_query(record_filters(params), 2),
+        "request_cache": None,
+    }
+    # the dates looked for partitions of the alias first
+    assert engine.requests[0] == ("get_alias", {"name": settings.ES_INDEX})
+
+
+async def follow_pages(name: str, **arguments: Any) -> list[dict[str, Any]]:
+    pages = [await call_tool(name, **arguments)]
+    while pages[-1]["next_cursor"] is not None:
+        pages.append(await call_tool(name, **arguments, cursor=pages[-1]["next_cursor"]))
+    return pages
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(("count", "sizes"), [(5, [2, 2, 1]), (4, [2, 2, 0])])
+async def test_page_tool_follows_the_cursor_to_the_last_page(
+    monkeypatch: pytest.MonkeyPatch,
+    count: int,
+    sizes: list[int],
+) -> None:
+    engine = PointInTimeEngine(documents(count))
+    monkeypatch.setattr(es_queries.es_client, "engine", engine)
+    params = HealthRecordSearchParams(record_type=HEART_RATE, limit=2)
+
+    pages = await follow_pages("search_health_records_page_es", params=params.model_dump())
+
+    assert [len(page["records"]) for page in pages] == sizes
+    assert [record for page in pages for record in page["records"]] == engine.documents
+    # one point in time for every page, closed after the last one
+    methods = [method for method, _ in engine.requests]
+    assert methods == ["open_point_in_time", *["search"] * len(pages), "close_point_in_time"]
+    assert engine.requests[0][1]["index"] == settings.ES_INDEX
+    assert not engine.open
+    searches = engine.searches()
+    assert all(
+        search["body"]["query"] == {"bool": {"filter": record_filters(params)}}
+        for search in searches
+    )
+    # later pages continue with the id and the sort values of the previous page
+    for page, search in zip(pages[:-1], searches[1:], strict=True):
+        pit_id, search_after = decode_cursor(page["next_cursor"])
+        assert search["body"]["pit"]["id"] == pit_id
+        assert search["body"]["search_after"] == search_after
+
+
+@pytest.mark.asyncio
+async def test_values_page_tool_matches_the_text(monkeypatch: pytest.MonkeyPatch) -> None:
+    engine = PointInTimeEngine(documents(3))
+    monkeypatch.setattr(es_queries.es_client, "engine", engine)
+
+    pages = await follow_pages("search_values_page_es", record_type=HEART_RATE, value="60")
+
+    assert [len(page["records"]) for page in pages] == [3]
+    (search,) = engine.searches()
+    assert search["body"]["query"]["bool"]["filter"] == [
+        {"match": {"textvalue": "60"}},
+        {"term": {"type": HEART_RATE}},
+    ]
+    assert not engine.open
+
+
+@pytest.mark.asyncio
+async def test_expired_cursor_asks_for_a_new_search(monkeypatch: pytest.MonkeyPatch) -> None:
+    engine = PointInTimeEngine(documents(5))
+    monkeypatch.setattr(es_queries.es_client, "engine", engine)
+    params = HealthRecordSearchParams(limit=2).model_dump()
+    first = await call_tool("search_health_records_page_es", params=params)
+    # the point in time was not kept alive
+    engine.open.clear()
+
+    expired = await call_tool(
+        "search_health_records_page_es",
+        params=params,
+        cursor=first["next_cursor"],
+    )
+    invalid = await call_tool("search_health_records_page_es", params=params, cursor="W10=")
+
+    assert "search again without it" in expired["error"]
+    assert "not returned by a previous search" in invalid["error"]
+    # the point in time the cursor belongs to is not reopened
+    assert [method for method, _ in engine.requests].count("open_point_in_time") == 1
+
+
+def rollup_trend(documents: float, buckets: list[dict[str, Any]]) -> dict[str, Any]:
+    return {
+        "aggregations": {
+            "documents": {"value": documents},
+            "trend_over_time": {"buckets": buckets},
+        },
+    }
+
+
+def bucket(day: str, **values: float | None) -> dict[str, Any]:
+    return {"key_as_string": day, **{name: {"value": value} for name, value in values.items()}}
+
+
+@pytest.mark.asyncio
+async def test_trend_tool_answers_from_the_daily_aggregates(engine: FakeEngine) -> None:
+    engine.responses = [
+        rollup_trend(
+            4,
+            [
+                bucket("2024-01-01", min_value=50, max_value=70, value_sum=180, count=3.0),
+                bucket("2024-02-01", min_value=None, max_value=None, value_sum=0, count=0.0),
+            ],
+        ),
+    ]
+
+    result = await call_tool(
+        "get_trend_data_es",
+        record_type=HEART_RATE,
+        date_from="2024-01-01",
+        date_to="2024-02-29T23:59:59+00:00",
+    )
+
+    assert result["trend_data"] == [
+        {
+            "date": "2024-01-01",
+            "avg_value": 60.0,
+            "min_value": 50,
+            "max_value": 70,
+            "value_sum": 180,
+            "count": 3,
+        },
+        {
+            "date": "2024-02-01",
+            "avg_value": None,
+            "min_value": None,
+            "max_value": None,
+            "value_sum": 0,
+            "count": 0,
+        },
+    ]
+    (search,) = engine.searches()
+    assert search["index"] == rollup_alias(settings.ES_INDEX)
+    assert search["request_cache"]
+    assert search["body"]["query"]["bool"]["filter"] == [
+        {"term": {"type": HEART_RATE}},
+        {"range": {"day": {"gte": "2024-01-01", "lte": "2024-02-29"}}},
+    ]
+    assert search["body"]["aggs"]["documents"] == {"sum": {"field": "documents"}}
+
+
+RECORDS_TREND = {
+    "aggregations": {
+        "trend_over_time": {
+            "buckets": [
+                bucket(
+                    "2024-01-01",
+                    avg_value=60.0,
+                    min_value=50,
+                    max_value=70,
+                    value_sum=180,
+                    count=3,
+                ),
+            ],
+        },
+    },
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("rollup", [not_found(), rollup_trend(0, [])])
+async def test_trend_tool_falls_back_to_the_records(engine: FakeEngine, rollup: Any) -> None:
+    # no aggregates index, or none of its days hold the type
+    engine.responses = [rollup, RECORDS_TREND]
+
+    result = await call_tool("get_trend_data_es", record_type=HEART_RATE)
+
+    assert [row["avg_value"] for row in result["trend_data"]] == [60.0]
+    assert [search["index"] for search in engine.searches()] == [
+        rollup_alias(settings.ES_INDEX),
+        settings.ES_INDEX,
+    ]
+    histogram = engine.searches()[1]["body"]["aggs"]["trend_over_time"]["date_histogram"]
+    assert histogram["field"] == "dateComponents"
+
+
+@pytest.mark.asyncio
+async def test_trend_tool_needs_the_records_for_parts_of_days(engine: FakeEngine) -> None:
+    engine.responses = [RECORDS_TREND]
+
+    await call_tool(
+        "get_trend_data_es",
+        record_type=HEART_RATE,
+        date_from="2024-01-01T12:00:00+00:00",
+    )
+
+    (search,) = engine.searches()
+    assert search["body"]["query"]["bool"]["filter"][1] == {
+        "range": {"dateComponents": {"gte": "2024-01-01T12:00:00+00:00"}},
+    }
+
+
+@pytest.mark.asyncio
+async def test_statistics_tool_answers_from_the_daily_aggregates(engine: FakeEngine) -> None:
+    engine.responses = [
+        {
+            "aggregations": {
+                "documents": {"value": 5.0},
+                "count": {"value": 4.0},
+                "value_sum": {"value": 240.0},
+                "min_value": {"value": 50.0},
+                "max_value": {"value": 70.0},
+            },
+        },
+    ]
+
+    result = await call_tool("get_statistics_by_type_es", record_type=HEART_RATE)
+
+    assert result == {
+        "record_type": HEART_RATE,
+        "total_count": 5,
+        "value_statistics": {"count": 4, "min": 50.0, "max": 70.0, "avg": 60.0, "sum": 240.0},
+    }
+    (search,) = engine.searches()
+    assert search["index"] == rollup_alias(settings.ES_INDEX)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("rollup", [not_found(), {"aggregations": {"documents": {"value": 0}}}])
+async def test_statistics_tool_falls_back_to_the_records(engine: FakeEngine, rollup: Any) -> None:
+    stats = {"count": 3, "min": 50.0, "max": 70.0, "avg": 60.0, "sum": 180.0}
+    engine.responses = [
+        rollup,
+        {"hits": {"total": {"value": 3}}, "aggregations": {"value_stats": stats}},
+    ]
+
+    result = await call_tool("get_statistics_by_type_es", record_type=HEART_RATE)
+
+    assert result == {"record_type": HEART_RATE, "total_count": 3, "value_statistics": stats}
+    records = engine.searches()[1]
+    assert records["index"] == settings.ES_INDEX
+    assert records["body"]["track_total_hits"]
@@ -0,0 +1,52 @@
+import contextlib
+import io
+import json
+from pathlib import Path
+from typing import Any
+
+import duckdb
+import pytest
+
+from app.config import settings
+from app.services.health.parquet_dataset import MANIFEST_FILENAME
+from scripts.fan_out_importer import SINKS, make_sinks
+from scripts.pipeline import fan_out
+from scripts.xml_exporter import XMLExporter
+from tests.bulkserver import bulk_server
+from tests.sample_export import TABLE_ROWS
+
+
+def test_every_sink_imports_the_whole_export(
+    tmp_path: Path,
+    ch_database: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # the Elasticsearch import state is written to the working directory
+    monkeypatch.chdir(tmp_path)
+    with bulk_server() as port:
+        monkeypatch.setattr(settings, "ES_PORT", port)
+        exporter = XMLExporter()
+        exporter.memory_budget = 0
+        exporter.chunk_size = 50
+        sinks = make_sinks(list(SINKS), exporter, str(tmp_path / "dataset"))
+        importers: dict[str, Any] = {name: sink.__self__ for name, sink in sinks.items()}
+        # the shared test databases are left alone
+        importers["duckdb"].path = tmp_path / "applehealth.duckdb"
+        importers["ch"].db_name = "fan_out"
+        importers["ch"].ch_session.query("CREATE DATABASE IF NOT EXISTS fan_out")
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = fan_out(exporter.parse_xml_batches(), sinks, 2, lambda c: c.batch.num_rows)
+        documents = importers["es"].document_count()
+
+    rows = sum(TABLE_ROWS.values())
+    assert {name: sink.rows for name, sink in stats.items()} == dict.fromkeys(SINKS, rows)
+    assert documents == TABLE_ROWS["records"] + TABLE_ROWS["workouts"]
+    with duckdb.connect(str(tmp_path / "applehealth.duckdb"), read_only=True) as con:
+        for table, count in TABLE_ROWS.items():
+            assert con.sql(f"SELECT count(*) FROM {table}").fetchone() == (count,)
+    manifest = json.loads((tmp_path / "dataset" / MANIFEST_FILENAME).read_text())
+    assert sum(entry["rows"] for entry in manifest["records"]) == TABLE_ROWS["records"]
+    indexer = importers["ch"]
+    for table, count in TABLE_ROWS.items():
+        assert indexer.query_value(f"SELECT count() FROM {indexer.target_table(table)}") == count
+    indexer.ch_session.query("DROP DATABASE fan_out")
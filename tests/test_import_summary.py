@@ -0,0 +1,130 @@
+import os
+import shutil
+from collections.abc import Iterator
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from app.config import settings
+from app.services.health import direct_xml, duckdb_queries
+from app.services.health.import_summary import (
+    ImportSummary,
+    TypeSummary,
+    file_fingerprint,
+    load_fresh_sidecar,
+    sidecar_path,
+)
+from scripts.xml_exporter import XMLExporter
+from tests.sample_export import (
+    RECORD_COUNTS,
+    RECORDS,
+    SOURCES,
+    TABLE_ROWS,
+    WORKOUT_TYPES,
+    parse_apple_date,
+    write_export,
+)
+
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+
+
+def parse_summary(path: Path) -> ImportSummary:
+    exporter = XMLExporter()
+    exporter.xml_path = path
+    for _ in exporter.parse_xml_batches():
+        pass
+    assert exporter.summary is not None
+    return exporter.summary
+
+
+def test_type_summaries_merge() -> None:
+    summary = TypeSummary(2, "2024-01-02T00:00:00+00:00", "2024-01-03T00:00:00+00:00", ["b"])
+    summary.merge(TypeSummary(1, "2024-01-01T00:00:00+00:00", None, ["a", "b"], ["kg"], 3.0))
+    summary.observe("c", "kg", 7.5)
+
+    assert summary == TypeSummary(
+        count=4,
+        start_date="2024-01-01T00:00:00+00:00",
+        end_date="2024-01-03T00:00:00+00:00",
+        sources=["a", "b", "c"],
+        units=["kg"],
+        value_min=3.0,
+        value_max=7.5,
+    )
+
+
+def test_parsing_summarises_every_type(export_path: Path) -> None:
+    summary = parse_summary(export_path)
+
+    assert summary.counts("records") == dict(RECORD_COUNTS.most_common())
+    assert summary.total("workouts") == TABLE_ROWS["workouts"]
+    assert set(summary.types["workouts"]) == set(WORKOUT_TYPES)
+    assert summary.sources() == sorted(SOURCES)
+    heart_rate = summary.types["records"][HEART_RATE]
+    values = [float(record["value"]) for record in RECORDS if record["type"] == HEART_RATE]
+    assert (heart_rate.value_min, heart_rate.value_max) == (min(values), max(values))
+    starts = [parse_apple_date(r["startDate"]) for r in RECORDS if r["type"] == HEART_RATE]
+    assert heart_rate.start_date == min(starts).isoformat()
+
+
+def test_summary_round_trips(export_path: Path, tmp_path: Path) -> None:
+    summary = parse_summary(export_path)
+    summary.fingerprint = {"size": 1}
+    summary.save(tmp_path / "summary.json")
+
+    assert ImportSummary.load(tmp_path / "summary.json") == summary
+    assert ImportSummary.from_document(summary.document()) == summary
+    arrow = ImportSummary.from_rows(summary.to_arrow().to_pylist(), summary.fingerprint)
+    assert arrow == summary
+    assert ImportSummary.merged(summary, summary).total("records") == 2 * len(RECORDS)
+    assert summary.total("records") == len(RECORDS)
+    assert ImportSummary.load(tmp_path / "missing.json") is None
+
+
+def test_sidecar_goes_stale_with_the_file(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    path = write_export(tmp_path / "export.xml")
+    summary = parse_summary(path)
+    monkeypatch.setattr(settings, "RAW_XML_PATH", str(path))
+
+    sidecar = load_fresh_sidecar(path, file_fingerprint(path))
+    assert sidecar is not None
+    assert sidecar.rows() == summary.rows()
+    structure = direct_xml.analyze_xml_structure()
+    # the summary only knows the imported elements
+    assert structure["root_elements"] == ["Record", "Workout"]
+
+    modified = path.stat().st_mtime_ns + 1_000_000
+    os.utime(path, ns=(modified, modified))
+    assert load_fresh_sidecar(path, file_fingerprint(path)) is None
+    parsed = direct_xml.analyze_xml_structure()
+    assert "HealthData" in parsed["root_elements"]
+    assert sorted(parsed["record_types"]) == sorted(structure["record_types"])
+    assert sorted(parsed["sources"]) == structure["sources"]
+    assert sidecar_path(path).exists()
+
+
+@pytest.fixture
+def changed_database(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    """
+    Copy of the imported database with a record added after its summary was written
+    """
+    path = tmp_path / "applehealth.duckdb"
+    shutil.copy(settings.DUCKDB_FILENAME, path)
+    with duckdb.connect(str(path)) as con:
+        con.sql("INSERT INTO records SELECT * FROM records LIMIT 1")
+    con = duckdb.connect(str(path), read_only=True)
+    monkeypatch.setattr(duckdb_queries, "con", con)
+    yield
+    con.close()
+
+
+def test_database_summary_goes_stale_with_the_tables(changed_database: None) -> None:
+    assert not duckdb_queries.summary_is_fresh()
+    summary = duckdb_queries.get_health_summary_from_duckdb()
+
+    rows = TABLE_ROWS["records"] + TABLE_ROWS["workouts"]
+    assert sum(row["count"] for row in summary) == rows + 1
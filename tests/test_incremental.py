@@ -0,0 +1,137 @@
+import contextlib
+import io
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pytest
+
+from scripts.duckdb_importer import ParquetImporter
+from scripts.incremental import DATE_PREFIX, IncrementalFilter
+from tests.sample_export import RECORDS, TABLE_ROWS, WORKOUT_ELEMENTS, write_export
+
+HEART_RATE = RECORDS[0]
+APPLE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+
+
+def elements() -> list[tuple[str, dict[str, str]]]:
+    """
+    Top-level elements of the sample export with the statistics nested in the workouts
+    """
+    found = [("Record", record) for record in RECORDS]
+    for workout, stats in WORKOUT_ELEMENTS:
+        found.append(("Workout", workout))
+        found.extend(("WorkoutStatistics", stat) for stat in stats)
+    return found
+
+
+def later(record: dict[str, str], days: int) -> dict[str, str]:
+    """
+    The element taken again days later, in the same time zone
+    """
+    shifted = dict(record)
+    for name in ("creationDate", "startDate", "endDate"):
+        moment = datetime.strptime(record[name], APPLE_DATE_FORMAT) + timedelta(days=days)
+        shifted[name] = moment.strftime(APPLE_DATE_FORMAT)
+    return shifted
+
+
+def accepted(incremental: IncrementalFilter, found: list[tuple[str, dict[str, str]]]) -> int:
+    return sum(incremental.accept(tag, attrib) for tag, attrib in found)
+
+
+def test_element_hash() -> None:
+    digest = IncrementalFilter.element_hash("Record", HEART_RATE)
+
+    assert digest == IncrementalFilter.element_hash("Record", dict(HEART_RATE))
+    assert 0 <= digest < 2**64
+    assert digest != IncrementalFilter.element_hash("Workout", HEART_RATE)
+    assert digest != IncrementalFilter.element_hash("Record", {**HEART_RATE, "value": "51"})
+
+
+def test_second_import_of_the_same_export_skips_everything(tmp_path: Path) -> None:
+    state_path = tmp_path / "state.npz"
+    first = IncrementalFilter(state_path)
+    assert accepted(first, elements()) == len(elements())
+    first.commit()
+
+    second = IncrementalFilter(state_path)
+    assert second.high_water == max(attrib.get("creationDate", "") for _, attrib in elements())[:19]
+    assert accepted(second, elements()) == 0
+    assert second.report() == f"0 new elements, {len(elements())} already imported"
+
+
+def test_only_new_elements_are_accepted(tmp_path: Path) -> None:
+    state_path = tmp_path / "state.npz"
+    first = IncrementalFilter(state_path)
+    accepted(first, elements())
+    first.commit()
+
+    second = IncrementalFilter(state_path)
+    new = [("Record", later(RECORDS[-13], 1)), ("Record", {**RECORDS[-13], "value": "99"})]
+    assert accepted(second, elements() + new) == 2
+
+
+def test_statistics_follow_their_workout(tmp_path: Path) -> None:
+    incremental = IncrementalFilter(tmp_path / "state.npz")
+    workout, stats = WORKOUT_ELEMENTS[0]
+    incremental.accept("Workout", workout)
+    incremental.commit()
+
+    incremental = IncrementalFilter(tmp_path / "state.npz")
+    assert not incremental.accept("Workout", workout)
+    assert not any(incremental.accept("WorkoutStatistics", stat) for stat in stats)
+    assert incremental.accept("Workout", later(workout, 1))
+    assert all(incremental.accept("WorkoutStatistics", stat) for stat in stats)
+
+
+def test_state_keeps_the_hashes_of_the_lookback_window(tmp_path: Path) -> None:
+    state_path = tmp_path / "state.npz"
+    incremental = IncrementalFilter(state_path, lookback_days=3)
+    accepted(incremental, elements())
+    incremental.commit()
+
+    with np.load(state_path) as state:
+        created = state["created"]
+        assert len(state["hashes"]) == len(created)
+    cutoff = IncrementalFilter.shift(str(incremental.newest), -timedelta(days=3))
+    assert 0 < len(created) < len(elements())
+    assert all(date.decode() >= cutoff for date in created)
+    assert all(len(date) == DATE_PREFIX for date in created)
+
+
+def test_state_without_target_is_dropped(tmp_path: Path) -> None:
+    state_path = tmp_path / "state.npz"
+    state_path.write_bytes(b"stale")
+
+    assert IncrementalFilter.for_target(state_path, target_exists=False).high_water == ""
+    assert not state_path.exists()
+    with pytest.raises(SystemExit, match="--incremental"):
+        IncrementalFilter.for_target(state_path, target_exists=True)
+
+
+def import_incrementally(path: Path, export: Path) -> str:
+    importer = ParquetImporter()
+    importer.path = path
+    importer.xml_path = export
+    importer.incremental = IncrementalFilter.for_target(importer.state_path, path.exists())
+    with contextlib.redirect_stdout(io.StringIO()):
+        importer.export_xml()
+    return importer.incremental.report()
+
+
+def test_duckdb_import_only_appends_new_elements(tmp_path: Path) -> None:
+    path = tmp_path / "applehealth.duckdb"
+    export = write_export(tmp_path / "export.xml")
+    import_incrementally(path, export)
+    assert import_incrementally(path, export).startswith("0 new elements")
+
+    new = later(RECORDS[-13], 1)
+    write_export(export, RECORDS + [new])
+    assert import_incrementally(path, export).startswith("1 new elements")
+
+    with duckdb.connect(str(path), read_only=True) as con:
+        for table, rows in TABLE_ROWS.items():
+            expected = rows + (table == "records")
+            assert con.sql(f"SELECT count(*) FROM {table}").fetchone() == (expected,)
@@ -0,0 +1,101 @@
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from app.services.health.parquet_dataset import (
+    MANIFEST_FILENAME,
+    load_manifest,
+    partition_values,
+    partition_year,
+    select_record_files,
+)
+
+STEPS = "HKQuantityTypeIdentifierStepCount"
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+DAY = timedelta(days=1)
+
+
+def entry(record_type: str, year: int | None) -> dict[str, Any]:
+    path = f"type={record_type}/year={year or '__HIVE_DEFAULT_PARTITION__'}/part-0.parquet"
+    return {"path": path, "type": record_type, "year": year, "rows": 10}
+
+
+MANIFEST: dict[str, Any] = {
+    "records": [
+        entry(HEART_RATE, 2022),
+        entry(HEART_RATE, 2023),
+        entry(HEART_RATE, 2024),
+        entry(STEPS, 2023),
+        entry(STEPS, None),
+    ],
+}
+
+
+def years(files: list[str]) -> list[tuple[str, str]]:
+    return [(values["type"], values["year"]) for values in map(partition_values, files)]
+
+
+def test_partition_values_are_unquoted() -> None:
+    path = "type=Rob%E2%80%99s%20Type/year=2016/part-0.parquet"
+
+    assert partition_values(path) == {"type": "Rob’s Type", "year": "2016"}
+
+
+def test_files_of_one_type() -> None:
+    assert years(select_record_files(MANIFEST, STEPS)) == [
+        (STEPS, "2023"),
+        (STEPS, "__HIVE_DEFAULT_PARTITION__"),
+    ]
+    assert select_record_files(MANIFEST, "HKQuantityTypeIdentifierUnknown") == []
+    assert len(select_record_files(MANIFEST)) == len(MANIFEST["records"])
+
+
+@pytest.mark.parametrize(
+    ("date_from", "date_to", "expected"),
+    [
+        ("2023-03-01", "2023-09-30", ["2023"]),
+        ("2023-03-01", None, ["2023", "2024"]),
+        (None, "2022-06-30T00:00:00+00:00", ["2022"]),
+        # a day of slack covers bounds whose offset moves them into the next or previous year
+        ("2024-01-01T00:30:00+02:00", None, ["2023", "2024"]),
+        (None, "2022-12-31", ["2022", "2023"]),
+        # unparsable bounds prune nothing, DuckDB reports them
+        ("last year", None, ["2022", "2023", "2024"]),
+    ],
+)
+def test_files_between_dates(
+    date_from: str | None,
+    date_to: str | None,
+    expected: list[str],
+) -> None:
+    files = select_record_files(MANIFEST, HEART_RATE, date_from, date_to)
+
+    assert years(files) == [(HEART_RATE, year) for year in expected]
+
+
+def test_files_without_dates_never_match_a_date_filter() -> None:
+    assert years(select_record_files(MANIFEST, STEPS, "2000-01-01")) == [(STEPS, "2023")]
+
+
+def test_partition_year() -> None:
+    assert partition_year(None, -DAY) is None
+    assert partition_year("2024-01-01", -DAY) == 2023
+    assert partition_year("2024-01-01", DAY) == 2024
+    assert partition_year("not a date", DAY) is None
+
+
+def test_manifest_is_read_again_once_replaced(tmp_path: Path) -> None:
+    path = tmp_path / MANIFEST_FILENAME
+    path.write_text(json.dumps({"records": []}))
+    first = load_manifest(str(tmp_path))
+
+    assert load_manifest(str(tmp_path)) is first
+    path.write_text(json.dumps(MANIFEST))
+    # a replaced manifest has a new modification time even within the same clock tick
+    modified = path.stat().st_mtime_ns + 1_000_000
+    os.utime(path, ns=(modified, modified))
+    assert load_manifest(str(tmp_path)) == MANIFEST
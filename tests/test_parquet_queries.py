@@ -0,0 +1,136 @@
+import contextlib
+import io
+import json
+from collections import Counter
+from collections.abc import Iterator
+from pathlib import Path
+
+import pyarrow.parquet as pq
+import pytest
+
+from app.config import settings
+from app.services.health import parquet_queries
+from app.services.health.parquet_dataset import MANIFEST_FILENAME, load_manifest
+from scripts.duckdb_importer import ParquetImporter
+from scripts.xml_exporter import TableBatch
+from tests.sample_export import RECORD_COUNTS, RECORDS, SOURCES, parse_apple_date
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    importer = ParquetImporter()
+    importer.path = str(tmp_path_factory.mktemp("parquet") / "applehealth")
+    with contextlib.redirect_stdout(io.StringIO()):
+        importer.export_xml_parquet()
+    return Path(importer.path)
+
+
+@pytest.fixture(autouse=True)
+def read_dataset(dataset: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(parquet_queries.client, "path", dataset)
+
+
+def test_health_summary_lists_plain_values() -> None:
+    summary = parquet_queries.get_health_summary_from_duckdb()
+
+    assert {row["type"]: row["count"] for row in summary} == RECORD_COUNTS
+    for row in summary:
+        assert isinstance(row["sources"], list)
+        assert set(row["sources"]) <= set(SOURCES)
+
+
+def test_health_summary_aggregates_without_manifest_summary(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    stored = parquet_queries.get_health_summary_from_duckdb()
+    monkeypatch.setattr(parquet_queries, "load_summary", lambda: None)
+
+    aggregated = parquet_queries.get_health_summary_from_duckdb()
+    assert [row["sources"] for row in aggregated] == [row["sources"] for row in stored]
+    assert [row["count"] for row in aggregated] == [row["count"] for row in stored]
+
+
+def test_trend_groups_by_source_and_unit() -> None:
+    trend = parquet_queries.get_trend_data_from_duckdb(
+        "HKQuantityTypeIdentifierStepCount",
+        "year",
+        date_from="2024-01-01",
+        date_to="2024-12-31",
+    )
+
+    assert {(row["sourceName"], row["unit"]) for row in trend} == {
+        (source, "count") for source in SOURCES
+    }
+    assert sum(row["count"] for row in trend) == sum(
+        1
+        for record in RECORDS
+        if record["type"] == "HKQuantityTypeIdentifierStepCount"
+        and parse_apple_date(record["startDate"]).year == 2024
+    )
+
+
+def test_manifest_lists_every_partition(dataset: Path) -> None:
+    manifest = load_manifest(str(dataset))
+    rows: Counter[str] = Counter()
+    for entry in manifest["records"]:
+        assert (dataset / entry["path"]).is_file()
+        assert entry["path"] == f"type={entry['type']}/year={entry['year']}/part-0.parquet"
+        rows[entry["type"]] += entry["rows"]
+
+    assert rows == RECORD_COUNTS
+    expected = {(record["type"], parse_apple_date(record["startDate"]).year) for record in RECORDS}
+    assert {(entry["type"], entry["year"]) for entry in manifest["records"]} == expected
+
+
+def test_queries_only_read_matching_partitions() -> None:
+    source = parquet_queries.records_source(
+        "HKQuantityTypeIdentifierStepCount",
+        date_from="2024-03-01",
+    )
+
+    assert source is not None
+    assert source.count(".parquet'") == 1
+    assert "type=HKQuantityTypeIdentifierStepCount/year=2024" in source
+    assert parquet_queries.records_source("HKQuantityTypeIdentifierUnknown") is None
+    assert (
+        parquet_queries.get_statistics_by_type_from_duckdb("HKQuantityTypeIdentifierUnknown") == []
+    )
+
+
+def test_statistics_read_every_partition_of_the_type() -> None:
+    (statistics,) = parquet_queries.get_statistics_by_type_from_duckdb(
+        "HKQuantityTypeIdentifierHeartRate",
+    )
+
+    assert statistics["count"] == RECORD_COUNTS["HKQuantityTypeIdentifierHeartRate"]
+
+
+def test_failed_import_keeps_the_previous_dataset(tmp_path: Path) -> None:
+    importer = ParquetImporter()
+    importer.path = str(tmp_path / "applehealth")
+    with contextlib.redirect_stdout(io.StringIO()):
+        importer.export_xml_parquet()
+    manifest = (tmp_path / "applehealth" / MANIFEST_FILENAME).read_text()
+
+    def failing() -> Iterator[TableBatch]:
+        yield from importer.parse_xml_batches()
+        raise OSError("disk full")
+
+    with contextlib.redirect_stdout(io.StringIO()), pytest.raises(OSError, match="disk full"):
+        importer.write_parquet(failing())
+
+    assert (tmp_path / "applehealth" / MANIFEST_FILENAME).read_text() == manifest
+    assert json.loads(manifest)["records"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["applehealth"]
+
+
+def test_dataset_files_carry_bloom_filters(dataset: Path) -> None:
+    entry = load_manifest(str(dataset))["records"][0]
+    row_group = pq.ParquetFile(dataset / entry["path"]).metadata.row_group(0)
+    filtered = {
+        row_group.column(index).path_in_schema
+        for index in range(row_group.num_columns)
+        if row_group.column(index).bloom_filter_offset is not None
+    }
+
+    assert filtered == set(settings.PARQUET_BLOOM_FILTER_COLUMNS)
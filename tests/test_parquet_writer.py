@@ -0,0 +1,112 @@
+import dataclasses
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from app.config import settings
+from scripts.parquet_writer import ParquetDatasetWriter, ParquetOptions
+
+SCHEMA = pa.schema([("type", pa.string()), ("value", pa.float64())])
+
+
+def make_options(row_group_size: int = 100) -> ParquetOptions:
+    return ParquetOptions(
+        row_group_size=row_group_size,
+        compression="zstd",
+        compression_level=None,
+        write_statistics=True,
+    )
+
+
+def make_batch(start: int, rows: int, record_type: str = "HeartRate") -> pa.RecordBatch:
+    values = [float(value) for value in range(start, start + rows)]
+    return pa.record_batch([pa.array([record_type] * rows), pa.array(values)], schema=SCHEMA)
+
+
+def row_groups(path: Path) -> list[int]:
+    metadata = pq.ParquetFile(path).metadata
+    return [metadata.row_group(index).num_rows for index in range(metadata.num_row_groups)]
+
+
+def test_batches_are_appended_in_full_row_groups(tmp_path: Path) -> None:
+    with ParquetDatasetWriter(tmp_path, make_options(), max_buffered_rows=1_000) as writer:
+        for start in range(0, 250, 30):
+            writer.write("a/part-0.parquet", make_batch(start, 30))
+
+    assert writer.written == {"a/part-0.parquet": 270}
+    assert row_groups(tmp_path / "a/part-0.parquet") == [100, 100, 70]
+    table = pq.read_table(tmp_path / "a/part-0.parquet")
+    assert table.column("value").to_pylist() == [float(value) for value in range(270)]
+
+
+def test_buffers_stay_bounded_across_files(tmp_path: Path) -> None:
+    paths = [f"type={index}/part-0.parquet" for index in range(4)]
+    expected: dict[str, list[float]] = {path: [] for path in paths}
+    with ParquetDatasetWriter(tmp_path, make_options(), max_buffered_rows=50) as writer:
+        for start in range(0, 400, 20):
+            path = paths[start // 20 % len(paths)]
+            batch = make_batch(start, 20)
+            writer.write(path, batch)
+            expected[path].extend(batch.column("value").to_pylist())
+            assert writer.buffered_rows <= 50
+            assert writer.buffered_rows == sum(file.pending_rows for file in writer.files.values())
+
+    for path, values in expected.items():
+        assert pq.read_table(tmp_path / path).column("value").to_pylist() == values
+        # early flushes write smaller row groups, never larger ones
+        assert max(row_groups(tmp_path / path)) <= 100
+
+
+def test_empty_batches_open_no_file(tmp_path: Path) -> None:
+    with ParquetDatasetWriter(tmp_path, make_options(), max_buffered_rows=10) as writer:
+        writer.write("empty.parquet", make_batch(0, 0))
+        writer.open("opened.parquet", SCHEMA)
+
+    assert writer.written == {"opened.parquet": 0}
+    assert not (tmp_path / "empty.parquet").exists()
+    assert pq.read_table(tmp_path / "opened.parquet").num_rows == 0
+
+
+def column_chunks(path: Path) -> dict[str, pq.ColumnChunkMetaData]:
+    row_group = pq.ParquetFile(path).metadata.row_group(0)
+    return {
+        row_group.column(index).path_in_schema: row_group.column(index)
+        for index in range(row_group.num_columns)
+    }
+
+
+def test_options_follow_the_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "PARQUET_BLOOM_FILTER_COLUMNS", ["type", "device"])
+    monkeypatch.setattr(settings, "PARQUET_WRITE_PAGE_INDEX", True)
+    options = ParquetOptions.from_settings()
+
+    assert options.bloom_filter_columns == ("type", "device")
+    kwargs = options.writer_kwargs(SCHEMA)
+    # columns the file does not have are left out
+    assert kwargs["bloom_filter_options"] == {
+        "type": {
+            "ndv": settings.PARQUET_BLOOM_FILTER_NDV,
+            "fpp": settings.PARQUET_BLOOM_FILTER_FPP,
+        },
+    }
+    assert kwargs["write_page_index"]
+    assert make_options().writer_kwargs(SCHEMA)["bloom_filter_options"] is None
+
+
+@pytest.mark.parametrize("page_index", [False, True])
+def test_files_carry_bloom_filters_and_page_indexes(tmp_path: Path, page_index: bool) -> None:
+    options = dataclasses.replace(
+        make_options(),
+        bloom_filter_columns=("type",),
+        write_page_index=page_index,
+    )
+    with ParquetDatasetWriter(tmp_path, options, max_buffered_rows=1_000) as writer:
+        writer.write("part-0.parquet", make_batch(0, 100))
+
+    chunks = column_chunks(tmp_path / "part-0.parquet")
+    assert chunks["type"].bloom_filter_offset is not None
+    assert chunks["value"].bloom_filter_offset is None
+    assert chunks["type"].has_column_index == page_index
+    assert chunks["value"].has_offset_index == page_index
@@ -0,0 +1,119 @@
+import itertools
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+
+import pytest
+
+from scripts.pipeline import FanOutAbortedError, fan_out, run_pipeline
+
+
+def test_items_are_consumed_in_order() -> None:
+    consumed: list[int] = []
+    stats = run_pipeline(range(100), consumed.append, depth=3)
+
+    assert consumed == list(range(100))
+    assert stats.items == 100
+    assert stats.max_depth <= 3
+    assert stats.elapsed >= stats.get_wait
+    assert "100 batches" in stats.report()
+
+
+def test_consumer_runs_in_the_calling_thread() -> None:
+    threads: set[threading.Thread] = set()
+    run_pipeline(range(5), lambda _: threads.add(threading.current_thread()), depth=1)
+
+    assert threads == {threading.current_thread()}
+
+
+def test_producer_errors_reach_the_caller() -> None:
+    def producer() -> Iterator[int]:
+        yield from range(3)
+        raise OSError("truncated export")
+
+    consumed: list[int] = []
+    with pytest.raises(OSError, match="truncated export"):
+        run_pipeline(producer(), consumed.append, depth=2)
+    assert consumed == [0, 1, 2]
+
+
+def test_failing_consumer_stops_the_producer() -> None:
+    produced = itertools.count()
+
+    def consume(item: int) -> None:
+        if item == 3:
+            raise ValueError("disk full")
+
+    with pytest.raises(ValueError, match="disk full"):
+        run_pipeline(produced, consume, depth=2)
+    # four consumed, a full queue, one blocked in put and one taken before the producer noticed
+    assert next(produced) <= 4 + 2 + 1 + 1
+
+
+def test_empty_producer() -> None:
+    stats = run_pipeline([], lambda _: None, depth=1)
+
+    assert stats.items == 0
+    assert stats.max_depth <= 1
+
+
+def test_every_sink_gets_every_item() -> None:
+    received: dict[str, list[int]] = {"fast": [], "slow": []}
+
+    def sink(name: str) -> Callable[[Iterable[int]], None]:
+        def consume(items: Iterable[int]) -> None:
+            for item in items:
+                if name == "slow":
+                    time.sleep(0.001)
+                received[name].append(item)
+
+        return consume
+
+    stats = fan_out(range(50), {name: sink(name) for name in received}, depth=2, size=lambda n: n)
+
+    assert received == {"fast": list(range(50)), "slow": list(range(50))}
+    assert {name: (sink.batches, sink.rows) for name, sink in stats.items()} == {
+        "fast": (50, sum(range(50))),
+        "slow": (50, sum(range(50))),
+    }
+    assert all(sink.max_depth <= 2 and sink.error is None for sink in stats.values())
+
+
+def test_failing_sink_aborts_the_others() -> None:
+    aborted = threading.Event()
+
+    def failing(items: Iterable[int]) -> None:
+        for item in items:
+            if item == 5:
+                raise ValueError("disk full")
+
+    def waiting(items: Iterable[int]) -> None:
+        try:
+            for _ in items:
+                pass
+        except FanOutAbortedError:
+            aborted.set()
+            raise
+
+    with pytest.raises(ValueError, match="disk full"):
+        fan_out(itertools.count(), {"failing": failing, "waiting": waiting}, depth=2)
+    assert aborted.is_set()
+
+
+def test_producer_errors_abort_every_sink() -> None:
+    def producer() -> Iterator[int]:
+        yield 1
+        raise OSError("truncated export")
+
+    errors: list[BaseException] = []
+
+    def sink(items: Iterable[int]) -> None:
+        try:
+            list(items)
+        except FanOutAbortedError as e:
+            errors.append(e)
+            raise
+
+    with pytest.raises(OSError, match="truncated export"):
+        fan_out(producer(), {"a": sink, "b": sink}, depth=1)
+    assert len(errors) == 2
@@ -0,0 +1,61 @@
+import pytest
+
+from app.schemas.record import HealthRecordSearchParams
+from app.services.health.sql_helpers import (
+    day_end,
+    enum_literal,
+    fill_query,
+    rollup_bounds,
+    rollup_grain,
+)
+
+
+@pytest.mark.parametrize(
+    ("date_from", "date_to", "bounds"),
+    [
+        (None, None, (None, None)),
+        ("2024-01-01", "2024-06-30", ("2024-01-01", "2024-06-30")),
+        ("2024-01-01T00:00:00+00:00", "2024-06-30T23:59:59+00:00", ("2024-01-01", "2024-06-30")),
+        ("2024-01-01 00:00:00", None, ("2024-01-01", None)),
+        (None, "2024-06-30T23:59:59.500", (None, "2024-06-30")),
+    ],
+)
+def test_rollup_bounds_of_whole_days(
+    date_from: str | None,
+    date_to: str | None,
+    bounds: tuple[str | None, str | None],
+) -> None:
+    assert rollup_bounds(date_from, date_to) == bounds
+
+
+@pytest.mark.parametrize(
+    ("date_from", "date_to"),
+    [
+        ("2024-01-01T06:00:00", None),
+        (None, "2024-06-30T00:00:00"),
+        (None, "2024-06-30T12:00:00+00:00"),
+        ("last week", None),
+    ],
+)
+def test_rollup_bounds_cutting_through_a_day(date_from: str | None, date_to: str | None) -> None:
+    assert rollup_bounds(date_from, date_to) is None
+
+
+def test_day_end_includes_the_whole_day_of_a_bare_date() -> None:
+    assert day_end("2024-06-30") == "2024-06-30 23:59:59"
+    assert day_end("2024-06-30T12:00:00") == "2024-06-30T12:00:00"
+
+
+def test_rollup_grain() -> None:
+    assert rollup_grain("month", (None, None)) == "month"
+    assert rollup_grain("month", ("2024-01-01", None)) == "day"
+
+
+def test_type_filter_compares_against_the_enum() -> None:
+    params = HealthRecordSearchParams(record_type="HKQuantityTypeIdentifierHeartRate")
+
+    assert enum_literal("records", "type", "Walk") == "TRY_CAST('Walk' AS records_type)"
+    assert "records.type = TRY_CAST('HKQuantityTypeIdentifierHeartRate' AS records_type)" in (
+        fill_query(params, enum_types=True)
+    )
+    assert "records.type = 'HKQuantityTypeIdentifierHeartRate'" in fill_query(params)
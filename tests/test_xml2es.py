@@ -0,0 +1,217 @@
+import itertools
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from app.services.health.es_helpers import SUMMARY_DOCUMENT_ID, rollup_alias, summary_alias
+from scripts.xml2es import DailyRollup, DayAggregates, ESIndexer
+from tests.bulkserver import bulk_server
+
+RECORDS = 300
+# local start dates of the records, the first two are on 2024-01-01 in UTC
+START_DATES = (
+    "2023-12-31 22:00:00 -0500",
+    "2024-01-01 10:00:00 +0000",
+    "2024-06-01 10:00:00 +0000",
+)
+TYPES = ("HKQuantityTypeIdentifierHeartRate", "HKQuantityTypeIdentifierStepCount")
+# the ExportDate element is indexed as well
+DOCUMENTS = RECORDS + 1
+# both types on 2024-01-01 and 2024-06-01
+ROLLUP_DAYS = 4
+
+
+def write_export(path: Path) -> Path:
+    records = [
+        f'<Record type="{TYPES[i % 2]}" sourceName="Watch" unit="count" '
+        f'creationDate="{START_DATES[i % 3]}" startDate="{START_DATES[i % 3]}" '
+        f'endDate="{START_DATES[i % 3]}" value="{i}"/>'
+        for i in range(RECORDS)
+    ]
+    path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n<HealthData locale="en_US">\n'
+        '<ExportDate value="2024-07-01 10:00:00 +0000"/>\n'
+        + "\n".join(records)
+        + "\n</HealthData>\n",
+    )
+    return path
+
+
+@pytest.fixture
+def export(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    # the import state is written to the working directory
+    monkeypatch.chdir(tmp_path)
+    # imports within the same second would get the same generation name
+    generations = (f"2024010100000{n}" for n in itertools.count())
+    monkeypatch.setattr("scripts.xml2es.time.strftime", lambda _: next(generations))
+    return write_export(tmp_path / "export.xml")
+
+
+def make_indexer(port: int, monkeypatch: pytest.MonkeyPatch, xml_path: Path) -> ESIndexer:
+    """
+    Importer sending small chunks from several threads and retrying quickly
+    """
+    monkeypatch.setattr(settings, "ES_PORT", port)
+    indexer = ESIndexer()
+    indexer.es.xml_path = str(xml_path)
+    indexer.chunk_size = 20
+    indexer.threads = 3
+    indexer.max_retries = 50
+    indexer.initial_backoff = 0.01
+    indexer.max_backoff = 0.02
+    return indexer
+
+
+def partitions(indexer: ESIndexer) -> list[str]:
+    return sorted(indexer.es.engine.indices.get_settings(index=f"{indexer.es.index}-*"))
+
+
+def test_import_loads_documents_behind_aliases(
+    export: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    with bulk_server() as port:
+        indexer = make_indexer(port, monkeypatch, export)
+        indexer.run()
+
+        alias = indexer.es.index
+        assert indexer.document_count() == DOCUMENTS
+        assert indexer.aliased_indices() == [
+            f"{alias}-20240101000000-2023",
+            f"{alias}-20240101000000-2024",
+            f"{alias}-20240101000000-undated",
+        ]
+        assert indexer.aliased_indices(rollup_alias(alias)) == [f"{alias}-20240101000000-daily"]
+        assert indexer.es.engine.count(index=rollup_alias(alias))["count"] == ROLLUP_DAYS
+        summary = indexer.es.engine.get(index=summary_alias(alias), id=SUMMARY_DOCUMENT_ID)
+        assert summary["_source"]["fingerprint"] == {"documents": DOCUMENTS}
+        assert sum(row["count"] for row in summary["_source"]["types"]) == RECORDS
+
+
+def test_import_retries_rejected_documents(export: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    with bulk_server("--reject-rate", "0.2", "--throttle-rate", "0.1") as port:
+        indexer = make_indexer(port, monkeypatch, export)
+        indexer.run()
+
+        assert indexer.document_count() == DOCUMENTS
+        assert indexer.es.engine.count(index=rollup_alias(indexer.es.index))["count"] == ROLLUP_DAYS
+
+
+def test_reimport_swaps_generations(export: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    with bulk_server() as port:
+        indexer = make_indexer(port, monkeypatch, export)
+        indexer.run()
+        indexer.run()
+
+        alias = indexer.es.index
+        assert indexer.document_count() == DOCUMENTS
+        assert all(index.startswith(f"{alias}-20240101000001-") for index in partitions(indexer))
+        assert indexer.aliased_indices(rollup_alias(alias)) == [f"{alias}-20240101000001-daily"]
+        assert indexer.aliased_indices(summary_alias(alias)) == [
+            f"{alias}-20240101000001-summary",
+        ]
+
+
+def test_failed_import_keeps_previous_generation(
+    export: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    with bulk_server() as port:
+        indexer = make_indexer(port, monkeypatch, export)
+        indexer.run()
+        previous = partitions(indexer)
+
+        def fail(*_: object) -> None:
+            raise RuntimeError("the rollup failed")
+
+        monkeypatch.setattr(indexer, "index_rollup", fail)
+        with pytest.raises(RuntimeError):
+            indexer.run()
+
+        assert partitions(indexer) == previous
+        assert indexer.document_count() == DOCUMENTS
+
+
+def test_delete_index_keeps_unrelated_indices(
+    export: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    with bulk_server() as port:
+        indexer = make_indexer(port, monkeypatch, export)
+        indexer.run()
+        alias = indexer.es.index
+        indexer.es.engine.indices.create(index=f"{alias}-backup-2024")
+        indexer.run(delete_all=True)
+
+        assert partitions(indexer) == [f"{alias}-backup-2024"]
+        assert indexer.document_count() == 0
+
+
+def rollup_document(date: str, value: float | str | None, source: str = "Watch") -> dict:
+    return {
+        "type": TYPES[0],
+        "sourceName": source,
+        "unit": "count/min",
+        "dateComponents": date,
+        "value": value,
+    }
+
+
+def test_daily_rollup_aggregates_per_utc_day() -> None:
+    rollup = DailyRollup()
+    documents = [
+        rollup_document("2023-12-31T22:00:00-05:00", 60.0),
+        rollup_document("2024-01-01T10:00:00+00:00", 80.0),
+        # before midnight in UTC, within the same local hour as the next one
+        rollup_document("2024-01-02T05:20:00+05:30", 70.0),
+        rollup_document("2024-01-02T05:40:00+05:30", 50.0),
+        rollup_document("2024-01-01T10:00:00+00:00", "high"),
+        rollup_document("2024-01-01T10:00:00+00:00", 90.0, source="Phone"),
+        # no date, or not a record
+        rollup_document("", 1.0),
+        {"dateComponents": "2024-01-01T10:00:00+00:00", "value": 1.0},
+    ]
+
+    assert list(rollup.observe(documents)) == documents
+    watch = (TYPES[0], "Watch", "count/min")
+    phone = (TYPES[0], "Phone", "count/min")
+    # 05:20 at +05:30 is 23:50 of the day before in UTC, 05:40 is 00:10
+    first_day = [60.0, 80.0, 70.0]
+    assert rollup.days == {
+        (*watch, "2024-01-01"): DayAggregates(
+            documents=4,
+            count=3,
+            sum=sum(first_day),
+            sumsq=sum(value * value for value in first_day),
+            min=60.0,
+            max=80.0,
+        ),
+        (*watch, "2024-01-02"): DayAggregates(1, 1, 50.0, 2500.0, 50.0, 50.0),
+        (*phone, "2024-01-01"): DayAggregates(1, 1, 90.0, 8100.0, 90.0, 90.0),
+    }
+
+
+def test_daily_rollup_upserts_the_days_by_their_key() -> None:
+    rollup = DailyRollup()
+    rollup.add(rollup_document("2024-01-01T10:00:00+00:00", "high"))
+    again = DailyRollup()
+    again.add(rollup_document("2024-01-01T12:00:00+00:00", "low"))
+
+    (action,) = rollup.actions("daily")
+    # an incremental import updates the same document
+    assert [other["_id"] for other in again.actions("daily")] == [action["_id"]]
+    assert action["_op_type"] == "update"
+    assert action["_index"] == "daily"
+    assert action["script"]["params"]["min"] is None
+    # the upsert leaves out the aggregates of days without numeric values
+    assert action["upsert"] == {
+        "type": TYPES[0],
+        "sourceName": "Watch",
+        "unit": "count/min",
+        "day": "2024-01-01",
+        "documents": 1,
+        "count": 0,
+        "sum": 0.0,
+        "sumsq": 0.0,
+    }
@@ -0,0 +1,127 @@
+import contextlib
+import io
+import zipfile
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastmcp import Client
+
+from app.config import settings
+from app.mcp.v1.tools.xml_reader import xml_reader_router
+from app.services.xml_backends import XMLElement, get_backend, is_zip_source, source_size
+from app.utils.config_utils import XMLParserBackend
+from scripts.xml_exporter import XMLExporter
+from tests.sample_export import RECORD_COUNTS, RECORDS, TABLE_ROWS
+
+BACKENDS = list(XMLParserBackend)
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+
+
+def read_elements(
+    backend: XMLParserBackend,
+    path: Path,
+    tags: list[str] | None = None,
+) -> list[XMLElement]:
+    # attribute mappings are only valid until the next element, keep copies
+    elements: list[XMLElement] = []
+    for tag, attrib in get_backend(backend).iter_elements(path, tags):
+        elements.append((tag, dict(attrib)))
+    return elements
+
+
+async def call_tool(name: str, **arguments: Any) -> Any:
+    async with Client(xml_reader_router) as client:
+        result = await client.call_tool(name, arguments)
+    return result.structured_content["result"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_yield_the_same_elements(backend: XMLParserBackend, export_path: Path) -> None:
+    elements = read_elements(backend, export_path)
+
+    assert elements == read_elements(XMLParserBackend.ETREE, export_path)
+    assert elements[0][0] == "HealthData"
+    assert [attrib for tag, attrib in elements if tag == "Record"] == RECORDS
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_filter_tags(backend: XMLParserBackend, export_path: Path) -> None:
+    elements = read_elements(backend, export_path, ["Workout", "WorkoutStatistics"])
+
+    assert sum(tag == "Workout" for tag, _ in elements) == TABLE_ROWS["workouts"]
+    assert sum(tag == "WorkoutStatistics" for tag, _ in elements) == TABLE_ROWS["stats"]
+    assert {tag for tag, _ in elements} == {"Workout", "WorkoutStatistics"}
+
+
+def test_unknown_backend() -> None:
+    with pytest.raises(ValueError, match="sax"):
+        get_backend("sax")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_xml_tools_read_through_every_backend(
+    backend: XMLParserBackend,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "XML_PARSER_BACKEND", backend)
+    by_type = await call_tool("get_xml_by_type", record_type=HEART_RATE, limit=1_000)
+    search = await call_tool("search_xml_content", query="polar flow", max_results=5)
+
+    assert f"Total records found: {RECORD_COUNTS[HEART_RATE]}" in by_type
+    assert search.count("<Record ") == 5
+    assert "Total matches found: 5" in search
+
+
+@pytest.fixture
+def export_zip(export_path: Path, tmp_path: Path) -> Path:
+    """
+    The sample export zipped like the Health app does, next to the clinical records
+    """
+    path = tmp_path / "export.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("apple_health_export/export_cda.xml", "<ClinicalDocument/>")
+        archive.write(export_path, "apple_health_export/export.xml")
+    return path
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_stream_the_zip(
+    backend: XMLParserBackend,
+    export_zip: Path,
+    export_path: Path,
+) -> None:
+    assert is_zip_source(export_zip)
+    assert not is_zip_source(export_path)
+    assert read_elements(backend, export_zip) == read_elements(backend, export_path)
+
+
+def test_zip_member_setting(export_zip: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "RAW_XML_ZIP_MEMBER", "apple_health_export/export_cda.xml")
+
+    assert read_elements(XMLParserBackend.EXPAT, export_zip) == [("ClinicalDocument", {})]
+    assert source_size(export_zip) == len("<ClinicalDocument/>")
+
+
+def test_zip_without_export(tmp_path: Path) -> None:
+    path = tmp_path / "other.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("notes.txt", "")
+
+    with pytest.raises(FileNotFoundError, match="No export.xml"):
+        source_size(path)
+
+
+def test_exporter_reads_the_zip_with_one_worker(export_zip: Path, export_path: Path) -> None:
+    tables = {}
+    for path, workers in ((export_path, 1), (export_zip, 2)):
+        exporter = XMLExporter(workers=workers)
+        exporter.xml_path = path
+        exporter.memory_budget = 0
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            tables[path] = [chunk.batch for chunk in exporter.iter_file_batches()]
+
+    assert "reading the zip with one worker" in output.getvalue()
+    assert source_size(export_zip) == export_path.stat().st_size
+    assert tables[export_zip] == tables[export_path]
@@ -0,0 +1,212 @@
+from datetime import UTC, datetime
+from pathlib import Path
+
+import pyarrow as pa
+import pytest
+
+from scripts.xml_exporter import MAX_CHUNK_ROWS, MIN_CHUNK_ROWS, ColumnBuffer, XMLExporter
+from tests.sample_export import RECORDS, TABLE_ROWS, WORKOUT_STATS, parse_apple_date
+
+
+def make_buffer(
+    table: str = "records",
+    chunk_size: int = 10,
+    chunk_budget: int = 0,
+) -> ColumnBuffer:
+    return ColumnBuffer(
+        table,
+        XMLExporter().table_schemas[table],
+        XMLExporter.COLUMN_SOURCES[table],
+        XMLExporter.DEFAULT_VALUES if table == "records" else {},
+        chunk_size,
+        chunk_budget,
+    )
+
+
+def parse_tables(
+    path: Path,
+    chunk_size: int = 1_000,
+    memory_budget: int = 0,
+) -> dict[str, list[pa.RecordBatch]]:
+    """
+    Batches of every table, without a memory budget every chunk has chunk_size rows
+    """
+    exporter = XMLExporter()
+    exporter.chunk_size = chunk_size
+    exporter.memory_budget = memory_budget
+    tables: dict[str, list[pa.RecordBatch]] = {}
+    for chunk in exporter.iter_batches(path):
+        tables.setdefault(chunk.table, []).append(chunk.batch)
+    return tables
+
+
+def test_convert_types_the_raw_strings() -> None:
+    buffer = make_buffer()
+    buffer.append(RECORDS[0])
+    buffer.append({"type": "HKQuantityTypeIdentifierHeartRate", "value": "high"})
+    batch = buffer.flush().batch
+
+    assert batch.schema == XMLExporter().table_schemas["records"]
+    row, bad = batch.to_pylist()
+    assert row["startDate"] == parse_apple_date(RECORDS[0]["startDate"])
+    assert row["value"] == float(RECORDS[0]["value"])
+    # the text of the value attribute is kept next to the number
+    assert row["textValue"] == RECORDS[0]["value"]
+    assert bad["value"] == 0.0
+    assert bad["startDate"] is None
+    # missing optional attributes get their defaults instead of nulls
+    assert (bad["unit"], bad["device"], bad["sourceVersion"]) == ("", "", "")
+    assert bad["sourceName"] is None
+
+
+def test_convert_casts_integer_columns() -> None:
+    buffer = make_buffer("workouts")
+    buffer.append({"workout_id": "7", "workoutActivityType": "HKWorkoutActivityTypeRunning"})
+    (row,) = buffer.flush().batch.to_pylist()
+
+    assert row["workout_id"] == 7
+    assert row["type"] == "HKWorkoutActivityTypeRunning"
+
+
+def test_flush_empties_the_buffer() -> None:
+    buffer = make_buffer()
+    for record in RECORDS[:3]:
+        buffer.append(record)
+    assert len(buffer) == 3
+
+    assert buffer.flush().batch.num_rows == 3
+    assert len(buffer) == 0
+    empty = buffer.flush()
+    assert empty.table == "records"
+    assert empty.batch.num_rows == 0
+
+
+def test_iter_batches_parses_every_element(export_path: Path) -> None:
+    tables = parse_tables(export_path, chunk_size=40)
+
+    assert {table: sum(b.num_rows for b in batches) for table, batches in tables.items()} == (
+        TABLE_ROWS
+    )
+    assert all(batch.num_rows <= 40 for batches in tables.values() for batch in batches)
+    records = pa.Table.from_batches(tables["records"])
+    assert records.column("type").to_pylist() == [record["type"] for record in RECORDS]
+    assert records.column("startDate").to_pylist() == [
+        parse_apple_date(record["startDate"]) for record in RECORDS
+    ]
+
+
+def test_iter_batches_skips_other_elements(tmp_path: Path) -> None:
+    path = tmp_path / "export.xml"
+    path.write_text(
+        '<HealthData><ExportDate value="2024-01-01 00:00:00 +0000"/>'
+        '<ActivitySummary dateComponents="2024-01-01"/></HealthData>',
+    )
+
+    assert all(batch.num_rows == 0 for batches in parse_tables(path).values() for batch in batches)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1_000])
+def test_chunking_does_not_change_the_rows(export_path: Path, chunk_size: int) -> None:
+    whole = parse_tables(export_path)
+    chunked = parse_tables(export_path, chunk_size)
+
+    for table, batches in whole.items():
+        assert pa.Table.from_batches(chunked[table]).equals(pa.Table.from_batches(batches))
+
+
+def test_dates_are_utc(export_path: Path) -> None:
+    records = pa.Table.from_batches(parse_tables(export_path)["records"])
+
+    assert records.schema.field("startDate").type == pa.timestamp("us", tz="UTC")
+    assert records.column("startDate")[0].as_py() == datetime(2023, 12, 20, 6, 0, tzinfo=UTC)
+
+
+def test_offset_workout_ids() -> None:
+    buffer = make_buffer("stats")
+    buffer.append({"workout_id": "1", "type": "HKQuantityTypeIdentifierHeartRate"})
+    buffer.append({"workout_id": "2", "type": "HKQuantityTypeIdentifierHeartRate"})
+    chunk = buffer.flush()
+
+    shifted = XMLExporter.offset_workout_ids(chunk, 40)
+    assert shifted.batch.column("workout_id").to_pylist() == [41, 42]
+    assert shifted.batch.schema == chunk.batch.schema
+    assert XMLExporter.offset_workout_ids(chunk, 0) is chunk
+    records = make_buffer().flush()
+    assert XMLExporter.offset_workout_ids(records, 40) is records
+
+
+def test_statistics_carry_the_id_of_their_workout(export_path: Path) -> None:
+    tables = {
+        table: pa.Table.from_batches(batches)
+        for table, batches in parse_tables(export_path).items()
+    }
+
+    assert tables["workouts"].column("workout_id").to_pylist() == list(
+        range(1, TABLE_ROWS["workouts"] + 1),
+    )
+    stats = zip(
+        tables["stats"].column("workout_id").to_pylist(),
+        tables["stats"].column("sum").to_pylist(),
+        strict=True,
+    )
+    assert sorted(stats) == sorted((row[0], row[3]) for row in WORKOUT_STATS)
+
+
+def filled_buffer(chunk_budget: int, rows: int = 2_000) -> ColumnBuffer:
+    buffer = make_buffer(chunk_size=rows, chunk_budget=chunk_budget)
+    for index in range(rows):
+        buffer.append(RECORDS[index % len(RECORDS)])
+    return buffer
+
+
+def test_flush_sizes_the_next_chunk_to_the_budget() -> None:
+    small = filled_buffer(chunk_budget=2 * 1024 * 1024)
+    small.flush()
+    large = filled_buffer(chunk_budget=8 * 1024 * 1024)
+    large.flush()
+
+    assert MIN_CHUNK_ROWS < small.chunk_size < large.chunk_size < MAX_CHUNK_ROWS
+    # the rows of a chunk take about a thousand bytes while it is flushed
+    assert 500 < 2 * 1024 * 1024 / small.chunk_size < 2_000
+
+
+@pytest.mark.parametrize(
+    ("chunk_budget", "chunk_size"),
+    [(1, MIN_CHUNK_ROWS), (1 << 50, MAX_CHUNK_ROWS), (0, 2_000)],
+)
+def test_chunk_size_bounds(chunk_budget: int, chunk_size: int) -> None:
+    buffer = filled_buffer(chunk_budget)
+    buffer.flush()
+
+    assert buffer.chunk_size == chunk_size
+
+
+def test_empty_flush_keeps_the_chunk_size() -> None:
+    buffer = make_buffer(chunk_size=10, chunk_budget=1)
+    buffer.flush()
+
+    assert buffer.chunk_size == 10
+
+
+def test_chunk_budget_is_shared_by_the_buffers_and_the_queue() -> None:
+    exporter = XMLExporter()
+    exporter.memory_budget = 60 * 1024 * 1024
+    exporter.queued_chunks = 3
+
+    assert exporter.chunk_budget == 10 * 1024 * 1024
+    assert {buffer.chunk_budget for buffer in exporter.make_buffers().values()} == {
+        10 * 1024 * 1024,
+    }
+
+
+def test_chunks_after_the_first_follow_the_budget(export_path: Path) -> None:
+    exporter = XMLExporter()
+    exporter.chunk_size = 100
+    exporter.memory_budget = 5 * MIN_CHUNK_ROWS
+    batches = list(exporter.iter_batches(export_path))
+
+    # every table flushed rows, the next document starts from the resized chunks
+    assert exporter.chunk_sizes == dict.fromkeys(TABLE_ROWS, MIN_CHUNK_ROWS)
+    records = [chunk.batch.num_rows for chunk in batches if chunk.table == "records"]
+    assert records == [100, TABLE_ROWS["records"] - 100]
+    assert "records" in exporter.memory_report()
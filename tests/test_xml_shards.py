@@ -0,0 +1,119 @@
+import contextlib
+import io
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import pyarrow as pa
+import pytest
+
+from scripts import xml_shards
+from scripts.xml_exporter import TableBatch, XMLExporter
+from scripts.xml_shards import Shard, open_shard, split_segments, split_shards
+from tests.sample_export import RECORDS, TABLE_ROWS, element, export_xml
+
+
+@pytest.fixture(autouse=True)
+def small_shards(monkeypatch: pytest.MonkeyPatch) -> None:
+    # the sample export is far below the real minimum, it would never be split
+    monkeypatch.setattr(xml_shards, "MIN_SHARD_SIZE", 1024)
+
+
+def read_tables(exporter: XMLExporter, chunks: Iterable[TableBatch]) -> dict[str, pa.Table]:
+    batches: dict[str, list[pa.RecordBatch]] = {}
+    for chunk in chunks:
+        batches.setdefault(chunk.table, []).append(chunk.batch)
+    schemas = exporter.table_schemas
+    return {
+        table: pa.Table.from_batches(batches.get(table, []), schemas[table]) for table in schemas
+    }
+
+
+def parse_shards(shards: list[Shard]) -> dict[str, pa.Table]:
+    exporter = XMLExporter()
+    exporter.memory_budget = 0
+
+    def chunks() -> Iterator[TableBatch]:
+        for shard in shards:
+            with open_shard(shard) as stream:
+                yield from exporter.iter_batches(stream)
+
+    return read_tables(exporter, chunks())
+
+
+def assert_contiguous(shards: list[Shard], path: Path) -> None:
+    assert shards[0].start == 0
+    assert shards[-1].end == path.stat().st_size
+    assert [shard.end for shard in shards[:-1]] == [shard.start for shard in shards[1:]]
+    assert [shard.last for shard in shards] == [False] * (len(shards) - 1) + [True]
+
+
+def test_shards_start_at_top_level_elements(export_path: Path) -> None:
+    shards = split_shards(export_path, 8)
+    content = export_path.read_bytes()
+
+    assert len(shards) == 8
+    assert_contiguous(shards, export_path)
+    for shard in shards[1:]:
+        assert content[shard.start :].startswith((b"<Record ", b"<Workout "))
+
+
+def test_shards_parse_like_the_whole_file(export_path: Path) -> None:
+    sharded = parse_shards(split_shards(export_path, 8))
+    whole = parse_shards(split_shards(export_path, 1))
+
+    assert {table: rows.num_rows for table, rows in whole.items()} == TABLE_ROWS
+    assert sharded["records"].equals(whole["records"])
+    # every shard numbers its workouts from 1, the exporter shifts them
+    assert (
+        sharded["stats"]
+        .drop_columns("workout_id")
+        .equals(
+            whole["stats"].drop_columns("workout_id"),
+        )
+    )
+
+
+def test_split_never_enters_a_correlation(tmp_path: Path) -> None:
+    # blood pressure correlations hold records that must stay in one shard with them
+    correlation = element(
+        "Correlation",
+        {"type": "HKCorrelationTypeIdentifierBloodPressure"},
+        "\n".join(element("Record", record) for record in RECORDS[:2]),
+    )
+    path = tmp_path / "export.xml"
+    path.write_text(
+        export_xml().replace("</HealthData>", "\n".join([correlation] * 200) + "\n</HealthData>"),
+        encoding="utf-8",
+    )
+    content = path.read_bytes()
+
+    segments = split_segments(path, 2048)
+    assert len(segments) > 40
+    for segment in segments[1:]:
+        before = content[: segment.start]
+        assert before.count(b"<Correlation") == before.count(b"</Correlation>")
+
+
+def test_segments_from_a_boundary_end_at_the_same_offsets(export_path: Path) -> None:
+    segments = split_segments(export_path, 4096)
+    resumed = split_segments(export_path, 4096, segments[3].start)
+
+    assert_contiguous(segments, export_path)
+    assert [(shard.start, shard.end) for shard in resumed] == [
+        (shard.start, shard.end) for shard in segments[3:]
+    ]
+    assert split_segments(export_path, 4096, export_path.stat().st_size) == []
+
+
+def test_workers_parse_like_one_process(export_path: Path) -> None:
+    tables = []
+    for workers in (1, 2):
+        exporter = XMLExporter(workers=workers)
+        exporter.memory_budget = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            tables.append(read_tables(exporter, exporter.iter_file_batches()))
+    single, parallel = tables
+
+    assert {table: rows.num_rows for table, rows in parallel.items()} == TABLE_ROWS
+    for table, rows in single.items():
+        assert parallel[table].equals(rows)